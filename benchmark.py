@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the shelf and bulk-update endpoints.
+
+Starts mock_basalam.py and the app (uvicorn main:app) as subprocesses, logs in
+through the mock OAuth flow, then for every shelf size measures:
+
+- GET /api/shelves                                  (request latency and rate)
+- POST /api/shelves/{id}/update-descriptions        (per-product latency and products/sec)
+- POST /api/shelves/{id}/update-images              (per-product latency and products/sec)
+
+The app is restarted for each size so the reported peak RSS belongs to that run.
+
+    python benchmark.py --sizes 100,1000,10000 --latency-ms 30 --throttle-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, or None for an empty sample"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """High-water resident set size of a process (Linux /proc, psutil elsewhere)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    # psutil only knows the current RSS, which is the best we can do off Linux
+    return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+
+async def wait_until_up(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+def start_mock(args) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.join(ROOT, "mock_basalam.py"),
+        "--port", str(args.mock_port),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter-ms", str(args.jitter_ms),
+        "--error-rate", str(args.error_rate),
+        "--throttle-rate", str(args.throttle_rate),
+        "--retry-after", str(args.retry_after),
+        "--shelf-sizes", args.sizes,
+    ]
+    return subprocess.Popen(command, cwd=ROOT)
+
+def start_app(args) -> subprocess.Popen:
+    mock = f"http://127.0.0.1:{args.mock_port}"
+    # A fresh job journal per run: jobs left over from an earlier run must not be resumed against the mock
+    scratch = tempfile.mkdtemp(prefix="basalam-bench-")
+    env = {
+        **os.environ,
+        "BASALAM_CLIENT_ID": "benchmark",
+        "BASALAM_CLIENT_SECRET": "benchmark",
+        "BASALAM_REDIRECT_URI": f"http://127.0.0.1:{args.app_port}/auth/callback",
+        "BASALAM_AUTH_URL": f"{mock}/accounts/sso",
+        "BASALAM_TOKEN_URL": f"{mock}/oauth/token",
+        "BASALAM_API_BASE": mock,
+        "BASALAM_UPLOAD_URL": f"{mock}/v3/files",
+        "SESSION_BACKEND": "memory",
+        "JOB_JOURNAL_PATH": os.path.join(scratch, "jobs.sqlite3"),
+        "JOB_JOURNAL_IMAGE_DIR": os.path.join(scratch, "job-images"),
+    }
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.app_port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    process.scratch_dir = scratch
+    return process
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    if getattr(process, "scratch_dir", None):
+        shutil.rmtree(process.scratch_dir, ignore_errors=True)
+
+async def login(client: httpx.AsyncClient):
+    """Walk the stubbed OAuth flow: app -> mock SSO -> app callback -> dashboard"""
+    response = await client.get("/auth/login", follow_redirects=True)
+    if response.status_code != 200 or not (await client.get("/api/auth/status")).json().get("authenticated"):
+        raise RuntimeError(f"Login through the mock OAuth flow failed: {response.status_code}")
+
+async def bench_shelves(client: httpx.AsyncClient, requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.get("/api/shelves")
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - started
+    return {"count": requests, "wall_seconds": wall, "per_second": requests / wall,
+            "latencies_ms": [latency * 1000 for latency in latencies], "errors": errors}
+
+async def follow_job(client: httpx.AsyncClient, job_id: str) -> Dict[str, Any]:
+    """Collect per-product latencies from the job's event stream until it is done"""
+    latencies: List[float] = []
+    final = None
+    async with client.stream("GET", f"/api/jobs/{job_id}/events", timeout=None) as stream:
+        event = None
+        async for line in stream.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                data = json.loads(line[6:])
+                if event == "product" and data.get("status") != "skipped":
+                    latencies.append(data["latency_ms"])
+                elif event == "done":
+                    final = data
+                    break
+    return {"latencies_ms": latencies, "snapshot": final}
+
+async def bench_job(client: httpx.AsyncClient, path: str, **request) -> Dict[str, Any]:
+    started = time.perf_counter()
+    response = await client.post(path, **request)
+    response.raise_for_status()
+    job = await follow_job(client, response.json()["job_id"])
+    wall = time.perf_counter() - started
+    snapshot = job["snapshot"] or {}
+    processed = snapshot.get("processed", 0)
+    return {"count": processed, "wall_seconds": wall, "per_second": processed / wall if wall else 0,
+            "latencies_ms": job["latencies_ms"], "errors": snapshot.get("failed", 0), "status": snapshot.get("status")}
+
+async def run_size(args, shelf_id: int, size: int) -> List[Dict[str, Any]]:
+    app = start_app(args)
+    try:
+        base_url = f"http://127.0.0.1:{args.app_port}"
+        await wait_until_up(f"{base_url}/api/health")
+        limits = httpx.Limits(max_connections=args.concurrency + 5)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            await login(client)
+            measurements = [("GET /api/shelves", await bench_shelves(client, args.shelves_requests, args.concurrency))]
+            measurements.append((
+                "update-descriptions",
+                await bench_job(client, f"/api/shelves/{shelf_id}/update-descriptions",
+                                data={"description": f"Benchmark run {time.time():.0f}"})
+            ))
+            image = os.urandom(args.image_kb * 1024)
+            measurements.append((
+                "update-images",
+                await bench_job(client, f"/api/shelves/{shelf_id}/update-images",
+                                files={"image": ("benchmark.jpg", image, "image/jpeg")})
+            ))
+        rss = peak_rss_mb(app.pid)
+    finally:
+        stop(app)
+
+    rows = []
+    for name, result in measurements:
+        rows.append({
+            "scenario": name,
+            "shelf_size": size,
+            "count": result["count"],
+            "wall_seconds": round(result["wall_seconds"], 3),
+            "per_second": round(result["per_second"], 1),
+            "p50_ms": percentile(result["latencies_ms"], 50),
+            "p99_ms": percentile(result["latencies_ms"], 99),
+            "errors": result["errors"],
+            "peak_rss_mb": round(rss, 1) if rss is not None else None,
+        })
+    return rows
+
+def print_table(rows: List[Dict[str, Any]]):
+    header = f"{'scenario':<22}{'shelf':>7}{'count':>8}{'wall s':>9}{'per s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}{'RSS MB':>9}"
+    print("\n" + header)
+    print("-" * len(header))
+    for row in rows:
+        p50 = f"{row['p50_ms']:.1f}" if row["p50_ms"] is not None else "-"
+        p99 = f"{row['p99_ms']:.1f}" if row["p99_ms"] is not None else "-"
+        rss = f"{row['peak_rss_mb']:.1f}" if row["peak_rss_mb"] is not None else "n/a"
+        print(f"{row['scenario']:<22}{row['shelf_size']:>7}{row['count']:>8}{row['wall_seconds']:>9.2f}"
+              f"{row['per_second']:>9.1f}{p50:>9}{p99:>9}{row['errors']:>8}{rss:>9}")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bulk-update endpoints against mock_basalam.py")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated shelf sizes to benchmark")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Mock upstream latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock calls answered with 5xx")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of mock calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--shelves-requests", type=int, default=200, help="GET /api/shelves requests per size")
+    parser.add_argument("--concurrency", type=int, default=20, help="Parallel GET /api/shelves requests")
+    parser.add_argument("--image-kb", type=int, default=256, help="Size of the generated upload image")
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    print("🏁 BENCHMARKING BULK UPDATES AGAINST THE MOCK BASALAM API")
+    print("=" * 60)
+    mock = start_mock(args)
+    rows: List[Dict[str, Any]] = []
+    try:
+        await wait_until_up(f"http://127.0.0.1:{args.mock_port}/_mock/stats")
+        sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+        for shelf_id, size in enumerate(sizes, start=1):
+            print(f"📦 Shelf {shelf_id}: {size} products")
+            rows.extend(await run_size(args, shelf_id, size))
+    finally:
+        stop(mock)
+
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump({"settings": vars(args), "results": rows}, output, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Concurrent load generator for the dashboard and bulk-update APIs.
+
+Every simulated seller logs in through the stubbed OAuth flow of
+mock_basalam.py, loads the dashboard (/api/user/me, /api/shelves and the
+products of each shelf) in a loop with think time, while bulk description and
+image updates are submitted across all sessions at a target rate. The test
+runs in stages of increasing session counts, reports latency percentiles and
+error rates per endpoint, and names the stage where each endpoint saturated.
+
+Against an app that is already running with the BASALAM_* URLs pointing at
+the mock:
+
+    python loadtest.py --base-url http://127.0.0.1:8000 --sessions 10,50,100 --bulk-rate 2
+
+Or let the script start the mock and the app itself:
+
+    python loadtest.py --spawn --sessions 10,50,100 --stage-seconds 30
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmark import percentile, start_app, start_mock, stop, wait_until_up
+
+# Closed-loop endpoints: their request rate should grow with the number of sessions
+DASHBOARD_ENDPOINTS = ("GET /api/dashboard",)
+
+class Recorder:
+    """Latency and outcome of every request in one stage, grouped by endpoint"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[Tuple[float, bool]]] = {}
+
+    def add(self, endpoint: str, latency: float, ok: bool):
+        self.samples.setdefault(endpoint, []).append((latency, ok))
+
+    async def timed(self, endpoint: str, request) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError:
+            self.add(endpoint, time.perf_counter() - started, False)
+            return None
+        self.add(endpoint, time.perf_counter() - started, response.status_code < 400)
+        return response
+
+    def summary(self, duration: float) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = [latency * 1000 for latency, _ in samples]
+            errors = sum(1 for _, ok in samples if not ok)
+            result[endpoint] = {
+                "count": len(samples),
+                "ok_per_second": (len(samples) - errors) / duration if duration else 0,
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "error_rate": errors / len(samples) if samples else 0,
+            }
+        return result
+
+class Session:
+    """One simulated seller with its own cookie jar"""
+
+    def __init__(self, base_url: str, recorder: Recorder):
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=60)
+        self.recorder = recorder
+        self.shelf_ids: List[Any] = []
+
+    async def login(self) -> bool:
+        response = await self.recorder.timed("oauth login", self.client.get("/auth/login", follow_redirects=True))
+        return response is not None and response.status_code == 200
+
+    async def load_dashboard(self):
+        # One call, as static/app.js makes it: user, shelves and every shelf's preview
+        response = await self.recorder.timed("GET /api/dashboard", self.client.get("/api/dashboard"))
+        if response is None or response.status_code != 200:
+            return
+        shelves = response.json().get("shelves", [])
+        self.shelf_ids = [shelf["id"] for shelf in shelves if isinstance(shelf, dict) and "id" in shelf]
+
+    async def run_bulk_update(self, kind: str, image: bytes, poll_interval: float):
+        if not self.shelf_ids:
+            return
+        shelf_id = random.choice(self.shelf_ids)
+        if kind == "images":
+            request = self.client.post(f"/api/shelves/{shelf_id}/update-images",
+                                       files={"image": ("load.jpg", image, "image/jpeg")})
+        else:
+            request = self.client.post(f"/api/shelves/{shelf_id}/update-descriptions",
+                                       data={"description": f"Load test {random.random():.6f}"})
+        started = time.perf_counter()
+        response = await self.recorder.timed(f"POST update-{kind}", request)
+        if response is None or response.status_code != 202:
+            return
+
+        # Time until the job finishes, as a pseudo-endpoint
+        job_id = response.json()["job_id"]
+        while True:
+            await asyncio.sleep(poll_interval)
+            status = await self.recorder.timed("GET /api/jobs/{id}", self.client.get(f"/api/jobs/{job_id}"))
+            if status is None or status.status_code != 200:
+                self.recorder.add(f"job {kind} completion", time.perf_counter() - started, False)
+                return
+            snapshot = status.json()
+            if snapshot["status"] in ("completed", "failed", "cancelled"):
+                ok = snapshot["status"] == "completed" and not snapshot.get("failed")
+                self.recorder.add(f"job {kind} completion", time.perf_counter() - started, ok)
+                return
+
+    async def aclose(self):
+        await self.client.aclose()
+
+async def run_stage(args, sessions_count: int) -> Tuple[Dict[str, Dict[str, Any]], float]:
+    recorder = Recorder()
+    sessions = [Session(args.base_url, recorder) for _ in range(sessions_count)]
+    image = os.urandom(args.image_kb * 1024)
+    tasks: List[asyncio.Task] = []
+    try:
+        logged_in = await asyncio.gather(*(session.login() for session in sessions))
+        active = [session for session, ok in zip(sessions, logged_in) if ok]
+        if not active:
+            raise RuntimeError("No session could log in - is the app pointed at mock_basalam.py?")
+
+        deadline = time.monotonic() + args.stage_seconds
+        started = time.perf_counter()
+
+        async def browse(session: Session):
+            while time.monotonic() < deadline:
+                await session.load_dashboard()
+                await asyncio.sleep(random.expovariate(1 / args.think_seconds) if args.think_seconds > 0 else 0)
+
+        async def submit_bulk_updates():
+            # Open-loop Poisson arrivals, so a slow server does not lower the offered rate
+            while args.bulk_rate > 0:
+                await asyncio.sleep(random.expovariate(args.bulk_rate))
+                if time.monotonic() >= deadline:
+                    return
+                kind = "images" if random.random() < args.image_ratio else "descriptions"
+                tasks.append(asyncio.create_task(
+                    random.choice(active).run_bulk_update(kind, image, args.poll_interval)
+                ))
+
+        await asyncio.gather(submit_bulk_updates(), *(browse(session) for session in active))
+        duration = time.perf_counter() - started
+        # Let submitted jobs finish so their completion times are counted
+        if tasks:
+            await asyncio.wait(tasks, timeout=args.drain_seconds)
+        return recorder.summary(duration), duration
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*(session.aclose() for session in sessions))
+
+def find_saturation(stages: List[Tuple[int, Dict[str, Dict[str, Any]]]], args) -> Dict[str, str]:
+    """First stage where an endpoint breaks its SLO, errors, or (dashboard calls) stops gaining throughput.
+
+    Bulk submissions arrive at a fixed rate whatever the session count, so only
+    latency and errors can show their saturation.
+    """
+    verdicts: Dict[str, str] = {}
+    endpoints = sorted({endpoint for _, summary in stages for endpoint in summary if endpoint != "oauth login"})
+    for endpoint in endpoints:
+        slo_ms = args.job_slo_seconds * 1000 if endpoint.startswith("job ") else args.slo_ms
+        previous = None
+        for sessions_count, summary in stages:
+            stats = summary.get(endpoint)
+            if stats is None:
+                continue
+            reason = None
+            if stats["error_rate"] > args.max_error_rate:
+                reason = f"error rate {stats['error_rate']:.1%}"
+            elif stats["p99_ms"] is not None and stats["p99_ms"] > slo_ms:
+                reason = f"p99 {stats['p99_ms']:.0f}ms > {slo_ms:g}ms"
+            elif (endpoint in DASHBOARD_ENDPOINTS and previous is not None
+                  and stats["ok_per_second"] < previous * (1 + args.min_gain)):
+                reason = f"throughput flat ({previous:.1f} -> {stats['ok_per_second']:.1f}/s)"
+            if reason and endpoint not in verdicts:
+                verdicts[endpoint] = f"saturated at {sessions_count} sessions: {reason}"
+            previous = stats["ok_per_second"]
+        verdicts.setdefault(endpoint, "not saturated")
+    return verdicts
+
+def print_stage(sessions_count: int, duration: float, summary: Dict[str, Dict[str, Any]]):
+    print(f"\n👥 {sessions_count} sessions ({duration:.1f}s)")
+    header = f"{'endpoint':<34}{'count':>8}{'ok/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>10}{'errors':>9}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, stats in summary.items():
+        cells = [f"{stats[key]:.1f}" if stats[key] is not None else "-" for key in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"{endpoint:<34}{stats['count']:>8}{stats['ok_per_second']:>9.1f}"
+              f"{cells[0]:>9}{cells[1]:>9}{cells[2]:>10}{stats['error_rate']:>9.1%}")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load-test the dashboard and bulk-update APIs")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="App to test (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="Start mock_basalam.py and the app on free local ports")
+    parser.add_argument("--sessions", default="10,50,100", help="Comma-separated concurrent session counts, one stage each")
+    parser.add_argument("--stage-seconds", type=float, default=30)
+    parser.add_argument("--think-seconds", type=float, default=2, help="Mean pause between dashboard loads per session")
+    parser.add_argument("--bulk-rate", type=float, default=1, help="Bulk updates submitted per second across all sessions")
+    parser.add_argument("--image-ratio", type=float, default=0.3, help="Fraction of bulk updates that are image updates")
+    parser.add_argument("--image-kb", type=int, default=128)
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between job status polls")
+    parser.add_argument("--drain-seconds", type=float, default=60, help="How long to wait for running jobs after a stage")
+    parser.add_argument("--slo-ms", type=float, default=1000, help="p99 latency above which an endpoint counts as saturated")
+    parser.add_argument("--job-slo-seconds", type=float, default=60, help="p99 bulk job completion time SLO")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--min-gain", type=float, default=0.1, help="Throughput gain below which a stage counts as flat")
+    # Used with --spawn
+    parser.add_argument("--app-port", type=int, default=8200)
+    parser.add_argument("--mock-port", type=int, default=9200)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1)
+    parser.add_argument("--sizes", default="20,50,200", help="Mock shelf sizes with --spawn")
+    args = parser.parse_args()
+
+    print("🚦 LOAD TESTING DASHBOARD AND BULK UPDATE APIS")
+    print("=" * 50)
+    processes = []
+    try:
+        if args.spawn:
+            processes.append(start_mock(args))
+            await wait_until_up(f"http://127.0.0.1:{args.mock_port}/_mock/stats")
+            processes.append(start_app(args))
+            args.base_url = f"http://127.0.0.1:{args.app_port}"
+        await wait_until_up(f"{args.base_url}/api/health")
+
+        stages = []
+        for sessions_count in [int(count) for count in args.sessions.split(",") if count.strip()]:
+            summary, duration = await run_stage(args, sessions_count)
+            print_stage(sessions_count, duration, summary)
+            stages.append((sessions_count, summary))
+    finally:
+        for process in reversed(processes):
+            stop(process)
+
+    print("\n📈 SATURATION")
+    for endpoint, verdict in find_saturation(stages, args).items():
+        print(f"  {endpoint:<34}{verdict}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,10 @@
-from fastapi import FastAPI, Request, HTTPException, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, Request, HTTPException, Form, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from jinja2 import TemplateSyntaxError, meta
+from jinja2.compiler import CodeGenerator
+from jinja2.sandbox import SandboxedEnvironment, SecurityError
 import httpx
 import os
 from dotenv import load_dotenv
@@ -11,6 +14,25 @@ from typing import Optional, List, Dict, Any
 import uvicorn
 from datetime import datetime
 import base64
+import contextvars
+import gzip
+import mimetypes
+import hashlib
+import secrets
+import shutil
+import sqlite3
+import tempfile
+import asyncio
+import time
+import uuid
+import random
+import re
+import sys
+import email.utils
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import timezone
 
 # Load environment variables
 load_dotenv()
@@ -20,28 +42,138 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="بروزرسان قفسه‌های بسلام")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown"""
+    get_http_client()
+    start_bulk_job_workers()
+    start_session_purger()
+    start_job_journal()
+    yield
+    await stop_job_journal()
+    await stop_session_purger()
+    await stop_bulk_job_workers()
+    image_optimizer.shutdown()
+    await close_http_client()
+
+app = FastAPI(title="بروزرسان قفسه‌های بسلام", lifespan=lifespan)
 
 # Mount static files with cache headers
 from starlette.staticfiles import StaticFiles
 from starlette.responses import Response
+from starlette.datastructures import Headers
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+STATIC_CACHE_MAX_AGE = int(os.getenv("STATIC_CACHE_MAX_AGE", "3600"))  # seconds, for URLs without ?v=<hash>
+STATIC_COMPRESS_MIN_BYTES = 256
+STATIC_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
 
 class CachedStaticFiles(StaticFiles):
+    """Static files with content-hash ETags, precompressed variants and 304 handling.
+
+    Each file is read, hashed and compressed (gzip, plus brotli when installed)
+    once, and again only when its size or mtime changes. URLs built with
+    static_url() carry ?v=<hash> and are cached as immutable.
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._assets: Dict[str, Dict[str, Any]] = {}
+
+    def asset(self, path: str) -> Optional[Dict[str, Any]]:
+        full_path, stat_result = self.lookup_path(path)
+        if stat_result is None or not os.path.isfile(full_path):
+            return None
+        entry = self._assets.get(path)
+        if entry is not None and entry["signature"] == (stat_result.st_size, stat_result.st_mtime_ns):
+            return entry
+
+        with open(full_path, "rb") as asset_file:
+            content = asset_file.read()
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        variants = {"identity": content}
+        if media_type.startswith(STATIC_COMPRESSIBLE_TYPES) and len(content) >= STATIC_COMPRESS_MIN_BYTES:
+            variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants["br"] = brotli.compress(content)
+            for encoding in [name for name, data in variants.items() if len(data) >= len(content) and name != "identity"]:
+                del variants[encoding]
+
+        entry = {
+            "signature": (stat_result.st_size, stat_result.st_mtime_ns),
+            "version": hashlib.sha256(content).hexdigest()[:16],
+            "media_type": media_type,
+            "variants": variants
+        }
+        self._assets[path] = entry
+        return entry
 
     async def get_response(self, path: str, scope):
-        response = await super().get_response(path, scope)
-        if response.status_code == 200:
-            # Add cache headers for static files
-            response.headers["Cache-Control"] = "public, max-age=86400"  # 24 hours
-            response.headers["ETag"] = f'"{hash(path)}"'
-        return response
+        entry = self.asset(path) if scope["method"] in ("GET", "HEAD") else None
+        if entry is None:
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        encoding = _pick_encoding(request_headers.get("accept-encoding", ""), entry["variants"])
+        version = entry["version"]
+        etag = f'"{version}"' if encoding == "identity" else f'"{version}-{encoding}"'
+        fingerprinted = urllib.parse.parse_qs(scope.get("query_string", b"").decode()).get("v") == [version]
+        headers = {
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": "public, max-age=31536000, immutable" if fingerprinted
+            else f"public, max-age={STATIC_CACHE_MAX_AGE}, must-revalidate"
+        }
 
-app.mount("/static", CachedStaticFiles(directory="static"), name="static")
+        # Any representation of the same content satisfies the client's cached copy
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match:
+            tags = {re.sub(r'^(W/)?"?|(-gzip|-br)?"?$', "", tag.strip()) for tag in if_none_match.split(",")}
+            if "*" in tags or version in tags:
+                return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        body = entry["variants"][encoding]
+        if scope["method"] == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(body, media_type=entry["media_type"], headers=headers)
+
+def _pick_encoding(accept_encoding: str, variants: Dict[str, bytes]) -> str:
+    """Best available content coding for an Accept-Encoding header, preferring br over gzip"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    for encoding in ("br", "gzip"):
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in variants and quality > 0:
+            return encoding
+    return "identity"
+
+static_files = CachedStaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
+
+def static_url(path: str) -> str:
+    """URL of a static asset, fingerprinted with its content hash for immutable caching"""
+    entry = static_files.asset(path)
+    return f"/static/{path}?v={entry['version']}" if entry else f"/static/{path}"
 
 # Templates
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_url
 
 # Basalam API configuration
 BASALAM_CLIENT_ID = os.getenv("BASALAM_CLIENT_ID")
@@ -60,14 +192,2704 @@ if not BASALAM_CLIENT_ID:
 if not BASALAM_CLIENT_SECRET:
     raise ValueError("BASALAM_CLIENT_SECRET environment variable is required")
 
-# Correct Basalam OAuth endpoints
-BASALAM_AUTH_URL = "https://basalam.com/accounts/sso"
-BASALAM_TOKEN_URL = "https://auth.basalam.com/oauth/token"
-BASALAM_API_BASE = "https://core.basalam.com"
+# Correct Basalam OAuth endpoints (overridable to point at mock_basalam.py for offline runs)
+BASALAM_AUTH_URL = os.getenv("BASALAM_AUTH_URL", "https://basalam.com/accounts/sso")
+BASALAM_TOKEN_URL = os.getenv("BASALAM_TOKEN_URL", "https://auth.basalam.com/oauth/token")
+BASALAM_API_BASE = os.getenv("BASALAM_API_BASE", "https://core.basalam.com").rstrip("/")
+
+# Basalam file service used to upload a bulk image once for many products
+BASALAM_UPLOAD_URL = os.getenv("BASALAM_UPLOAD_URL", "https://uploadio.basalam.com/v3/files")
+BASALAM_UPLOAD_FILE_TYPE = os.getenv("BASALAM_UPLOAD_FILE_TYPE", "product.photo")
+
+# Shared upstream HTTP client settings (one connection pool per worker process)
+HTTP_MAX_CONNECTIONS = int(os.getenv("BASALAM_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("BASALAM_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("BASALAM_HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("BASALAM_HTTP_CONNECT_TIMEOUT", "5"))
+# "auto" enables HTTP/2 only when the optional h2 package is installed
+HTTP2_MODE = os.getenv("BASALAM_HTTP2", "auto").lower()
+
+# Per-route read/write timeouts in seconds, overridable with BASALAM_TIMEOUT_<ROUTE>
+UPSTREAM_TIMEOUTS = {
+    route: httpx.Timeout(float(os.getenv(f"BASALAM_TIMEOUT_{route.upper()}", default)), connect=HTTP_CONNECT_TIMEOUT)
+    for route, default in {
+        "token": "30",
+        "profile": "10",
+        "shelves": "15",
+        "products": "20",
+        "update": "30",
+        "upload": "120",
+    }.items()
+}
+
+# Upstream retry and circuit breaker settings (the BULK_* names are still accepted)
+UPSTREAM_MAX_RETRIES = int(os.getenv("BASALAM_MAX_RETRIES", os.getenv("BULK_MAX_RETRIES", "3")))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("BASALAM_BACKOFF_BASE", os.getenv("BULK_BACKOFF_BASE", "0.5")))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("BASALAM_BACKOFF_MAX", os.getenv("BULK_BACKOFF_MAX", "30")))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BASALAM_BREAKER_THRESHOLD", "5"))  # consecutive failures that open it
+BREAKER_COOLDOWN = float(os.getenv("BASALAM_BREAKER_COOLDOWN", "30"))  # seconds before a probe request is let through
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_METHODS = {"GET", "PATCH"}  # idempotent for Basalam: the same body sets the same value
+UPSTREAM_COALESCE_GETS = os.getenv("BASALAM_COALESCE_GETS", "true").lower() in ("1", "true", "yes", "on")
+UPSTREAM_LATENCY_WINDOW = int(os.getenv("UPSTREAM_LATENCY_WINDOW", "200"))  # recent answers per route kept for dry-run projections
+
+# Bulk update dispatcher settings
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "8"))
+BULK_BREAKER_MAX_WAIT = float(os.getenv("BULK_BREAKER_MAX_WAIT", "300"))  # seconds one product waits for an open breaker
+
+# Background bulk job settings
+BULK_JOB_WORKERS = int(os.getenv("BULK_JOB_WORKERS", "2"))
+BULK_JOB_RETENTION = int(os.getenv("BULK_JOB_RETENTION", "3600"))  # seconds finished jobs stay visible
+BULK_JOB_MAX_HISTORY = int(os.getenv("BULK_JOB_MAX_HISTORY", "200"))
+JOB_EVENT_SUMMARY_INTERVAL = float(os.getenv("JOB_EVENT_SUMMARY_INTERVAL", "2"))  # seconds between SSE summaries
+JOB_EVENT_QUEUE_SIZE = 1000  # buffered events per SSE subscriber
+JOB_EVENT_ERROR_LENGTH = 300  # characters of upstream error kept per product event and failure summary
+
+# Crash-safe bulk jobs: jobs and per-product outcomes are journaled to SQLite, and unfinished
+# jobs are resumed after a restart. The journal is opt-in: it stays off unless JOB_JOURNAL_PATH is set,
+# so read-only deploys (Vercel) never try to create a database file at import time.
+JOB_JOURNAL_PATH = os.getenv("JOB_JOURNAL_PATH", "")
+JOB_JOURNAL_IMAGE_DIR = os.getenv("JOB_JOURNAL_IMAGE_DIR", "job-images")  # uploads kept until their job finishes
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_CLAIM_TIMEOUT = float(os.getenv("JOB_CLAIM_TIMEOUT", "60"))  # seconds without a heartbeat before a job is taken over
+
+# Ways of attaching an image to a product, in the order they are tried:
+# a previously uploaded file ID, then the legacy inline payloads
+IMAGE_PAYLOAD_FORMATS = ["file_id", "image_json", "photo_object", "multipart"]
+# Answers that reject the payload format itself; anything else (404, 403...) is about the product
+IMAGE_FORMAT_REJECTED_STATUS_CODES = {400, 415, 422}
+
+# Uploaded images are copied to a job-owned temp file and streamed from there in chunks
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+IMAGE_STREAM_CHUNK_SIZE = 3 * 16384  # a multiple of 3, so each chunk base64-encodes without padding
+IMAGE_SPOOL_DIR = os.getenv("IMAGE_SPOOL_DIR") or None  # None uses the system temp directory
+
+# Optional resize/re-encode of bulk images before upload (needs Pillow, in requirements.txt)
+IMAGE_OPTIMIZE = os.getenv("IMAGE_OPTIMIZE", "auto").lower()  # auto = on when Pillow is installed
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg").lower()  # jpeg or webp
+IMAGE_OPTIMIZE_WORKERS = int(os.getenv("IMAGE_OPTIMIZE_WORKERS", "2"))
+IMAGE_OPTIMIZE_CACHE_ENTRIES = int(os.getenv("IMAGE_OPTIMIZE_CACHE_ENTRIES", "32"))
+
+# Product fields returned by GET /api/shelves/{id}/products without fields=; "*" returns whole upstream objects
+PRODUCT_DEFAULT_FIELDS = os.getenv("PRODUCT_DEFAULT_FIELDS", "id,title,name,price,photo.medium")
+
+# Dashboard aggregation: parallel shelf product fetches and products previewed per shelf
+DASHBOARD_MAX_CONCURRENCY = int(os.getenv("DASHBOARD_MAX_CONCURRENCY", "6"))
+DASHBOARD_PREVIEW_PRODUCTS = int(os.getenv("DASHBOARD_PREVIEW_PRODUCTS", "6"))
+
+# Templated descriptions: products rendered by the preview endpoint, by default and at most
+DESCRIPTION_PREVIEW_PRODUCTS = int(os.getenv("DESCRIPTION_PREVIEW_PRODUCTS", "5"))
+DESCRIPTION_PREVIEW_MAX_PRODUCTS = int(os.getenv("DESCRIPTION_PREVIEW_MAX_PRODUCTS", "50"))
+# Limits for seller-written templates: source size, size of any value and of the result, and render time
+DESCRIPTION_TEMPLATE_MAX_LENGTH = int(os.getenv("DESCRIPTION_TEMPLATE_MAX_LENGTH", "10000"))
+DESCRIPTION_MAX_LENGTH = int(os.getenv("DESCRIPTION_MAX_LENGTH", "10000"))
+DESCRIPTION_RENDER_TIMEOUT = float(os.getenv("DESCRIPTION_RENDER_TIMEOUT", "1"))  # seconds per product
+DESCRIPTION_RENDER_WORKERS = int(os.getenv("DESCRIPTION_RENDER_WORKERS", "2"))
+
+# Multi-shelf bulk updates: shelves whose products are read at the same time
+MULTI_SHELF_MAX_CONCURRENCY = int(os.getenv("MULTI_SHELF_MAX_CONCURRENCY", "4"))
+
+# Shelf product cache: freshness window and number of shelves kept per worker
+SHELF_CACHE_TTL = float(os.getenv("SHELF_CACHE_TTL", "60"))
+SHELF_CACHE_MAX_ENTRIES = int(os.getenv("SHELF_CACHE_MAX_ENTRIES", "256"))
+
+# Shelf product pagination: upstream query parameters, page size and pages read ahead
+SHELF_PAGE_PARAM = os.getenv("SHELF_PAGE_PARAM", "page")
+SHELF_PAGE_SIZE_PARAM = os.getenv("SHELF_PAGE_SIZE_PARAM", "per_page")
+SHELF_PAGE_SIZE = int(os.getenv("SHELF_PAGE_SIZE", "100"))
+SHELF_PREFETCH_PAGES = int(os.getenv("SHELF_PREFETCH_PAGES", "2"))
+SHELF_CACHE_MAX_PRODUCTS = int(os.getenv("SHELF_CACHE_MAX_PRODUCTS", "5000"))  # larger shelves are streamed, never cached
+
+# Products whose image we changed, remembered so identical re-uploads can be skipped
+# Kept in the job journal file when it is enabled, so every worker sees it and it survives restarts
+IMAGE_HISTORY_MAX_ENTRIES = int(os.getenv("IMAGE_HISTORY_MAX_ENTRIES", "100000"))
+IMAGE_HISTORY_TTL = int(os.getenv("IMAGE_HISTORY_TTL", str(30 * 24 * 3600)))
+
+# Histogram bucket bounds (seconds) for /metrics latency histograms
+METRICS_LATENCY_BUCKETS = tuple(
+    float(bound) for bound in os.getenv("METRICS_LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(",")
+)
+
+# Session storage: "memory" for a single worker, "sqlite" to share sessions between worker processes
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.sqlite3")
+SESSION_COOKIE_NAME = os.getenv("SESSION_COOKIE_NAME", "basalam_session")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+OAUTH_STATE_TTL = int(os.getenv("OAUTH_STATE_TTL", "600"))
+OAUTH_STATE_MAX_ENTRIES = int(os.getenv("OAUTH_STATE_MAX_ENTRIES", "10000"))
+SESSION_PURGE_INTERVAL = float(os.getenv("SESSION_PURGE_INTERVAL", "60"))  # seconds between expired-record sweeps
+JOB_SNAPSHOT_INTERVAL = float(os.getenv("JOB_SNAPSHOT_INTERVAL", "1"))  # seconds between shared job progress writes
+
+# Cached /v3/users/me profiles, keyed by access token
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "1000"))
+
+
+# Image payload format Basalam last accepted, tried first by later bulk runs
+image_format_memory = {"accepted": None}
+
+# Background bulk jobs by ID, and the worker pool that runs them
+bulk_jobs: Dict[str, "BulkJob"] = {}
+bulk_job_queue: Optional[asyncio.Queue] = None
+bulk_job_workers: List[asyncio.Task] = []
+
+# Shared upstream HTTP client, created lazily so serverless entry points
+# that skip the lifespan handler still get a pooled client
+http_client: Optional[httpx.AsyncClient] = None
+http_transport: Optional[httpx.AsyncHTTPTransport] = None
+http_client_stats = {"requests_sent": 0, "responses_received": 0, "clients_created": 0}
+
+def _http2_enabled() -> bool:
+    """Decide whether the shared client should negotiate HTTP/2"""
+    if HTTP2_MODE in ("0", "false", "no", "off"):
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        if HTTP2_MODE != "auto":
+            logger.warning("BASALAM_HTTP2 is enabled but the h2 package is not installed - falling back to HTTP/1.1")
+        return False
+    return True
+
+async def _on_upstream_request(request: httpx.Request):
+    http_client_stats["requests_sent"] += 1
+
+async def _on_upstream_response(response: httpx.Response):
+    http_client_stats["responses_received"] += 1
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the worker-wide pooled client for Basalam API calls"""
+    global http_client, http_transport
+    if http_client is None or http_client.is_closed:
+        http2 = _http2_enabled()
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        http_transport = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+        http_client = httpx.AsyncClient(
+            transport=http_transport,
+            timeout=httpx.Timeout(30.0, connect=HTTP_CONNECT_TIMEOUT),
+            event_hooks={"request": [_on_upstream_request], "response": [_on_upstream_response]},
+        )
+        http_client_stats["clients_created"] += 1
+        logger.info(f"🔌 Created shared Basalam HTTP client (HTTP/2: {http2}, max connections: {HTTP_MAX_CONNECTIONS})")
+    return http_client
+
+async def close_http_client():
+    """Close the shared client and its pooled connections"""
+    global http_client, http_transport
+    if http_client is not None and not http_client.is_closed:
+        await http_client.aclose()
+        logger.info("🔌 Closed shared Basalam HTTP client")
+    http_client = None
+    http_transport = None
+
+def get_http_pool_stats() -> Dict[str, Any]:
+    """Summarize the shared connection pool for the health endpoint"""
+    # httpcore does not expose pool counters publicly, so read them defensively
+    pool = getattr(http_transport, "_pool", None)
+    connections = list(getattr(pool, "connections", None) or [])
+    return {
+        "active": http_client is not None and not http_client.is_closed,
+        "http2": bool(getattr(pool, "_http2", False)),
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry": HTTP_KEEPALIVE_EXPIRY,
+        "open_connections": len(connections),
+        "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+        "pending_requests": len(getattr(pool, "_requests", None) or []),
+        **http_client_stats,
+    }
+
+def _metric_labels(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+class Counter:
+    """Monotonic counter in the Prometheus text format"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), collect=None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        # Optional callback returning (label values, value) pairs, read when scraped
+        self._collect = collect
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        if self._collect is not None:
+            self._values = {tuple(key): value for key, value in self._collect()}
+        for key, value in self._values.items():
+            yield self.name, self.labelnames, key, value
+
+class Gauge(Counter):
+    """Value that goes up and down"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Counter):
+    """Cumulative-bucket latency histogram in the Prometheus text format"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        for key, (bucket_counts, total, count) in self._values.items():
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                yield f"{self.name}_bucket", self.labelnames + ("le",), key + (repr(float(bound)),), bucket_count
+            yield f"{self.name}_bucket", self.labelnames + ("le",), key + ("+Inf",), count
+            yield f"{self.name}_sum", self.labelnames, key, total
+            yield f"{self.name}_count", self.labelnames, key, count
+
+def render_metrics(metrics) -> str:
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labelnames, values, value in metric.samples():
+            lines.append(f"{name}{_metric_labels(labelnames, values)} {value:g}" if isinstance(value, float)
+                         else f"{name}{_metric_labels(labelnames, values)} {value}")
+    return "\n".join(lines) + "\n"
+
+def upstream_endpoint(url) -> str:
+    """Path template for an upstream URL, e.g. /v4/products/{id}, to keep label cardinality low"""
+    path = httpx.URL(str(url)).path
+    return "/".join("{id}" if segment.isdigit() else segment for segment in path.split("/")) or "/"
+
+http_request_latency = Histogram(
+    "app_http_request_duration_seconds", "Latency of requests served by this app, by route template",
+    ("method", "route", "status")
+)
+http_requests_in_flight = Gauge("app_http_requests_in_flight", "Requests currently being served")
+upstream_request_latency = Histogram(
+    "basalam_upstream_request_duration_seconds", "Latency of each request sent to Basalam, by endpoint template",
+    ("method", "endpoint", "status")
+)
+upstream_requests_in_flight = Gauge("basalam_upstream_requests_in_flight", "Requests to Basalam awaiting a response", ("endpoint",))
+bulk_products_processed = Counter(
+    "bulk_products_processed_total", "Products processed by bulk jobs", ("kind", "outcome")
+)
+bulk_throughput = Gauge(
+    "bulk_throughput_products_per_second", "Combined throughput of the running bulk jobs", ("kind",),
+    collect=lambda: _running_bulk_throughput()
+)
+image_upload_bytes = Counter(
+    "image_upload_bytes_total", "Image bytes sent to Basalam, by payload format", ("format",)
+)
+image_optimization_bytes_saved = Counter(
+    "image_optimization_bytes_saved_total", "Bytes removed from bulk images by the optimizer before upload"
+)
+upstream_coalesced = Counter(
+    "basalam_upstream_coalesced_requests_total", "GETs answered by an identical request already in flight, by route", ("route",)
+)
+upstream_retries = Counter(
+    "basalam_upstream_retries_total", "Retried requests to Basalam, by route", ("route",),
+    collect=lambda: [((route,), count) for route, count in upstream_stats["retries_by_route"].items()]
+)
+circuit_breaker_state = Gauge(
+    "basalam_circuit_breaker_state", "1 for the current state of each host's circuit breaker", ("host", "state"),
+    collect=lambda: [((host, breaker.state), 1) for host, breaker in circuit_breakers.items()]
+)
+
+class MetricsMiddleware:
+    """Time every request (including streamed bodies) against its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        path = scope["path"]
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            # FastAPI stores the matched route in the scope while routing
+            route = scope.get("route")
+            if route is not None:
+                template = route.path
+            elif path.startswith("/static/"):
+                template = "/static"
+            else:
+                template = "unmatched"
+            http_request_latency.observe(
+                time.perf_counter() - started, method=scope["method"], route=template, status=status["code"]
+            )
+
+app.add_middleware(MetricsMiddleware)
+
+class MemorySessionStore:
+    """Expiring key/value records kept in this process (single worker only)"""
+
+    def __init__(self):
+        self._records: Dict[str, tuple] = {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        record = self._records.get(key)
+        if record is None:
+            return None
+        if record[0] <= time.time():
+            del self._records[key]
+            return None
+        return record[1]
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float):
+        # Re-insert so the dict stays ordered by write time, oldest first
+        self._records.pop(key, None)
+        self._records[key] = (time.time() + ttl, value)
+
+    def delete(self, key: str):
+        self._records.pop(key, None)
+
+    def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        """Remove a record and return it if it had not expired"""
+        record = self._records.pop(key, None)
+        if record is None or record[0] <= time.time():
+            return None
+        return record[1]
+
+    def trim(self, max_entries: int) -> int:
+        """Drop expired records, then the oldest ones, until at most max_entries remain"""
+        if len(self._records) <= max_entries:
+            return 0
+        removed = self.purge_expired()
+        while len(self._records) > max_entries:
+            del self._records[next(iter(self._records))]
+            removed += 1
+        return removed
+
+    def items(self):
+        now = time.time()
+        return [(key, value) for key, (expires_at, value) in list(self._records.items()) if expires_at > now]
+
+    def count(self) -> int:
+        return len(self.items())
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        expired = [key for key, (expires_at, _) in self._records.items() if expires_at <= now]
+        for key in expired:
+            del self._records[key]
+        return len(expired)
+
+class SQLiteSessionStore:
+    """Expiring key/value records in a SQLite file shared by every worker process on the host"""
+
+    def __init__(self, path: str, table: str):
+        self.path = path
+        self.table = table
+        self._connection = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection.execute(
+            f"SELECT value FROM {self.table} WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float):
+        self._connection.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), time.time() + ttl)
+        )
+
+    def delete(self, key: str):
+        self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        """Remove a record and return it if it had not expired; only one process wins a race"""
+        value = self.get(key)
+        if value is None:
+            return None
+        deleted = self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount
+        return value if deleted else None
+
+    def trim(self, max_entries: int) -> int:
+        """Drop expired records, then the soonest-expiring ones, until at most max_entries remain"""
+        removed = self.purge_expired()
+        excess = self.count() - max_entries
+        if excess > 0:
+            removed += self._connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY expires_at LIMIT ?)", (excess,)
+            ).rowcount
+        return removed
+
+    def items(self):
+        rows = self._connection.execute(
+            f"SELECT key, value FROM {self.table} WHERE expires_at > ?", (time.time(),)
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def count(self) -> int:
+        return self._connection.execute(
+            f"SELECT COUNT(*) FROM {self.table} WHERE expires_at > ?", (time.time(),)
+        ).fetchone()[0]
+
+    def purge_expired(self) -> int:
+        return self._connection.execute(
+            f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+
+def create_session_store(table: str):
+    """Build a store for the configured SESSION_BACKEND"""
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(SESSION_DB_PATH, table)
+    if SESSION_BACKEND != "memory":
+        logger.warning(f"Unknown SESSION_BACKEND '{SESSION_BACKEND}' - using in-memory sessions")
+    return MemorySessionStore()
+
+class OAuthStateStore:
+    """Pending OAuth logins keyed by their state token, with expiry and a size cap"""
+
+    def __init__(self, store, ttl: float, max_entries: int):
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evicted = 0
+
+    def add(self, state: str, session_id: str):
+        self.evicted += self.store.trim(max(0, self.max_entries - 1))
+        self.store.set(state, {
+            "session_id": session_id,
+            "timestamp": datetime.utcnow().isoformat()
+        }, self.ttl)
+
+    def consume(self, state: str) -> Optional[Dict[str, Any]]:
+        """Validate-and-delete in one lookup; a state can only be used once"""
+        return self.store.pop(state)
+
+    def purge_expired(self) -> int:
+        return self.store.purge_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.store.count(),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "evicted": self.evicted
+        }
+
+# Logged-in sessions (cookie session ID -> access token), pending OAuth states,
+# and bulk job progress shared with the other worker processes
+session_store = create_session_store("sessions")
+oauth_state_store = OAuthStateStore(
+    create_session_store("oauth_state_tokens"), OAUTH_STATE_TTL, OAUTH_STATE_MAX_ENTRIES
+)
+job_store = create_session_store("bulk_jobs")
+job_cancel_store = create_session_store("bulk_job_cancellations")
+
+session_purge_task: Optional[asyncio.Task] = None
+
+async def _purge_expired_sessions():
+    while True:
+        await asyncio.sleep(SESSION_PURGE_INTERVAL)
+        try:
+            sessions = session_store.purge_expired()
+            states = oauth_state_store.purge_expired()
+            if sessions or states:
+                logger.info(f"🧹 Purged {sessions} expired sessions and {states} abandoned OAuth states")
+        except sqlite3.Error as e:
+            logger.warning(f"Session purge failed: {e}")
+
+def start_session_purger():
+    """Sweep expired sessions and abandoned logins in the background"""
+    global session_purge_task
+    if session_purge_task is None or session_purge_task.done():
+        session_purge_task = asyncio.create_task(_purge_expired_sessions())
+
+async def stop_session_purger():
+    global session_purge_task
+    if session_purge_task is not None:
+        session_purge_task.cancel()
+        await asyncio.gather(session_purge_task, return_exceptions=True)
+        session_purge_task = None
+
+def get_session_token(request: Request) -> Optional[str]:
+    """Access token of the session named by the request's cookie, if any"""
+    session_id = request.cookies.get(SESSION_COOKIE_NAME)
+    if not session_id:
+        return None
+    session = session_store.get(session_id)
+    return session.get("access_token") if session else None
+
+def require_token(request: Request) -> str:
+    token = get_session_token(request)
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return token
+
+def set_session_cookie(response, session_id: str):
+    response.set_cookie(
+        SESSION_COOKIE_NAME,
+        session_id,
+        max_age=SESSION_TTL,
+        httponly=True,
+        samesite="lax",
+        secure=(BASALAM_REDIRECT_URI or "").startswith("https://"),
+        path="/"
+    )
+
+def owner_fingerprint(token: str) -> str:
+    """Identify a job's owner in shared storage without writing the token there again"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Return the Retry-After delay in seconds, accepting both delta and HTTP-date forms"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+class UpstreamUnavailable(HTTPException):
+    """Raised without contacting Basalam while its circuit breaker is open"""
+
+    def __init__(self, host: str, retry_in: float):
+        self.retry_in = retry_in
+        super().__init__(
+            status_code=503,
+            detail=f"Basalam ({host}) is unavailable - retry in {retry_in:.0f}s"
+        )
+
+    def __str__(self) -> str:
+        return self.detail
+
+class CircuitBreaker:
+    """Per-host breaker: opens after consecutive failures, then lets one probe through after a cooldown"""
+
+    def __init__(self, host: str, failure_threshold: int, cooldown: float):
+        self.host = host
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_count = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_request(self):
+        if self.state == "closed":
+            return
+        remaining = self._opened_at + self.cooldown - time.monotonic()
+        if self.state == "open" and remaining <= 0:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.rejected += 1
+        raise UpstreamUnavailable(self.host, max(remaining, 1))
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"🟢 Circuit for {self.host} closed - Basalam is responding again")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened_count += 1
+                logger.warning(f"🔴 Circuit for {self.host} opened after {self.consecutive_failures} failures - "
+                               f"failing fast for {self.cooldown:.0f}s")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """The probe ended without an answer (e.g. cancelled); let another request try"""
+        self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened_count": self.opened_count,
+            "rejected": self.rejected
+        }
+
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+upstream_stats = {"requests": 0, "retries": 0, "exhausted": 0, "retries_by_route": {}, "coalesced": 0}
+# Identical GETs currently waiting on Basalam, shared by every caller that asks for the same thing
+upstream_inflight_gets: Dict[tuple, asyncio.Task] = {}
+# Latency of the most recent answered requests per route, used to project bulk job durations
+upstream_recent_latency: Dict[str, deque] = {}
+
+# Set by BulkDispatcher so retries inside basalam_request also slow the whole bulk run down
+upstream_retry_listener: contextvars.ContextVar = contextvars.ContextVar("upstream_retry_listener", default=None)
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    breaker = circuit_breakers.get(host)
+    if breaker is None:
+        breaker = circuit_breakers[host] = CircuitBreaker(host, BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN)
+    return breaker
+
+def upstream_backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * (2 ** attempt)))
+
+def _coalesce_key(method: str, url: str, kwargs: Dict[str, Any]) -> tuple:
+    """Identity of a read: method, full URL and every header, so tokens and validators never mix"""
+    full_url = str(httpx.URL(url).copy_merge_params(kwargs.get("params") or {}))
+    headers = tuple(sorted((name.lower(), value) for name, value in (kwargs.get("headers") or {}).items()))
+    return method, full_url, headers
+
+async def basalam_request(method: str, url: str, route: str, **kwargs) -> httpx.Response:
+    """Send one request to Basalam through the shared client.
+
+    GET and PATCH are retried on transport errors, 429 and 5xx with jittered
+    exponential backoff (or the server's Retry-After). Other methods are sent
+    once. Outages count against the host's circuit breaker, and while it is
+    open requests fail fast with UpstreamUnavailable.
+
+    Identical concurrent GETs (same token, URL and headers) share one upstream
+    request and all receive its response.
+    """
+    method = method.upper()
+    if method != "GET" or not UPSTREAM_COALESCE_GETS:
+        return await _send_upstream(method, url, route, **kwargs)
+
+    key = _coalesce_key(method, url, kwargs)
+    task = upstream_inflight_gets.get(key)
+    if task is None:
+        task = asyncio.create_task(_send_upstream(method, url, route, **kwargs))
+        upstream_inflight_gets[key] = task
+
+        def forget(finished: asyncio.Task):
+            if upstream_inflight_gets.get(key) is finished:
+                del upstream_inflight_gets[key]
+            # Mark the outcome as seen even when every waiter was cancelled
+            if not finished.cancelled():
+                finished.exception()
+
+        task.add_done_callback(forget)
+    else:
+        upstream_stats["coalesced"] += 1
+        upstream_coalesced.inc(route=route)
+    # A cancelled caller leaves the shared request running for the others
+    return await asyncio.shield(task)
+
+async def _send_upstream(method: str, url: str, route: str, **kwargs) -> httpx.Response:
+    """One logical request with its retries, breaker checks and metrics"""
+    client = get_http_client()
+    breaker = get_circuit_breaker(httpx.URL(url).host)
+    kwargs.setdefault("timeout", UPSTREAM_TIMEOUTS[route])
+    max_retries = UPSTREAM_MAX_RETRIES if method in RETRYABLE_METHODS else 0
+    attempt = 0
+
+    endpoint = upstream_endpoint(url)
+
+    while True:
+        breaker.before_request()
+        upstream_stats["requests"] += 1
+        outcome = None
+        upstream_requests_in_flight.inc(endpoint=endpoint)
+        started = time.perf_counter()
+        try:
+            outcome = await client.request(method, url, **kwargs)
+        except httpx.TransportError as error:
+            outcome = error
+        finally:
+            upstream_requests_in_flight.dec(endpoint=endpoint)
+            if outcome is None:
+                breaker.release_probe()
+        elapsed = time.perf_counter() - started
+        upstream_request_latency.observe(
+            elapsed, method=method, endpoint=endpoint,
+            status=type(outcome).__name__ if isinstance(outcome, Exception) else outcome.status_code
+        )
+        if not isinstance(outcome, Exception):
+            upstream_recent_latency.setdefault(route, deque(maxlen=UPSTREAM_LATENCY_WINDOW)).append(elapsed)
+
+        if isinstance(outcome, httpx.TransportError):
+            breaker.record_failure()
+            retry_after = None
+        elif outcome.status_code in RETRYABLE_STATUS_CODES:
+            # 429 is throttling, not an outage, so it leaves the breaker alone
+            if outcome.status_code == 429:
+                breaker.release_probe()
+            else:
+                breaker.record_failure()
+            retry_after = parse_retry_after(outcome)
+        else:
+            breaker.record_success()
+            return outcome
+
+        delay = retry_after if retry_after is not None else upstream_backoff(attempt)
+        retrying = attempt < max_retries and delay <= UPSTREAM_BACKOFF_MAX
+        listener = upstream_retry_listener.get()
+        if listener is not None:
+            await listener(outcome, delay, retrying)
+        if not retrying:
+            if max_retries:
+                upstream_stats["exhausted"] += 1
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        attempt += 1
+        upstream_stats["retries"] += 1
+        upstream_stats["retries_by_route"][route] = upstream_stats["retries_by_route"].get(route, 0) + 1
+        failure = type(outcome).__name__ if isinstance(outcome, Exception) else outcome.status_code
+        logger.warning(f"🔁 {method} {route} got {failure} - retry {attempt}/{max_retries} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+def recent_upstream_latency(route: str) -> Optional[float]:
+    """Median seconds of the route's recently answered requests, None before any were seen"""
+    samples = sorted(upstream_recent_latency.get(route, ()))
+    return samples[len(samples) // 2] if samples else None
+
+def get_upstream_stats() -> Dict[str, Any]:
+    return {
+        "requests": upstream_stats["requests"],
+        "retries": upstream_stats["retries"],
+        "retries_exhausted": upstream_stats["exhausted"],
+        "retries_by_route": dict(upstream_stats["retries_by_route"]),
+        "coalesced_gets": upstream_stats["coalesced"],
+        "gets_in_flight": len(upstream_inflight_gets),
+        "recent_latency_ms": {
+            route: round(recent_upstream_latency(route) * 1000, 1) for route in upstream_recent_latency
+        },
+        "circuit_breakers": {host: breaker.stats() for host, breaker in circuit_breakers.items()}
+    }
+
+class BulkDispatcher:
+    """Run one upstream operation per item with bounded, adaptive concurrency.
+
+    Retries happen inside basalam_request; the dispatcher hears about each
+    retryable answer through upstream_retry_listener. The parallelism limit is
+    halved whenever Basalam answers 429 or 5xx and grows back by one after a run
+    of successes. While throttled, every worker waits out the delay before
+    sending again.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max(1, max_concurrency or BULK_MAX_CONCURRENCY)
+        self.limit = self.max_concurrency
+        self.active = 0
+        self.retries = 0
+        self.throttle_events = 0
+        self._successes = 0
+        self._resume_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def _acquire(self):
+        async with self._condition:
+            while self.active >= self.limit:
+                await self._condition.wait()
+            self.active += 1
+
+    async def _release(self):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    async def _wait_for_cooldown(self):
+        loop = asyncio.get_running_loop()
+        while (delay := self._resume_at - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _throttle(self, retry_after: float):
+        loop = asyncio.get_running_loop()
+        self._resume_at = max(self._resume_at, loop.time() + retry_after)
+        async with self._condition:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+            self.throttle_events += 1
+        logger.warning(f"⏳ Upstream throttling - concurrency reduced to {self.limit}, pausing {retry_after:.1f}s")
+
+    async def _recover(self):
+        self._successes += 1
+        if self.limit < self.max_concurrency and self._successes >= self.limit:
+            async with self._condition:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+
+    async def _on_upstream_retry(self, outcome, delay: float, retrying: bool):
+        if retrying:
+            self.retries += 1
+        await self._throttle(delay)
+
+    async def call(self, operation, item):
+        """Run operation(item) in a dispatcher slot.
+
+        Returns the final httpx.Response, or the exception if the operation raised.
+        An open circuit breaker is waited out like throttling, for up to
+        BULK_BREAKER_MAX_WAIT seconds per item, so a short outage does not fail
+        the rest of the job.
+        """
+        waited = 0.0
+        while True:
+            await self._wait_for_cooldown()
+            await self._acquire()
+            listener = upstream_retry_listener.set(self._on_upstream_retry)
+            try:
+                outcome = await operation(item)
+            except UpstreamUnavailable as error:
+                outcome = error
+            except Exception as error:
+                return error
+            finally:
+                upstream_retry_listener.reset(listener)
+                await self._release()
+
+            if not isinstance(outcome, UpstreamUnavailable):
+                break
+            # Nothing was sent; try again once the breaker lets a probe through
+            if waited + outcome.retry_in > BULK_BREAKER_MAX_WAIT:
+                return outcome
+            waited += outcome.retry_in
+            await self._throttle(outcome.retry_in)
+
+        if outcome.status_code not in RETRYABLE_STATUS_CODES:
+            await self._recover()
+        return outcome
+
+    async def stream(self, items, operation):
+        """Yield (item, outcome, elapsed_seconds) tuples as operations complete.
+
+        items may be a regular or an async iterable; it is consumed lazily so the
+        caller never needs the whole input in memory.
+        """
+        source = items.__aiter__() if hasattr(items, "__aiter__") else _aiter_sync(items)
+        source_lock = asyncio.Lock()
+        results: asyncio.Queue = asyncio.Queue()
+        finished = object()
+
+        async def worker():
+            while True:
+                async with source_lock:
+                    try:
+                        item = await source.__anext__()
+                    except StopAsyncIteration:
+                        return
+                started = time.perf_counter()
+                outcome = await self.call(operation, item)
+                await results.put((item, outcome, time.perf_counter() - started))
+
+        async def run_workers():
+            workers = [asyncio.create_task(worker()) for _ in range(self.max_concurrency)]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+                await results.put(finished)
+
+        runner = asyncio.create_task(run_workers())
+        try:
+            while True:
+                entry = await results.get()
+                if entry is finished:
+                    break
+                yield entry
+            await runner
+        finally:
+            if not runner.done():
+                runner.cancel()
+
+async def _aiter_sync(items):
+    for item in items:
+        yield item
+
+class ImageSource:
+    """An uploaded image kept in a temp file, streamed to Basalam in fixed-size chunks"""
+
+    def __init__(self, path: str, size: int, sha256: str, filename: str, content_type: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type or "application/octet-stream"
+
+    @classmethod
+    async def from_upload(cls, upload, max_bytes: int, directory: Optional[str] = None) -> "ImageSource":
+        """Copy a form upload to a temp file, hashing as it goes; 413 once it passes max_bytes"""
+        digest = hashlib.sha256()
+        size = 0
+        handle = tempfile.NamedTemporaryFile(prefix="bulk-image-", dir=directory or IMAGE_SPOOL_DIR, delete=False)
+        try:
+            while chunk := await upload.read(IMAGE_STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Image is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                handle.write(chunk)
+            handle.close()
+        except BaseException:
+            handle.close()
+            os.unlink(handle.name)
+            raise
+        return cls(os.path.abspath(handle.name), size, digest.hexdigest(), upload.filename, upload.content_type)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"path": self.path, "size": self.size, "sha256": self.sha256,
+                "filename": self.filename, "content_type": self.content_type}
+
+    def open(self):
+        # One handle per request, so concurrent uploads never share a file position
+        return open(self.path, "rb")
+
+    async def iter_base64(self):
+        with self.open() as handle:
+            while chunk := await asyncio.to_thread(handle.read, IMAGE_STREAM_CHUNK_SIZE):
+                yield base64.b64encode(chunk)
+
+    def base64_size(self) -> int:
+        return 4 * ((self.size + 2) // 3)
+
+    def cleanup(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+class InlineImageBody:
+    """JSON body with the image embedded as a base64 data URI, encoded chunk by chunk while sending.
+
+    A fresh iteration starts for every attempt, so basalam_request can retry it.
+    """
+
+    PLACEHOLDER = "__image_data_uri__"
+
+    def __init__(self, source: ImageSource, payload: Dict[str, Any]):
+        self.source = source
+        before, after = json.dumps(payload).split(json.dumps(self.PLACEHOLDER))
+        data_uri_prefix = json.dumps(f"data:{source.content_type};base64,")[:-1]
+        self.prefix = (before + data_uri_prefix).encode("ascii")
+        self.suffix = ('"' + after).encode("ascii")
+
+    def __len__(self) -> int:
+        return len(self.prefix) + self.source.base64_size() + len(self.suffix)
+
+    async def __aiter__(self):
+        yield self.prefix
+        async for chunk in self.source.iter_base64():
+            yield chunk
+        yield self.suffix
+
+def _optimize_image_file(source_path: str, target_path: str, max_dimension: int, quality: int, output_format: str):
+    """Resize, strip metadata and re-encode one image (runs in the optimizer process pool)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as original:
+        if getattr(original, "is_animated", False):
+            return None
+        # Apply the EXIF orientation before the metadata is dropped
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if output_format == "jpeg" and image.mode != "RGB":
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            else:
+                image = image.convert("RGB")
+        options = {"quality": quality}
+        if output_format == "jpeg":
+            options.update(optimize=True, progressive=True)
+        else:
+            options.update(method=6)
+        image.save(target_path, format=output_format.upper(), **options)
+        return image.size
+
+class ImageOptimizer:
+    """Shrink bulk images in a process pool, caching results by source content hash"""
+
+    def __init__(self):
+        self.enabled = self._pillow_available() if IMAGE_OPTIMIZE == "auto" else IMAGE_OPTIMIZE in ("1", "true", "yes", "on")
+        if self.enabled and not self._pillow_available():
+            logger.warning("IMAGE_OPTIMIZE is enabled but Pillow is not installed - images are sent unchanged")
+            self.enabled = False
+        elif IMAGE_OPTIMIZE == "auto" and not self.enabled:
+            logger.info("🖼️ Pillow is not installed - bulk images are sent without optimization")
+        if IMAGE_OUTPUT_FORMAT not in ("jpeg", "webp"):
+            raise ValueError("IMAGE_OUTPUT_FORMAT must be 'jpeg' or 'webp'")
+        self.cache_dir = os.path.join(IMAGE_SPOOL_DIR or tempfile.gettempdir(), "basalam-optimized-images")
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._executor = None
+        self._cache: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _pillow_available() -> bool:
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _cache_key(self, sha256: str) -> str:
+        return f"{sha256}-{IMAGE_MAX_DIMENSION}-{IMAGE_QUALITY}-{IMAGE_OUTPUT_FORMAT}"
+
+    async def _process(self, source: ImageSource, key: str) -> Optional[Dict[str, Any]]:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=max(1, IMAGE_OPTIMIZE_WORKERS))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        target_path = os.path.join(self.cache_dir, f"{key}.{IMAGE_OUTPUT_FORMAT}")
+        loop = asyncio.get_running_loop()
+        try:
+            dimensions = await loop.run_in_executor(
+                self._executor, _optimize_image_file,
+                source.path, target_path, IMAGE_MAX_DIMENSION, IMAGE_QUALITY, IMAGE_OUTPUT_FORMAT
+            )
+        except Exception as e:
+            logger.warning(f"Image optimization failed - sending the original: {e}")
+            return None
+        if dimensions is None:
+            return None
+        size = os.path.getsize(target_path)
+        if size >= source.size:
+            os.unlink(target_path)
+            return None
+        digest = hashlib.sha256()
+        with open(target_path, "rb") as optimized:
+            while chunk := optimized.read(IMAGE_STREAM_CHUNK_SIZE):
+                digest.update(chunk)
+        return {"path": target_path, "size": size, "sha256": digest.hexdigest(), "dimensions": list(dimensions)}
+
+    async def _optimize_once(self, source: ImageSource, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            result = await self._process(source, key)
+            # A cancelled first job may have deleted its upload mid-way; that says nothing about the image
+            if result is not None or os.path.exists(source.path):
+                self._remember(key, result)
+            return result
+        finally:
+            del self._pending[key]
+
+    def _remember(self, key: str, result: Optional[Dict[str, Any]]):
+        self._cache[key] = result
+        self._cache.move_to_end(key)
+        while len(self._cache) > IMAGE_OPTIMIZE_CACHE_ENTRIES:
+            _, evicted = self._cache.popitem(last=False)
+            if evicted is not None:
+                try:
+                    os.unlink(evicted["path"])
+                except FileNotFoundError:
+                    pass
+
+    async def optimize(self, source: ImageSource) -> tuple:
+        """Return (image to send, report); the image is a job-owned copy when it was shrunk"""
+        report = {"enabled": self.enabled, "original_bytes": source.size, "optimized_bytes": source.size,
+                  "bytes_saved": 0, "cached": False}
+        if not self.enabled:
+            return source, report
+
+        key = self._cache_key(source.sha256)
+        if key in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            report["cached"] = True
+            result = self._cache[key]
+        elif key in self._pending:
+            # The same image is already being processed for another job
+            self.hits += 1
+            report["cached"] = True
+            result = await asyncio.shield(self._pending[key])
+        else:
+            self.misses += 1
+            # The work runs in its own task: a job cancelled while waiting only stops waiting,
+            # and the other jobs sharing this image still get the result
+            self._pending[key] = asyncio.create_task(self._optimize_once(source, key))
+            result = await asyncio.shield(self._pending[key])
+
+        if result is None:
+            return source, report
+
+        # Copy out of the cache so eviction never removes a file a job still streams from
+        handle = tempfile.NamedTemporaryFile(prefix="bulk-image-", dir=IMAGE_SPOOL_DIR, delete=False)
+        handle.close()
+        await asyncio.to_thread(shutil.copyfile, result["path"], handle.name)
+        stem = os.path.splitext(source.filename or "image")[0]
+        optimized = ImageSource(handle.name, result["size"], result["sha256"],
+                                f"{stem}.{'jpg' if IMAGE_OUTPUT_FORMAT == 'jpeg' else 'webp'}", f"image/{IMAGE_OUTPUT_FORMAT}")
+        report.update(optimized_bytes=result["size"], bytes_saved=source.size - result["size"], dimensions=result["dimensions"])
+        self.bytes_saved += report["bytes_saved"]
+        image_optimization_bytes_saved.inc(report["bytes_saved"])
+        return optimized, report
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses,
+                "cached_images": len(self._cache), "bytes_saved": self.bytes_saved}
+
+image_optimizer = ImageOptimizer()
+
+class BulkImageUpload:
+    """Attach one image to many products.
+
+    The image is uploaded to the Basalam file service once and each product is
+    pointed at the returned file ID with a small PATCH. If the upload or that
+    format is rejected, the legacy inline formats are tried instead. The first
+    format that works is used for the remaining products and formats that
+    failed before it are not tried again.
+    """
+
+    def __init__(self, token: str, source: ImageSource):
+        self.token = token
+        self.source = source
+        self.file_id = None
+        self.accepted_format = None
+        self.formats = list(IMAGE_PAYLOAD_FORMATS)
+        remembered = image_format_memory["accepted"]
+        if remembered in self.formats:
+            self.formats.remove(remembered)
+            self.formats.insert(0, remembered)
+        self._upload_attempted = False
+        self._upload_lock = asyncio.Lock()
+
+    async def ensure_uploaded(self) -> Optional[Any]:
+        """Upload the image once and return its Basalam file ID"""
+        async with self._upload_lock:
+            if self._upload_attempted:
+                return self.file_id
+            self._upload_attempted = True
+
+            image_upload_bytes.inc(self.source.size, format="file_service")
+            try:
+                with self.source.open() as image_file:
+                    response = await basalam_request(
+                        "POST", BASALAM_UPLOAD_URL, "upload",
+                        headers={"Authorization": f"Bearer {self.token}", "Accept": "application/json"},
+                        data={"file_type": BASALAM_UPLOAD_FILE_TYPE},
+                        files={"file": (self.source.filename, image_file, self.source.content_type)}
+                    )
+            except httpx.TransportError as e:
+                logger.warning(f"Image upload to file service failed: {e}")
+                return None
+            if response.status_code not in (200, 201):
+                logger.warning(f"Image upload to file service failed: {response.status_code} - {response.text}")
+                return None
+
+            try:
+                upload_data = response.json()
+            except ValueError:
+                logger.warning("Image upload succeeded but the response is not JSON")
+                return None
+            if isinstance(upload_data, dict) and isinstance(upload_data.get("data"), dict):
+                upload_data = upload_data["data"]
+            self.file_id = upload_data.get("id") if isinstance(upload_data, dict) else None
+            logger.info(f"Image uploaded once to file service - file ID: {self.file_id}")
+            return self.file_id
+
+    def _request_options(self, payload_format: str, image_file) -> Dict[str, Any]:
+        json_headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
+        if payload_format == "file_id":
+            return {"headers": json_headers, "json": {"photo": self.file_id}, "timeout": UPSTREAM_TIMEOUTS["update"]}
+        if payload_format in ("image_json", "photo_object"):
+            # Base64 is produced chunk by chunk while the body is sent, never held whole
+            if payload_format == "image_json":
+                payload = {"image": InlineImageBody.PLACEHOLDER, "filename": self.source.filename}
+            else:
+                payload = {"photo": {"data": InlineImageBody.PLACEHOLDER, "filename": self.source.filename}}
+            body = InlineImageBody(self.source, payload)
+            return {
+                "headers": {**json_headers, "Content-Length": str(len(body))},
+                "content": body,
+                "timeout": UPSTREAM_TIMEOUTS["upload"]
+            }
+        return {
+            "headers": {"Authorization": f"Bearer {self.token}", "Accept": "application/json"},
+            "files": {"image": (self.source.filename, image_file, self.source.content_type)},
+            "timeout": UPSTREAM_TIMEOUTS["upload"]
+        }
+
+    def upload_bytes(self) -> int:
+        """Body size of the one-off file service upload"""
+        with self.source.open() as image_file:
+            request = httpx.Request(
+                "POST", BASALAM_UPLOAD_URL, data={"file_type": BASALAM_UPLOAD_FILE_TYPE},
+                files={"file": (self.source.filename, image_file, self.source.content_type)}
+            )
+            return int(request.headers["Content-Length"])
+
+    def request_bytes(self, payload_format: str) -> int:
+        """Body size of one product update in the given format, as it would be sent"""
+        if payload_format == "file_id":
+            # The real ID is only known after the upload; assume a ten-digit one
+            return len(json.dumps({"photo": self.file_id or 10 ** 9}).encode())
+        with self.source.open() as image_file:
+            options = self._request_options(payload_format, image_file)
+            options.pop("timeout")
+            request = httpx.Request("PATCH", f"{BASALAM_API_BASE}/v4/products/0", **options)
+            return int(request.headers["Content-Length"])
+
+    def _accept(self, payload_format: str, rejected: List[str]):
+        for failed_format in rejected:
+            if failed_format in self.formats:
+                self.formats.remove(failed_format)
+        if self.accepted_format != payload_format:
+            logger.info(f"Basalam accepted image format '{payload_format}' - using it for the remaining products")
+        self.accepted_format = payload_format
+        image_format_memory["accepted"] = payload_format
+        if payload_format in self.formats:
+            self.formats.remove(payload_format)
+        self.formats.insert(0, payload_format)
+
+    async def apply(self, product: Dict[str, Any]) -> httpx.Response:
+        """Point one product at the image, trying the remaining formats in order"""
+        product_id = product["id"]
+        rejected = []
+        update_response = None
+
+        for payload_format in list(self.formats):
+            if payload_format == "file_id" and await self.ensure_uploaded() is None:
+                if "file_id" in self.formats:
+                    self.formats.remove("file_id")
+                continue
+
+            if payload_format == "multipart":
+                image_upload_bytes.inc(self.source.size, format=payload_format)
+                with self.source.open() as image_file:
+                    update_response = await basalam_request(
+                        "PATCH", f"{BASALAM_API_BASE}/v4/products/{product_id}", "update",
+                        **self._request_options(payload_format, image_file)
+                    )
+            else:
+                if payload_format != "file_id":
+                    image_upload_bytes.inc(self.source.base64_size(), format=payload_format)
+                update_response = await basalam_request(
+                    "PATCH", f"{BASALAM_API_BASE}/v4/products/{product_id}", "update",
+                    **self._request_options(payload_format, None)
+                )
+            if update_response.status_code == 200:
+                self._accept(payload_format, rejected)
+                return update_response
+            if self.accepted_format is not None or update_response.status_code not in IMAGE_FORMAT_REJECTED_STATUS_CODES:
+                # The format is known to work, or the answer is about this product (404, 403) or an
+                # outage; sending the image again in another format would not help
+                return update_response
+            rejected.append(payload_format)
+
+        if update_response is None:
+            raise RuntimeError("No image payload format is available")
+        return update_response
+
+class JobJournal:
+    """Bulk jobs and their per-product outcomes in a SQLite file, so unfinished jobs survive a restart.
+
+    The process running a job holds a claim on it and renews it with a heartbeat.
+    Jobs whose claim was released (clean shutdown) or went stale (crash) are
+    claimed by whichever worker process gets to them first and resumed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.outcomes_written = 0
+        self.resumed = 0
+        # The journal holds users' access tokens until their jobs finish, so only this user may read it;
+        # SQLite gives the -wal and -shm files the same mode as the database
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        for journal_file in (path, f"{path}-wal", f"{path}-shm"):
+            if os.path.exists(journal_file):
+                os.chmod(journal_file, 0o600)
+        self._connection = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL survives a process crash; only a power loss can drop the last outcomes
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS journal_jobs (job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, "
+            "shelf_id INTEGER, owner TEXT NOT NULL, token TEXT, params TEXT NOT NULL, status TEXT NOT NULL, "
+            "snapshot TEXT, claimed_by TEXT, heartbeat_at REAL NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, finished_at REAL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS journal_outcomes (job_id TEXT NOT NULL, product_id TEXT NOT NULL, "
+            "status TEXT NOT NULL, error TEXT, PRIMARY KEY (job_id, product_id))"
+        )
+
+    def create(self, job: "BulkJob"):
+        self._connection.execute(
+            "INSERT INTO journal_jobs (job_id, kind, shelf_id, owner, token, params, status, snapshot, "
+            "claimed_by, heartbeat_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job.id, job.kind, job.shelf_id, owner_fingerprint(job.owner), job.owner,
+             json.dumps(job.params, ensure_ascii=False), job.status,
+             json.dumps(job.snapshot(), ensure_ascii=False), self.worker_id, time.time(), job.created_at)
+        )
+
+    def record(self, job_id: str, product_id: Any, status: str, error: Optional[str] = None):
+        """Append one product's outcome; a retried product replaces its earlier failure"""
+        self._connection.execute(
+            "INSERT OR REPLACE INTO journal_outcomes (job_id, product_id, status, error) VALUES (?, ?, ?, ?)",
+            (job_id, json.dumps(product_id), status, error)
+        )
+        self.outcomes_written += 1
+
+    def update(self, job: "BulkJob"):
+        """Store the job's latest snapshot; a finished job also gives up its token and claim"""
+        snapshot = json.dumps(job.snapshot(), ensure_ascii=False)
+        if job.finished:
+            self._connection.execute(
+                "UPDATE journal_jobs SET status = ?, snapshot = ?, token = NULL, claimed_by = NULL, "
+                "finished_at = ? WHERE job_id = ?", (job.status, snapshot, job.finished_at or time.time(), job.id)
+            )
+        else:
+            self._connection.execute(
+                "UPDATE journal_jobs SET status = ?, snapshot = ?, heartbeat_at = ? WHERE job_id = ? AND claimed_by = ?",
+                (job.status, snapshot, time.time(), job.id, self.worker_id)
+            )
+
+    def heartbeat(self) -> int:
+        """Renew this process's claim on all of its unfinished jobs"""
+        return self._connection.execute(
+            "UPDATE journal_jobs SET heartbeat_at = ? WHERE claimed_by = ? AND finished_at IS NULL",
+            (time.time(), self.worker_id)
+        ).rowcount
+
+    def release(self) -> int:
+        """Give up this process's unfinished jobs so another process resumes them straight away"""
+        return self._connection.execute(
+            "UPDATE journal_jobs SET claimed_by = NULL, heartbeat_at = 0 WHERE claimed_by = ? AND finished_at IS NULL",
+            (self.worker_id,)
+        ).rowcount
+
+    def claim_orphans(self) -> List[Dict[str, Any]]:
+        """Claim unfinished jobs that nobody is running; only one process wins each job"""
+        stale = time.time() - JOB_CLAIM_TIMEOUT
+        rows = self._connection.execute(
+            "SELECT job_id, kind, shelf_id, token, params, created_at FROM journal_jobs "
+            "WHERE finished_at IS NULL AND (claimed_by IS NULL OR heartbeat_at < ?) ORDER BY created_at",
+            (stale,)
+        ).fetchall()
+        claimed = []
+        for job_id, kind, shelf_id, token, params, created_at in rows:
+            won = self._connection.execute(
+                "UPDATE journal_jobs SET claimed_by = ?, heartbeat_at = ? WHERE job_id = ? AND finished_at IS NULL "
+                "AND (claimed_by IS NULL OR heartbeat_at < ?)", (self.worker_id, time.time(), job_id, stale)
+            ).rowcount
+            if won:
+                claimed.append({"job_id": job_id, "kind": kind, "shelf_id": shelf_id, "token": token,
+                                "params": json.loads(params), "created_at": created_at})
+        return claimed
+
+    def outcomes(self, job_id: str) -> Dict[Any, str]:
+        """Product ID -> status for every product the job already processed"""
+        rows = self._connection.execute(
+            "SELECT product_id, status FROM journal_outcomes WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        return {json.loads(product_id): status for product_id, status in rows}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job's owner fingerprint and last snapshot, in the same shape as job_store records"""
+        row = self._connection.execute(
+            "SELECT owner, snapshot FROM journal_jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return {"owner": row[0], "snapshot": json.loads(row[1])} if row and row[1] else None
+
+    def purge_finished(self, older_than: float) -> int:
+        cutoff = time.time() - older_than
+        self._connection.execute(
+            "DELETE FROM journal_outcomes WHERE job_id IN "
+            "(SELECT job_id FROM journal_jobs WHERE finished_at IS NOT NULL AND finished_at < ?)", (cutoff,)
+        )
+        return self._connection.execute(
+            "DELETE FROM journal_jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+        ).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        unfinished, claimed = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(claimed_by = ?), 0) FROM journal_jobs WHERE finished_at IS NULL",
+            (self.worker_id,)
+        ).fetchone()
+        return {"unfinished_jobs": unfinished, "claimed_here": claimed,
+                "outcomes_written": self.outcomes_written, "resumed": self.resumed}
+
+job_journal = JobJournal(JOB_JOURNAL_PATH) if JOB_JOURNAL_PATH else None
+job_journal_task: Optional[asyncio.Task] = None
+
+class BulkJob:
+    """State and progress of one background bulk operation"""
+
+    FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+    def __init__(self, kind: str, shelf_id: Optional[int], owner: str, params: Dict[str, Any], job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.shelf_id = shelf_id
+        self.owner = owner
+        # Everything run_bulk_job needs besides the token, so a journaled job can be rebuilt after a restart
+        self.params = params
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.total = None
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.result = None
+        self.error = None
+        self.task: Optional[asyncio.Task] = None
+        self.journaled = job_journal is not None
+        self.resumed = False
+        # Products a previous run of this job already updated or skipped, by product ID
+        self.confirmed: Dict[Any, str] = {}
+        self._subscribers: List[asyncio.Queue] = []
+        self._persisted_at = 0.0
+        self._cleanups = []
+        if "image" in params:
+            # The job owns its upload; the file outlives a restart while the job can still be resumed
+            self.add_cleanup(ImageSource(**params["image"]).cleanup, resumable=True)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in self.FINISHED_STATUSES
+
+    @property
+    def target(self) -> str:
+        if "shelf_ids" in self.params:
+            return f"shelves {', '.join(str(shelf_id) for shelf_id in self.params['shelf_ids'])}"
+        return f"shelf {self.shelf_id}"
+
+    def record(self, product_id: Any, outcome, elapsed: float) -> bool:
+        """Count one processed product and publish a progress event for it"""
+        succeeded = not isinstance(outcome, Exception) and outcome.status_code == 200
+        self.processed += 1
+        if succeeded:
+            self.succeeded += 1
+            error = None
+        else:
+            self.failed += 1
+            error = failure_summary(outcome)
+        if self.journaled:
+            job_journal.record(self.id, product_id, "updated" if succeeded else "failed", error)
+        bulk_products_processed.inc(kind=self.kind, outcome="updated" if succeeded else "failed")
+        self.publish("product", {
+            "id": product_id,
+            "status": "updated" if succeeded else "failed",
+            "latency_ms": round(elapsed * 1000, 1),
+            "error": error
+        })
+        self.persist()
+        return succeeded
+
+    def skip(self, product_id: Any):
+        """Count a product that already matches the requested change"""
+        self.processed += 1
+        self.skipped += 1
+        if self.journaled:
+            job_journal.record(self.id, product_id, "skipped")
+        bulk_products_processed.inc(kind=self.kind, outcome="skipped")
+        self.publish("product", {"id": product_id, "status": "skipped", "latency_ms": 0, "error": None})
+        self.persist()
+
+    def persist(self, force: bool = False):
+        """Share progress with the other worker processes and pick up cancellations they received"""
+        now = time.monotonic()
+        if not force and now - self._persisted_at < JOB_SNAPSHOT_INTERVAL:
+            return
+        self._persisted_at = now
+        if not self.finished and job_cancel_store.get(self.id) is not None:
+            self.cancel()
+        job_store.set(self.id, {
+            "owner": owner_fingerprint(self.owner),
+            "snapshot": self.snapshot()
+        }, BULK_JOB_RETENTION)
+        if self.journaled:
+            job_journal.update(self)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=JOB_EVENT_QUEUE_SIZE)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def publish(self, event: str, data: Dict[str, Any]):
+        """Send an event to every live subscriber without ever blocking the job"""
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # A slow client misses individual product events; summaries keep it in sync
+                if event == "done":
+                    queue.get_nowait()
+                    queue.put_nowait((event, data))
+
+    def throughput(self) -> float:
+        """Products processed per second since the job started"""
+        # A resumed job only counts the products processed since it restarted
+        processed = self.processed - len(self.confirmed)
+        if not self.started_at or processed <= 0:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return processed / elapsed if elapsed > 0 else 0.0
+
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.throughput()
+        if self.finished or self.total is None or not rate:
+            return None
+        return max(0, self.total - self.processed) / rate
+
+    def add_cleanup(self, callback, resumable: bool = False):
+        """Run callback once the job has finished, whether or not it ever started.
+
+        Resumable cleanups are held back when a shutdown interrupts a journaled job.
+        """
+        self._cleanups.append((callback, resumable))
+
+    def _run_cleanups(self, keep_resumable: bool = False):
+        kept = []
+        while self._cleanups:
+            callback, resumable = self._cleanups.pop()
+            if resumable and keep_resumable:
+                kept.append((callback, resumable))
+                continue
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cleanup for bulk job {self.id} failed: {e}")
+        self._cleanups = kept
+
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+        elif self.status == "queued":
+            self.status = "cancelled"
+            self.finished_at = time.time()
+            self._run_cleanups()
+            # run() never starts for this job, so it cannot announce the end itself
+            self.publish("done", self.snapshot())
+
+    async def run(self):
+        self.status = "running"
+        self.started_at = time.time()
+        self.task = asyncio.create_task(run_bulk_job(self))
+        self.persist(force=True)
+        try:
+            await asyncio.wait({self.task})
+        except asyncio.CancelledError:
+            # The worker itself is shutting down; a journaled job is resumed by the next process
+            self.task.cancel()
+            self.status = "interrupted"
+            self._run_cleanups(keep_resumable=self.journaled)
+            self.persist(force=True)
+            raise
+        self.finished_at = time.time()
+        self._run_cleanups()
+        if self.task.cancelled():
+            self.status = "cancelled"
+        elif self.task.exception() is not None:
+            error = self.task.exception()
+            self.status = "failed"
+            self.error = error.detail if isinstance(error, HTTPException) else str(error)
+            logger.error(f"❌ Bulk job {self.id} failed: {self.error}")
+        else:
+            self.status = "completed"
+            self.result = self.task.result()
+        logger.info(f"📦 Bulk job {self.id} ({self.kind}, {self.target}) {self.status} - "
+                    f"{self.succeeded} succeeded, {self.failed} failed, {self.skipped} skipped")
+        self.persist(force=True)
+        job_cancel_store.delete(self.id)
+        self.publish("done", self.snapshot())
+
+    def submission(self) -> Dict[str, Any]:
+        """Response body for the endpoint that queued this job"""
+        return {
+            "success": True,
+            "job_id": self.id,
+            "status": self.status,
+            "status_url": f"/api/jobs/{self.id}"
+        }
+
+    def snapshot(self, include_result: bool = True) -> Dict[str, Any]:
+        eta = self.eta_seconds()
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "shelf_id": self.shelf_id,
+            "shelf_ids": self.params.get("shelf_ids", [self.shelf_id]),
+            "status": self.status,
+            "created_at": datetime.utcfromtimestamp(self.created_at).isoformat(),
+            "started_at": datetime.utcfromtimestamp(self.started_at).isoformat() if self.started_at else None,
+            "finished_at": datetime.utcfromtimestamp(self.finished_at).isoformat() if self.finished_at else None,
+            "total": self.total,
+            "processed": self.processed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "throughput_per_second": round(self.throughput(), 2),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "resumed": self.resumed,
+            "error": self.error
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+async def _bulk_job_worker():
+    while True:
+        job = await bulk_job_queue.get()
+        try:
+            # Picks up a cancellation another worker process received while the job was queued
+            job.persist(force=True)
+            if job.status == "queued":
+                await job.run()
+        finally:
+            bulk_job_queue.task_done()
+
+def start_bulk_job_workers():
+    """Start the in-process worker pool that runs queued bulk jobs"""
+    global bulk_job_queue
+    if bulk_job_workers:
+        return
+    bulk_job_queue = asyncio.Queue()
+    for _ in range(max(1, BULK_JOB_WORKERS)):
+        bulk_job_workers.append(asyncio.create_task(_bulk_job_worker()))
+    logger.info(f"🧵 Started {len(bulk_job_workers)} bulk job workers")
+
+async def stop_bulk_job_workers():
+    """Cancel running jobs and stop the worker pool"""
+    for task in bulk_job_workers:
+        task.cancel()
+    await asyncio.gather(*bulk_job_workers, return_exceptions=True)
+    bulk_job_workers.clear()
+    if job_journal is not None:
+        released = job_journal.release()
+        if released:
+            logger.info(f"💾 Released {released} unfinished bulk jobs for the next worker to resume")
+
+def _running_bulk_throughput():
+    rates: Dict[str, float] = {}
+    for job in bulk_jobs.values():
+        if job.status == "running":
+            rates[job.kind] = rates.get(job.kind, 0.0) + job.throughput()
+    return [((kind,), round(rate, 3)) for kind, rate in rates.items()]
+
+def _prune_bulk_jobs():
+    cutoff = time.time() - BULK_JOB_RETENTION
+    finished = sorted(
+        (job for job in bulk_jobs.values() if job.finished),
+        key=lambda job: job.finished_at or job.created_at
+    )
+    excess = len(bulk_jobs) - BULK_JOB_MAX_HISTORY
+    for job in finished:
+        if (job.finished_at or job.created_at) < cutoff or excess > 0:
+            del bulk_jobs[job.id]
+            excess -= 1
+    job_store.purge_expired()
+    job_cancel_store.purge_expired()
+
+def submit_bulk_job(kind: str, shelf_id: Optional[int], owner: str, params: Dict[str, Any]) -> BulkJob:
+    """Queue a bulk job on the worker pool and return it immediately"""
+    start_bulk_job_workers()
+    _prune_bulk_jobs()
+    job = BulkJob(kind, shelf_id, owner, params)
+    bulk_jobs[job.id] = job
+    if job.journaled:
+        job_journal.create(job)
+    job.persist(force=True)
+    bulk_job_queue.put_nowait(job)
+    logger.info(f"📥 Queued bulk job {job.id} ({kind}) for {job.target}")
+    return job
+
+def resume_journaled_jobs() -> int:
+    """Requeue unfinished journaled jobs nobody is running, skipping the products they already confirmed"""
+    if job_journal is None:
+        return 0
+    resumed = 0
+    for entry in job_journal.claim_orphans():
+        job = BulkJob(entry["kind"], entry["shelf_id"], entry["token"], entry["params"], job_id=entry["job_id"])
+        job.created_at = entry["created_at"]
+        job.resumed = True
+        job.confirmed = {
+            product_id: status for product_id, status in job_journal.outcomes(job.id).items()
+            if status in ("updated", "skipped")
+        }
+        job.succeeded = sum(1 for status in job.confirmed.values() if status == "updated")
+        job.skipped = len(job.confirmed) - job.succeeded
+        job.processed = len(job.confirmed)
+        if not job.owner:
+            job.status = "failed"
+            job.error = "Job could not be resumed: its access token is gone"
+            job.finished_at = time.time()
+            job._run_cleanups()
+            job.persist(force=True)
+            continue
+        start_bulk_job_workers()
+        bulk_jobs[job.id] = job
+        job.persist(force=True)
+        bulk_job_queue.put_nowait(job)
+        resumed += 1
+        logger.info(f"♻️ Resuming bulk job {job.id} ({job.kind}, {job.target}) - "
+                    f"{len(job.confirmed)} products already confirmed")
+    job_journal.resumed += resumed
+    return resumed
+
+async def _maintain_job_journal():
+    while True:
+        try:
+            job_journal.heartbeat()
+            resume_journaled_jobs()
+            job_journal.purge_finished(BULK_JOB_RETENTION)
+        except sqlite3.Error as e:
+            logger.warning(f"Job journal maintenance failed: {e}")
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+
+def start_job_journal():
+    """Resume unfinished jobs now, then keep claims alive and pick up jobs of workers that died"""
+    global job_journal_task
+    if job_journal is not None and (job_journal_task is None or job_journal_task.done()):
+        job_journal_task = asyncio.create_task(_maintain_job_journal())
+
+async def stop_job_journal():
+    global job_journal_task
+    if job_journal_task is not None:
+        job_journal_task.cancel()
+        await asyncio.gather(job_journal_task, return_exceptions=True)
+        job_journal_task = None
+
+class ProfileCache:
+    """Per-token TTL cache for the /v3/users/me profile"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, tuple] = {}
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(token)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[token]
+        self.misses += 1
+        return None
+
+    def set(self, token: str, profile: Dict[str, Any]):
+        now = time.monotonic()
+        if len(self._entries) >= self.max_entries:
+            for expired in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[expired]
+            while len(self._entries) >= self.max_entries:
+                # Dicts keep insertion order, so this drops the oldest entry
+                del self._entries[next(iter(self._entries))]
+        self._entries[token] = (now + self.ttl, profile)
+
+    def invalidate(self, token: str):
+        self._entries.pop(token, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None
+        }
+
+profile_cache = ProfileCache(PROFILE_CACHE_TTL, PROFILE_CACHE_MAX_ENTRIES)
+
+async def get_user_profile(token: str) -> Dict[str, Any]:
+    """Return the /v3/users/me profile for a token, served from the cache while fresh"""
+    profile = profile_cache.get(token)
+    if profile is not None:
+        return profile
+
+    logger.info("🔍 Fetching user info from /v3/users/me")
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json"
+    }
+    response = await basalam_request("GET", f"{BASALAM_API_BASE}/v3/users/me", "profile", headers=headers)
+    if response.status_code != 200:
+        logger.error(f"❌ Failed to get user info: {response.status_code} - {response.text}")
+        raise HTTPException(status_code=response.status_code, detail="Failed to get user info")
+
+    profile = response.json()
+    profile_cache.set(token, profile)
+    return profile
+
+def extract_items(payload) -> List[Any]:
+    """Normalize an upstream list payload ({"data": [...]} or a bare list) to a list"""
+    if isinstance(payload, dict):
+        return payload.get("data") or []
+    if isinstance(payload, list):
+        return payload
+    return []
+
+class ShelfProductCache:
+    """LRU cache of shelf product payloads keyed by (token, shelf_id).
+
+    Fresh entries are served without any upstream call. Stale entries are
+    revalidated with If-None-Match / If-Modified-Since when Basalam sent
+    validators. Our own product PATCHes update or evict the entries that
+    contain the product, so the cache never hides a change we made.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        self.write_throughs = 0
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._product_index: Dict[Any, set] = {}
+
+    def lookup(self, key: tuple) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["fetched_at"] < self.ttl
+
+    def store(self, key: tuple, payload, etag: Optional[str], last_modified: Optional[str]):
+        self.invalidate(key)
+        products = extract_items(payload)
+        self._entries[key] = {
+            "payload": payload,
+            "products": products,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.monotonic()
+        }
+        for product in products:
+            if isinstance(product, dict) and product.get("id") is not None:
+                self._product_index.setdefault(product["id"], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self.invalidate(next(iter(self._entries)))
+            self.evictions += 1
+
+    def touch(self, key: tuple):
+        """Mark an entry fresh again after a 304 Not Modified"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry["fetched_at"] = time.monotonic()
+            self.revalidated += 1
+
+    def invalidate(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for product in entry["products"]:
+            if isinstance(product, dict):
+                keys = self._product_index.get(product.get("id"))
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._product_index[product.get("id")]
+
+    def update_product(self, product_id: Any, changes: Dict[str, Any]):
+        """Apply a successful PATCH to every cached copy of the product"""
+        for key in list(self._product_index.get(product_id, ())):
+            for product in self._entries[key]["products"]:
+                if isinstance(product, dict) and product.get("id") == product_id:
+                    product.update(changes)
+            self.write_throughs += 1
+
+    def invalidate_product(self, product_id: Any):
+        """Evict every cached shelf that contains the product"""
+        for key in list(self._product_index.get(product_id, ())):
+            self.invalidate(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+            "write_throughs": self.write_throughs
+        }
+
+shelf_cache = ShelfProductCache(SHELF_CACHE_TTL, SHELF_CACHE_MAX_ENTRIES)
+
+def _first_value(payload, *names):
+    """Look a pagination field up at the top level or in a nested meta/pagination object"""
+    if not isinstance(payload, dict):
+        return None
+    for container in (payload, payload.get("meta"), payload.get("pagination")):
+        if isinstance(container, dict):
+            for name in names:
+                if container.get(name) is not None:
+                    return container[name]
+    return None
+
+def _payload_total(payload) -> Optional[int]:
+    total = _first_value(payload, "total_count", "total", "count")
+    return total if isinstance(total, int) else None
+
+class ShelfProductPager:
+    """Stream a shelf's products, following upstream pagination.
+
+    Pages are downloaded ahead of the consumer into a small bounded buffer, so
+    work on earlier products overlaps with fetching later pages. Shelves of up
+    to SHELF_CACHE_MAX_PRODUCTS products are stored in the shelf cache once
+    fully read. Larger shelves are never held in memory as a whole.
+
+    Page-number, cursor and next-link pagination are understood. An upstream
+    that ignores the page parameters is detected and read as a single page.
+
+    start_page > 1 begins reading at that page; skipped then holds how many
+    products come before the first one yielded. Such a partial read is not cached.
+    """
+
+    def __init__(self, token: str, shelf_id: int, revalidate: bool = False, start_page: int = 1):
+        self.token = token
+        self.shelf_id = shelf_id
+        self.revalidate = revalidate
+        self.start_page = start_page
+        self.skipped = 0
+        self.total: Optional[int] = None
+        self.pages_fetched = 0
+        self.page_requests = 0  # every page GET sent upstream, including 304 revalidations
+        self.first_payload = None
+        self._iterator = None
+
+    def __aiter__(self):
+        self._iterator = self._iterate()
+        return self._iterator
+
+    async def aclose(self):
+        """Stop reading early and cancel any page downloads still in flight"""
+        if self._iterator is not None:
+            await self._iterator.aclose()
+
+    async def _iterate(self):
+        pages: asyncio.Queue = asyncio.Queue(maxsize=SHELF_PREFETCH_PAGES)
+        finished = object()
+
+        async def produce():
+            try:
+                async for page in self._fetch_pages():
+                    await pages.put(page)
+                await pages.put(finished)
+            except Exception as error:
+                await pages.put(error)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                page = await pages.get()
+                if page is finished:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                for product in page:
+                    yield product
+        finally:
+            producer.cancel()
+
+    def _use_cached(self, entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.first_payload = entry["payload"]
+        self.total = len(entry["products"])
+        self.skipped = min((self.start_page - 1) * SHELF_PAGE_SIZE, self.total)
+        return entry["products"][self.skipped:]
+
+    def _next_page(self, payload, products: List[Any], url: str, page_number: int, fetched: int):
+        """Return (url, params) for the following page, or None when the shelf is complete"""
+        if not products:
+            return None
+        if _first_value(payload, "has_more", "has_next") is False:
+            return None
+
+        next_link = _first_value(payload, "next", "next_page_url")
+        links = payload.get("links") if isinstance(payload, dict) else None
+        if not next_link and isinstance(links, dict):
+            next_link = links.get("next")
+        if isinstance(next_link, str) and next_link:
+            return urllib.parse.urljoin(url, next_link), None
+
+        cursor = _first_value(payload, "next_cursor", "cursor")
+        if isinstance(cursor, (str, int)) and cursor != "":
+            return url, {"cursor": cursor, SHELF_PAGE_SIZE_PARAM: SHELF_PAGE_SIZE}
+
+        next_params = {SHELF_PAGE_PARAM: page_number + 1, SHELF_PAGE_SIZE_PARAM: SHELF_PAGE_SIZE}
+        last_page = _first_value(payload, "total_page", "total_pages", "last_page", "page_count")
+        if isinstance(last_page, int):
+            return (url, next_params) if page_number < last_page else None
+        if self.total is not None:
+            return (url, next_params) if fetched < self.total else None
+
+        # No pagination metadata: only a full page can have a successor
+        if len(products) != SHELF_PAGE_SIZE:
+            return None
+        return url, next_params
+
+    async def _fetch_pages(self):
+        key = (self.token, self.shelf_id)
+        entry = shelf_cache.lookup(key)
+        if entry is not None and not self.revalidate and shelf_cache.is_fresh(entry):
+            shelf_cache.hits += 1
+            yield self._use_cached(entry)
+            return
+
+        base_url = f"{BASALAM_API_BASE}/api_v2/shelve/{self.shelf_id}/products"
+        url, params = base_url, {SHELF_PAGE_PARAM: self.start_page, SHELF_PAGE_SIZE_PARAM: SHELF_PAGE_SIZE}
+        page_number = self.start_page - 1
+        first_read = True
+        fetched = 0
+        previous_first_id = None
+        # Only a read from the first page holds the whole shelf
+        collected: Optional[List[Any]] = [] if self.start_page == 1 else None
+        validators = (None, None)
+
+        while True:
+            page_number += 1
+            headers = {
+                "Authorization": f"Bearer {self.token}",
+                "Accept": "application/json"
+            }
+            if page_number == 1 and entry is not None:
+                if entry["etag"]:
+                    headers["If-None-Match"] = entry["etag"]
+                if entry["last_modified"]:
+                    headers["If-Modified-Since"] = entry["last_modified"]
+
+            response = await basalam_request("GET", url, "products", params=params, headers=headers)
+            self.page_requests += 1
+            if response.status_code == 304 and page_number == 1 and entry is not None:
+                shelf_cache.touch(key)
+                yield self._use_cached(entry)
+                return
+            if response.status_code != 200:
+                logger.error(f"Failed to get products for shelf {self.shelf_id} (page {page_number}): {response.status_code} - {response.text}")
+                raise HTTPException(status_code=response.status_code, detail="Failed to get shelf products")
+
+            payload = response.json()
+            products = extract_items(payload)
+            if first_read:
+                first_read = False
+                shelf_cache.misses += 1
+                self.first_payload = payload
+                self.total = _payload_total(payload)
+                if page_number == 1:
+                    validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+                elif self._ignored_start_page(payload, products, page_number):
+                    # Paged by cursor or not at all: this is the start of the shelf
+                    page_number = 1
+                else:
+                    self.skipped = fetched = (page_number - 1) * SHELF_PAGE_SIZE
+                if not isinstance(payload, (dict, list)):
+                    logger.warning(f"Unexpected products data structure: {type(payload)}")
+
+            # An upstream that ignores paging keeps returning the first page
+            first_id = products[0].get("id") if products and isinstance(products[0], dict) else None
+            if page_number > 1 and first_id is not None and first_id == previous_first_id:
+                break
+            previous_first_id = first_id
+
+            self.pages_fetched += 1
+            fetched += len(products)
+            if collected is not None:
+                collected.extend(products)
+                if len(collected) > SHELF_CACHE_MAX_PRODUCTS:
+                    collected = None
+            yield products
+
+            next_page = self._next_page(payload, products, url, page_number, fetched)
+            if next_page is None:
+                break
+            url, params = next_page
+
+        if collected is not None:
+            if self.pages_fetched == 1:
+                shelf_cache.store(key, self.first_payload, *validators)
+            else:
+                # Validators only describe the first page, so a merged shelf is refetched once stale
+                shelf_cache.store(key, {"data": collected}, None, None)
+        elif self.start_page == 1:
+            shelf_cache.invalidate(key)
+        if self.total is None:
+            self.total = fetched
+
+    @staticmethod
+    def _ignored_start_page(payload, products: List[Any], page_number: int) -> bool:
+        """Whether a request for a later page was answered with the start of the shelf"""
+        current_page = _first_value(payload, "page", "current_page")
+        if isinstance(current_page, int):
+            return current_page != page_number
+        return len(products) > SHELF_PAGE_SIZE
+
+class MultiShelfProducts:
+    """Stream the products of several shelves as one de-duplicated set.
+
+    Shelves are read concurrently (up to MULTI_SHELF_MAX_CONCURRENCY at a time)
+    through their own pagers and merged as products arrive. A product that sits
+    on more than one shelf is yielded only once. A shelf that cannot be read is
+    recorded in shelf_errors and the other shelves carry on.
+    """
+
+    def __init__(self, token: str, shelf_ids: List[int], revalidate: bool = False):
+        self.token = token
+        self.shelf_ids = shelf_ids
+        self.revalidate = revalidate
+        self.total: Optional[int] = None
+        self.duplicates = 0
+        self.pages_fetched = 0
+        self.page_requests = 0
+        self.shelf_errors: Dict[int, str] = {}
+        self._iterator = None
+
+    def __aiter__(self):
+        self._iterator = self._iterate()
+        return self._iterator
+
+    async def aclose(self):
+        """Stop reading early and cancel the shelf readers still running"""
+        if self._iterator is not None:
+            await self._iterator.aclose()
+
+    async def _iterate(self):
+        products: asyncio.Queue = asyncio.Queue(maxsize=SHELF_PAGE_SIZE)
+        finished = object()
+        semaphore = asyncio.Semaphore(MULTI_SHELF_MAX_CONCURRENCY)
+
+        async def read_shelf(shelf_id: int):
+            pager = ShelfProductPager(self.token, shelf_id, revalidate=self.revalidate)
+            cancelled = False
+            try:
+                async with semaphore:
+                    async for product in pager:
+                        await products.put(product)
+            except Exception as error:
+                # Includes malformed pages (ValueError, KeyError): only this shelf is lost
+                detail = error.detail if isinstance(error, HTTPException) else str(error) or type(error).__name__
+                logger.warning(f"Failed to read shelf {shelf_id} for a multi-shelf update: {detail}")
+                self.shelf_errors[shelf_id] = detail
+            except asyncio.CancelledError:
+                # The consumer went away; nobody is waiting for this shelf any more
+                cancelled = True
+                raise
+            finally:
+                try:
+                    self.pages_fetched += pager.pages_fetched
+                    self.page_requests += pager.page_requests
+                    await pager.aclose()
+                finally:
+                    # Every shelf is counted off, or the consumer would wait for it forever
+                    if not cancelled:
+                        await products.put(finished)
+
+        readers = [asyncio.create_task(read_shelf(shelf_id)) for shelf_id in self.shelf_ids]
+        seen = set()
+        remaining = len(readers)
+        try:
+            while remaining:
+                product = await products.get()
+                if product is finished:
+                    remaining -= 1
+                    continue
+                if isinstance(product, dict) and product.get("id"):
+                    if product["id"] in seen:
+                        self.duplicates += 1
+                        continue
+                    seen.add(product["id"])
+                yield product
+            self.total = len(seen)
+        finally:
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+
+def open_shelf_products(token: str, shelf_ids: List[int], revalidate: bool = False):
+    """A pager for one shelf, or a merged de-duplicated stream for several"""
+    if len(shelf_ids) == 1:
+        return ShelfProductPager(token, shelf_ids[0], revalidate=revalidate)
+    return MultiShelfProducts(token, shelf_ids, revalidate=revalidate)
+
+async def fetch_shelf_preview(token: str, shelf_id: int, size: int):
+    """Return (product_count, first `size` products) without keeping the whole shelf.
+
+    A shelf read only partly never reaches the listing cache, so the preview and
+    its count are cached on their own under (token, shelf_id, "preview").
+    """
+    preview_key = (token, shelf_id, "preview")
+    for key in ((token, shelf_id), preview_key):
+        entry = shelf_cache.lookup(key)
+        if entry is None or not shelf_cache.is_fresh(entry):
+            continue
+        count = entry["payload"].get("total_count", len(entry["products"])) if key == preview_key else len(entry["products"])
+        # A cached preview only answers when it holds enough products (or the whole shelf)
+        if key != preview_key or len(entry["products"]) >= min(size, count):
+            shelf_cache.hits += 1
+            return count, entry["products"][:size]
+
+    pager = ShelfProductPager(token, shelf_id)
+    preview = []
+    count = 0
+    async for product in pager:
+        count += 1
+        if len(preview) < size:
+            preview.append(product)
+        if len(preview) >= size and pager.total is not None:
+            count = pager.total
+            break
+    await pager.aclose()
+    if shelf_cache.lookup((token, shelf_id)) is None:
+        shelf_cache.store(preview_key, {"data": preview, "total_count": count}, None, None)
+    return count, preview
+
+async def iter_job_products(job: "BulkJob", pager: ShelfProductPager, needs_update=None):
+    """Yield a pager's updatable products while keeping the job's total up to date.
+
+    Products for which the coroutine needs_update(product) returns false are counted as skipped
+    and never reach the dispatcher. Products a resumed job already confirmed are
+    passed over without being counted again.
+    """
+    count = 0
+    async for product in pager:
+        if job.total is None and pager.total is not None:
+            job.total = pager.total
+        if isinstance(product, dict) and product.get("id"):
+            count += 1
+            if product["id"] in job.confirmed:
+                continue
+            if needs_update is not None and not await needs_update(product):
+                job.skip(product["id"])
+                continue
+            yield product
+    job.total = count
+
+def photo_fingerprint(photo) -> Optional[str]:
+    """Something that identifies a product photo: its ID, else its largest URL"""
+    if not isinstance(photo, dict):
+        return None
+    for key in ("id", "original", "large", "medium", "small", "extra_small"):
+        if photo.get(key):
+            return str(photo[key])
+    return None
+
+class ImageUploadHistory:
+    """Which image content (by SHA-256) we last put on each product, and the photo Basalam gave it"""
+
+    # Records between two trims of the store down to max_entries
+    TRIM_INTERVAL = 1000
+
+    def __init__(self, store, ttl: float, max_entries: int):
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+
+    def record(self, product_id: Any, content_hash: str, fingerprint: Optional[str]):
+        if fingerprint is None:
+            # Without the photo Basalam made there is nothing to recognise it by later
+            self.store.delete(str(product_id))
+            return
+        self.store.set(str(product_id), {"sha256": content_hash, "photo": fingerprint}, self.ttl)
+        self._writes += 1
+        if self._writes % self.TRIM_INTERVAL == 0:
+            self.store.trim(self.max_entries)
+
+    def has_image(self, product: Dict[str, Any], content_hash: str) -> bool:
+        """True when the product still shows the exact photo we created from this content"""
+        entry = self.store.get(str(product.get("id")))
+        if entry is None or entry["sha256"] != content_hash:
+            return False
+        current = photo_fingerprint(product.get("photo"))
+        return current is not None and current == entry["photo"]
+
+image_upload_history = ImageUploadHistory(
+    SQLiteSessionStore(JOB_JOURNAL_PATH, "image_upload_history") if job_journal is not None
+    else create_session_store("image_upload_history"),
+    IMAGE_HISTORY_TTL, IMAGE_HISTORY_MAX_ENTRIES
+)
+
+def description_changes(product: Dict[str, Any], description: str) -> bool:
+    return product.get("description") != description
+
+def bounded_value(value):
+    """Refuse a string or sequence longer than DESCRIPTION_MAX_LENGTH"""
+    if isinstance(value, (str, list, tuple)) and len(value) > DESCRIPTION_MAX_LENGTH:
+        raise SecurityError(f"value longer than {DESCRIPTION_MAX_LENGTH}")
+    return value
+
+# Methods and filters whose number arguments set the width of what they return
+WIDENING_CALLS = {"ljust", "rjust", "center", "zfill", "expandtabs", "indent", "wordwrap"}
+FORMATTING_CALLS = {"format", "format_map"}
+
+def bounded_width(args, kwargs):
+    """Refuse a width above DESCRIPTION_MAX_LENGTH, as in center(10**9)"""
+    for value in (*args, *kwargs.values()):
+        if isinstance(value, int) and abs(value) > DESCRIPTION_MAX_LENGTH:
+            raise SecurityError(f"width larger than {DESCRIPTION_MAX_LENGTH}")
+
+def bounded_format(spec, args=(), kwargs=None):
+    """Refuse a format string with a width or precision above DESCRIPTION_MAX_LENGTH, as in "%0999999999d" """
+    if not isinstance(spec, str):
+        return
+    if any(int(number) > DESCRIPTION_MAX_LENGTH for number in re.findall(r"\d+", spec)):
+        raise SecurityError(f"format width larger than {DESCRIPTION_MAX_LENGTH}")
+    if "*" in spec or re.search(r"\{[^{}]*\{", spec):
+        # Widths passed as arguments ("%*d", "{:{}}")
+        bounded_width(args if isinstance(args, tuple) else (args,), kwargs or {})
+
+def bounded_filter(name: str, function):
+    """Wrap a filter so its widths and its result stay within DESCRIPTION_MAX_LENGTH"""
+    def call(*args, **kwargs):
+        values = args[1:] if getattr(function, "jinja_pass_arg", None) else args
+        if name in WIDENING_CALLS:
+            bounded_width(values[1:], kwargs)
+        elif name in FORMATTING_CALLS and values:
+            bounded_format(values[0], values[1:], kwargs)
+        return bounded_value(function(*args, **kwargs))
+    if hasattr(function, "jinja_pass_arg"):
+        call.jinja_pass_arg = function.jinja_pass_arg
+    return call
+
+def bounded_replace(value, old, new, count=None):
+    value, old, new = str(value), str(old), str(new)
+    occurrences = value.count(old) if old else len(value) + 1
+    if count is not None:
+        occurrences = min(occurrences, count)
+    if len(value) + occurrences * (len(new) - len(old)) > DESCRIPTION_MAX_LENGTH:
+        raise SecurityError(f"value longer than {DESCRIPTION_MAX_LENGTH}")
+    return value.replace(old, new, -1 if count is None else count)
+
+def bounded_range(*args):
+    values = range(*args)
+    if len(values) > DESCRIPTION_MAX_LENGTH:
+        raise SecurityError(f"range longer than {DESCRIPTION_MAX_LENGTH}")
+    return values
+
+class DescriptionCodeGenerator(CodeGenerator):
+    """Routes the ~ operator through a size check, like every other way of growing a string"""
+
+    def visit_Concat(self, node, frame):
+        self.write("environment.concat((")
+        for arg in node.nodes:
+            self.visit(arg, frame)
+            self.write(", ")
+        self.write("))")
+
+class DescriptionEnvironment(SandboxedEnvironment):
+    """Jinja's sandbox with every value capped at DESCRIPTION_MAX_LENGTH.
+
+    The sandbox stops access to Python internals and caps range(); this also caps
+    string and sequence growth through operators, filters and method calls, so a
+    template cannot run the worker out of memory.
+    """
+
+    code_generator_class = DescriptionCodeGenerator
+    intercepted_binops = frozenset(["*", "+", "**", "%"])
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.filters = {name: bounded_filter(name, function) for name, function in self.filters.items()}
+        self.filters["replace"] = bounded_filter("replace", bounded_replace)
+        self.globals["range"] = bounded_range
+
+    def call_binop(self, context, operator, left, right):
+        if operator == "*":
+            for sequence, times in ((left, right), (right, left)):
+                if isinstance(sequence, (str, list, tuple)) and isinstance(times, int):
+                    if len(sequence) * times > DESCRIPTION_MAX_LENGTH:
+                        raise SecurityError(f"value longer than {DESCRIPTION_MAX_LENGTH}")
+        elif operator == "**" and isinstance(right, (int, float)) and abs(right) > 100:
+            raise SecurityError("exponent larger than 100")
+        elif operator == "%":
+            bounded_format(left, right)
+        return bounded_value(super().call_binop(context, operator, left, right))
+
+    def call(__self, __context, __obj, *args, **kwargs):
+        if isinstance(getattr(__obj, "__self__", None), str):
+            if __obj.__name__ in WIDENING_CALLS:
+                bounded_width(args, kwargs)
+            elif __obj.__name__ in FORMATTING_CALLS:
+                bounded_format(__obj.__self__, args, kwargs)
+        return bounded_value(super().call(__context, __obj, *args, **kwargs))
+
+    def concat(self, values) -> str:
+        if sum(len(str(value)) for value in values) > DESCRIPTION_MAX_LENGTH:
+            raise SecurityError(f"value longer than {DESCRIPTION_MAX_LENGTH}")
+        return "".join(str(value) for value in values)
+
+# Same Jinja engine as templates/, sandboxed because sellers write these; missing fields and None render empty
+description_env = DescriptionEnvironment(keep_trailing_newline=True,
+                                         finalize=lambda value: "" if value is None else value)
+
+# Templates render here, never on the event loop
+description_render_executor = ThreadPoolExecutor(max_workers=DESCRIPTION_RENDER_WORKERS,
+                                                 thread_name_prefix="description-render")
+
+class DescriptionTemplate:
+    """A bulk description, compiled once per job and rendered for each product.
+
+    Product fields are template variables ({{ title }}, {{ price }}, {{ category.title }}),
+    and the whole product is also available as {{ product }}. Text without {{ or {% is
+    sent as-is without touching the engine, so a lone {# (a color code) is not a comment.
+    """
+
+    MARKUP = ("{{", "{%")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.variables: List[str] = []
+        self._template = None
+        if any(marker in source for marker in self.MARKUP):
+            if len(source) > DESCRIPTION_TEMPLATE_MAX_LENGTH:
+                raise TemplateSyntaxError(f"template is longer than {DESCRIPTION_TEMPLATE_MAX_LENGTH} characters", 1)
+            # Raises TemplateSyntaxError for a broken template
+            parsed = description_env.parse(source)
+            self.variables = sorted(meta.find_undeclared_variables(parsed))
+            self._template = description_env.from_string(parsed)
+
+    @property
+    def is_literal(self) -> bool:
+        return self._template is None
+
+    def render(self, product: Dict[str, Any]) -> str:
+        """Render for one product, within DESCRIPTION_MAX_LENGTH and DESCRIPTION_RENDER_TIMEOUT.
+
+        Blocks for up to the timeout, so call it off the event loop (render_description).
+        """
+        if self._template is None:
+            return self.source
+        deadline = time.monotonic() + DESCRIPTION_RENDER_TIMEOUT
+
+        # Loops in template code are checked against the deadline on every iteration
+        def trace_template_lines(frame, event, arg):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"rendering took longer than {DESCRIPTION_RENDER_TIMEOUT:g}s")
+            return trace_template_lines
+
+        def trace_calls(frame, event, arg):
+            return trace_template_lines if frame.f_code.co_filename == "<template>" else None
+
+        previous_trace = sys.gettrace()
+        sys.settrace(trace_calls)
+        try:
+            chunks = []
+            length = 0
+            for chunk in self._template.generate({**product, "product": product}):
+                length += len(chunk)
+                if length > DESCRIPTION_MAX_LENGTH:
+                    raise SecurityError(f"description longer than {DESCRIPTION_MAX_LENGTH} characters")
+                chunks.append(chunk)
+            return "".join(chunks)
+        finally:
+            sys.settrace(previous_trace)
+
+def compile_description(description: str) -> DescriptionTemplate:
+    """Compile a description from a request, answering 400 for a broken template"""
+    try:
+        return DescriptionTemplate(description)
+    except TemplateSyntaxError as error:
+        raise HTTPException(status_code=400, detail=f"Description template error on line {error.lineno}: {error.message}")
+
+async def render_description(template: DescriptionTemplate, product: Dict[str, Any]):
+    """The product's rendered description, or the exception a failing template raised"""
+    if template.is_literal:
+        return template.source
+    loop = asyncio.get_running_loop()
+    try:
+        # render() stops itself at the deadline; the extra second only covers a stuck thread pool
+        return await asyncio.wait_for(
+            loop.run_in_executor(description_render_executor, template.render, product),
+            DESCRIPTION_RENDER_TIMEOUT + 1
+        )
+    except Exception as error:
+        return RuntimeError(f"Description template error: {error or f'rendering took longer than {DESCRIPTION_RENDER_TIMEOUT:g}s'}")
+
+def image_changes(product: Dict[str, Any], content_hash: str) -> bool:
+    return not image_upload_history.has_image(product, content_hash)
+
+def product_card(product: Dict[str, Any]) -> Dict[str, Any]:
+    """The product fields the dashboard shows on a card"""
+    photo = product.get("photo") if isinstance(product.get("photo"), dict) else {}
+    images = product.get("images") if isinstance(product.get("images"), list) else []
+    return {
+        "id": product.get("id"),
+        "title": product.get("title"),
+        "name": product.get("name"),
+        "price": product.get("price"),
+        "photo": {size: photo.get(size) for size in ("medium", "large", "small", "extra_small") if photo.get(size)},
+        "image": product.get("image"),
+        "images": images[:1]
+    }
 
-# Store tokens and state temporarily (in production, use proper storage)
-user_tokens = {}
-user_states = {}
+def compile_fields(fields: str) -> Optional[Dict[str, Any]]:
+    """Turn "id,title,photo.medium" into a projection tree; None means whole objects ("*")"""
+    fields = fields.strip()
+    if fields == "*":
+        return None
+    tree: Dict[str, Any] = {}
+    for path in fields.split(","):
+        parts = path.strip().split(".")
+        if not all(parts):
+            raise HTTPException(status_code=400, detail=f"Invalid field path: {path.strip()!r}")
+        node = tree
+        for part in parts[:-1]:
+            child = node.get(part, {})
+            if child is None:
+                break  # a parent path already selects the whole value
+            node = node.setdefault(part, child)
+        else:
+            node[parts[-1]] = None
+    return tree
+
+def project(value: Any, tree: Optional[Dict[str, Any]]) -> Any:
+    """Keep only the fields in the projection tree; lists are projected item by item, missing fields are left out"""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return None
+    projected = {}
+    for key, subtree in tree.items():
+        if key in value:
+            projected[key] = project(value[key], subtree)
+    return projected
+
+def failure_summary(outcome) -> str:
+    """Short reason a product failed: the exception, or the status code and Basalam's message"""
+    if isinstance(outcome, Exception):
+        return str(outcome)[:JOB_EVENT_ERROR_LENGTH]
+    message = None
+    try:
+        body = outcome.json()
+        if isinstance(body, dict):
+            message = body.get("message") or body.get("detail") or body.get("error")
+    except ValueError:
+        pass
+    if not isinstance(message, str):
+        message = outcome.text
+    return f"{outcome.status_code}: {message}"[:JOB_EVENT_ERROR_LENGTH]
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_job_events(job: "BulkJob"):
+    """Server-Sent Events for one job: per-product events, periodic summaries and a final done event"""
+    queue = job.subscribe()
+    try:
+        yield format_sse("summary", job.snapshot(include_result=False))
+        if job.finished:
+            yield format_sse("done", job.snapshot())
+            return
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=JOB_EVENT_SUMMARY_INTERVAL)
+            except asyncio.TimeoutError:
+                if job.finished:
+                    # Also ends streams whose done event never arrived
+                    yield format_sse("done", job.snapshot())
+                    return
+                yield format_sse("summary", job.snapshot(include_result=False))
+                continue
+            yield format_sse(event, data)
+            if event == "done":
+                return
+    finally:
+        job.unsubscribe(queue)
+
+def get_owned_job(job_id: str, token: str) -> Optional[BulkJob]:
+    """The job if this process runs it, None if another worker does; 404 if the user has no such job"""
+    job = bulk_jobs.get(job_id)
+    if job is not None:
+        if job.owner != token:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+    get_shared_job_snapshot(job_id, token)
+    return None
+
+def get_shared_job_snapshot(job_id: str, token: str) -> Dict[str, Any]:
+    """Last progress snapshot a worker process shared for the job, else the one in the job journal"""
+    record = job_store.get(job_id)
+    if record is None and job_journal is not None:
+        record = job_journal.get(job_id)
+    if record is None or record["owner"] != owner_fingerprint(token):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return record["snapshot"]
+
+async def stream_shared_job_events(job_id: str, token: str):
+    """Server-Sent Events for a job running in another worker process, built from its shared snapshots"""
+    while True:
+        snapshot = get_shared_job_snapshot(job_id, token)
+        if snapshot["status"] in BulkJob.FINISHED_STATUSES:
+            yield format_sse("done", snapshot)
+            return
+        snapshot.pop("result", None)
+        yield format_sse("summary", snapshot)
+        await asyncio.sleep(JOB_EVENT_SUMMARY_INTERVAL)
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -77,18 +2899,12 @@ async def home(request: Request):
 @app.get("/auth/login")
 async def login():
     """Redirect to Basalam OAuth"""
-    import secrets
-    import uuid
-
     # Generate unique session ID and state for security
     session_id = str(uuid.uuid4())
     state = secrets.token_urlsafe(24)
 
-    # Store state with session ID for tracking
-    user_states[session_id] = {
-        "state": state,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    # Store state with session ID for tracking (shared by all workers)
+    oauth_state_store.add(state, session_id)
 
     # Normalize scope to ensure proper space separation (no plus signs)
     scope = BASALAM_SCOPE.replace(",", " ").replace("+", " ").strip()
@@ -127,536 +2943,803 @@ async def auth_callback(request: Request, code: str = None, state: str = None, e
 
     # Handle both new format (session_id:state) and old format (just state)
     if ":" in state:
-        # New format with session ID
         session_id, received_state = state.split(":", 1)
-        expected_data = user_states.get(session_id)
-        if not expected_data:
-            logger.error(f"Session not found: {session_id}")
-            raise HTTPException(status_code=400, detail="Session not found")
-        expected_state = expected_data["state"]
     else:
-        # Old format - check all stored states
-        received_state = state
-        expected_state = None
-        for session_data in user_states.values():
-            if session_data["state"] == received_state:
-                expected_state = received_state
-                break
+        session_id, received_state = None, state
 
-        if not expected_state:
-            logger.error(f"State not found in any session: {received_state}")
-            raise HTTPException(status_code=400, detail="Invalid state parameter")
+    # States are stored by token, so one lookup validates and consumes either format
+    pending = oauth_state_store.consume(received_state)
+    if not pending:
+        logger.error(f"State not found or expired: {received_state}")
+        raise HTTPException(status_code=400, detail="Invalid state parameter")
 
-    if received_state != expected_state:
-        logger.error(f"State mismatch - Expected: {expected_state}, Received: {received_state}")
+    if session_id is not None and pending["session_id"] != session_id:
+        logger.error(f"State mismatch - Expected session: {pending['session_id']}, Received: {session_id}")
         raise HTTPException(status_code=400, detail="Invalid state parameter")
 
     logger.info("State validation successful")
 
     # Exchange code for token using correct method
-    async with httpx.AsyncClient(timeout=30) as client:
-        token_url = BASALAM_TOKEN_URL
-        payload = {
-            "grant_type": "authorization_code",
-            "code": code,
-            "client_id": BASALAM_CLIENT_ID,
-            "client_secret": BASALAM_CLIENT_SECRET,
-            "redirect_uri": BASALAM_REDIRECT_URI,
-        }
+    token_url = BASALAM_TOKEN_URL
+    payload = {
+        "grant_type": "authorization_code",
+        "code": code,
+        "client_id": BASALAM_CLIENT_ID,
+        "client_secret": BASALAM_CLIENT_SECRET,
+        "redirect_uri": BASALAM_REDIRECT_URI,
+    }
 
-        headers = {"Content-Type": "application/json", "Accept": "application/json"}
-        logger.info(f"Sending token exchange request to: {token_url}")
-        response = await client.post(token_url, json=payload, headers=headers)
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    logger.info(f"Sending token exchange request to: {token_url}")
+    response = await basalam_request("POST", token_url, "token", json=payload, headers=headers)
 
-        logger.info(f"Token exchange response status: {response.status_code}")
+    logger.info(f"Token exchange response status: {response.status_code}")
 
-        if response.status_code != 200:
-            logger.error(f"Token exchange failed: {response.text}")
-            raise HTTPException(status_code=400, detail=f"Failed to get access token: {response.text}")
+    if response.status_code != 200:
+        logger.error(f"Token exchange failed: {response.text}")
+        raise HTTPException(status_code=400, detail=f"Failed to get access token: {response.text}")
 
-        token_info = response.json()
-        access_token = token_info.get("access_token")
+    token_info = response.json()
+    access_token = token_info.get("access_token")
 
-        if not access_token:
-            logger.error(f"No access token in response: {token_info}")
-            raise HTTPException(status_code=400, detail="No access token in response")
+    if not access_token:
+        logger.error(f"No access token in response: {token_info}")
+        raise HTTPException(status_code=400, detail="No access token in response")
 
-        # Store token (in production, use proper storage with user sessions)
-        user_tokens["current_user"] = access_token
+    # A new login replaces this browser's previous session and its cached profile
+    previous_session_id = request.cookies.get(SESSION_COOKIE_NAME)
+    if previous_session_id:
+        previous_session = session_store.get(previous_session_id)
+        if previous_session:
+            profile_cache.invalidate(previous_session.get("access_token"))
+        session_store.delete(previous_session_id)
 
-        # Clean up state after successful authentication
-        if ":" in state:
-            # New format with session ID
-            session_id, _ = state.split(":", 1)
-            if session_id in user_states:
-                del user_states[session_id]
-        else:
-            # Old format - find and remove the state from any session
-            for session_id, session_data in list(user_states.items()):
-                if session_data["state"] == received_state:
-                    del user_states[session_id]
-                    break
+    # Store the token under a fresh session ID; the ID in the OAuth state was visible in URLs
+    new_session_id = secrets.token_urlsafe(32)
+    session_store.set(new_session_id, {
+        "access_token": access_token,
+        "created_at": datetime.utcnow().isoformat()
+    }, SESSION_TTL)
 
-        logger.info("OAuth authentication successful - Token obtained and stored")
-        return RedirectResponse("/dashboard")
+    logger.info("OAuth authentication successful - Token obtained and stored")
+    response = RedirectResponse("/dashboard")
+    set_session_cookie(response, new_session_id)
+    return response
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request):
     """Dashboard showing shelves and products"""
     return templates.TemplateResponse("dashboard.html", {"request": request})
 
+@app.get("/auth/logout")
+async def logout(request: Request):
+    """End the session and forget its token and cached profile"""
+    session_id = request.cookies.get(SESSION_COOKIE_NAME)
+    session = session_store.get(session_id) if session_id else None
+    if session:
+        profile_cache.invalidate(session.get("access_token"))
+        logger.info("👋 User logged out - session and cached profile removed")
+    if session_id:
+        session_store.delete(session_id)
+
+    response = RedirectResponse("/")
+    response.delete_cookie(SESSION_COOKIE_NAME, path="/")
+    return response
+
 @app.get("/api/user/me")
-async def get_user_info():
+async def get_user_info(request: Request):
     """Get current user information"""
-    token = user_tokens.get("current_user")
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/json"
-        }
-
-        response = await client.get(f"{BASALAM_API_BASE}/v3/users/me", headers=headers)
-
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Failed to get user info")
+    token = require_token(request)
 
-        user_data = response.json()
-        logger.info(f"📋 User info API called - Vendor ID: {user_data.get('vendor', {}).get('id')}")
-        return user_data
+    user_data = await get_user_profile(token)
+    logger.info(f"📋 User info API called - Vendor ID: {user_data.get('vendor', {}).get('id')}")
+    return user_data
 
 @app.get("/api/debug/user-info")
-async def debug_user_info():
+async def debug_user_info(request: Request):
     """Debug endpoint to see raw user info structure"""
-    token = user_tokens.get("current_user")
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    token = require_token(request)
 
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/json"
-        }
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json"
+    }
 
-        response = await client.get(f"{BASALAM_API_BASE}/v3/users/me", headers=headers)
+    response = await basalam_request("GET", f"{BASALAM_API_BASE}/v3/users/me", "profile", headers=headers)
 
-        if response.status_code != 200:
-            return {
-                "error": "Failed to get user info",
-                "status_code": response.status_code,
-                "response_text": response.text
-            }
-
-        user_data = response.json()
+    if response.status_code != 200:
         return {
-            "user_id": user_data.get("id"),
-            "user_name": user_data.get("name"),
-            "vendor_object": user_data.get("vendor", {}),
-            "vendor_id": user_data.get("vendor", {}).get("id"),
-            "vendor_title": user_data.get("vendor", {}).get("title"),
-            "full_response": user_data
+            "error": "Failed to get user info",
+            "status_code": response.status_code,
+            "response_text": response.text
         }
 
-@app.get("/api/shelves")
-async def get_user_shelves():
-    """Get user shelves using vendor ID"""
-    token = user_tokens.get("current_user")
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/json"
-        }
+    user_data = response.json()
+    return {
+        "user_id": user_data.get("id"),
+        "user_name": user_data.get("name"),
+        "vendor_object": user_data.get("vendor", {}),
+        "vendor_id": user_data.get("vendor", {}).get("id"),
+        "vendor_title": user_data.get("vendor", {}).get("title"),
+        "full_response": user_data
+    }
 
-        # First get user info to get vendor ID
-        logger.info("🔍 Fetching user info from /v3/users/me to get vendor ID")
-        user_response = await client.get(f"{BASALAM_API_BASE}/v3/users/me", headers=headers)
-        if user_response.status_code != 200:
-            logger.error(f"❌ Failed to get user info: {user_response.status_code} - {user_response.text}")
-            raise HTTPException(status_code=user_response.status_code, detail="Failed to get user info")
-
-        user_data = user_response.json()
-        logger.info(f"✅ User data received: {user_data}")
-
-        # Extract vendor ID safely with detailed error handling
-        vendor = user_data.get("vendor", {})
-        vendor_id = vendor.get("id") if vendor else None
-
-        logger.info(f"📋 Vendor object: {vendor}")
-        logger.info(f"🎯 Extracted vendor ID: {vendor_id}")
-        logger.info(f"👤 User ID (for comparison): {user_data.get('id')}")
-        logger.info(f"📊 Vendor ID type: {type(vendor_id)}")
-
-        # Additional debugging for vendor object structure
-        if isinstance(vendor, dict):
-            logger.info(f"📋 Vendor keys: {list(vendor.keys())}")
-            for key, value in vendor.items():
-                logger.info(f"   {key}: {value} (type: {type(value)})")
-
-        if not vendor_id:
-            logger.error(f"❌ No vendor ID found in user data")
-            logger.error(f"   Vendor object: {vendor}")
-            logger.error(f"   Vendor object type: {type(vendor)}")
-            logger.error(f"   Full user data keys: {list(user_data.keys())}")
-            logger.error(f"   User ID: {user_data.get('id')}")
-
-            # Try fallback: use user ID if vendor ID is missing (for debugging)
-            user_id = user_data.get("id")
-            logger.warning(f"⚠️ Trying fallback with user ID: {user_id}")
-
-            # For debugging, let's try the user ID first to see what error we get
-            fallback_url = f"{BASALAM_API_BASE}/api_v2/shelve/list/{user_id}"
-            logger.info(f"🧪 Testing fallback with user ID: {fallback_url}")
-
-            fallback_response = await client.get(fallback_url, headers=headers)
-            logger.info(f"🧪 Fallback response status: {fallback_response.status_code}")
-
-            if fallback_response.status_code == 200:
-                logger.info("✅ Fallback with user ID worked! This suggests the issue is with vendor ID extraction")
-                logger.info("📝 The user might not have vendor privileges, or the vendor ID field structure is different")
-                # Return the fallback result for now
-                return fallback_response.json()
-            else:
-                logger.info(f"❌ Fallback also failed: {fallback_response.text}")
-
-            raise HTTPException(
-                status_code=400,
-                detail="Could not get vendor ID from user info. " +
-                      f"Vendor object: {vendor}. " +
-                      f"Available user data keys: {list(user_data.keys())}. " +
-                      f"User ID: {user_id}. " +
-                      f"Fallback test status: {fallback_response.status_code}"
-            )
+async def fetch_vendor_shelves(token: str):
+    """Get the shelves payload for the token's vendor, resolving the vendor ID from the profile"""
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Accept": "application/json"
+    }
 
-        # Verify we're using vendor ID, not user ID
+    # First get user info (cached per token) to get vendor ID
+    user_data = await get_user_profile(token)
+    logger.info(f"✅ User data received: {user_data}")
+
+    # Extract vendor ID safely with detailed error handling
+    vendor = user_data.get("vendor", {})
+    vendor_id = vendor.get("id") if vendor else None
+
+    logger.info(f"📋 Vendor object: {vendor}")
+    logger.info(f"🎯 Extracted vendor ID: {vendor_id}")
+    logger.info(f"👤 User ID (for comparison): {user_data.get('id')}")
+    logger.info(f"📊 Vendor ID type: {type(vendor_id)}")
+
+    # Additional debugging for vendor object structure
+    if isinstance(vendor, dict):
+        logger.info(f"📋 Vendor keys: {list(vendor.keys())}")
+        for key, value in vendor.items():
+            logger.info(f"   {key}: {value} (type: {type(value)})")
+
+    if not vendor_id:
+        logger.error(f"❌ No vendor ID found in user data")
+        logger.error(f"   Vendor object: {vendor}")
+        logger.error(f"   Vendor object type: {type(vendor)}")
+        logger.error(f"   Full user data keys: {list(user_data.keys())}")
+        logger.error(f"   User ID: {user_data.get('id')}")
+
+        # Try fallback: use user ID if vendor ID is missing (for debugging)
         user_id = user_data.get("id")
-        if vendor_id == user_id:
-            logger.warning("⚠️ Vendor ID equals User ID - this might be the issue!")
+        logger.warning(f"⚠️ Trying fallback with user ID: {user_id}")
 
-        logger.info(f"🔄 Using vendor ID: {vendor_id} for shelves API (NOT user ID: {user_id})")
+        # For debugging, let's try the user ID first to see what error we get
+        fallback_url = f"{BASALAM_API_BASE}/api_v2/shelve/list/{user_id}"
+        logger.info(f"🧪 Testing fallback with user ID: {fallback_url}")
 
-        # Get shelves using vendor ID
-        shelves_url = f"{BASALAM_API_BASE}/api_v2/shelve/list/{vendor_id}"
-        logger.info(f"📡 Requesting shelves from: {shelves_url}")
+        fallback_response = await basalam_request("GET", fallback_url, "shelves", headers=headers)
+        logger.info(f"🧪 Fallback response status: {fallback_response.status_code}")
 
-        shelves_response = await client.get(shelves_url, headers=headers)
-        logger.info(f"📥 Shelves API response status: {shelves_response.status_code}")
+        if fallback_response.status_code == 200:
+            logger.info("✅ Fallback with user ID worked! This suggests the issue is with vendor ID extraction")
+            logger.info("📝 The user might not have vendor privileges, or the vendor ID field structure is different")
+            # Return the fallback result for now
+            return fallback_response.json()
+        else:
+            logger.info(f"❌ Fallback also failed: {fallback_response.text}")
 
-        if shelves_response.status_code != 200:
-            logger.error(f"❌ Failed to get shelves: {shelves_response.status_code} - {shelves_response.text}")
-            raise HTTPException(status_code=shelves_response.status_code, detail=f"Failed to get shelves: {shelves_response.text}")
+        raise HTTPException(
+            status_code=400,
+            detail="Could not get vendor ID from user info. " +
+                  f"Vendor object: {vendor}. " +
+                  f"Available user data keys: {list(user_data.keys())}. " +
+                  f"User ID: {user_id}. " +
+                  f"Fallback test status: {fallback_response.status_code}"
+        )
 
-        shelves_data = shelves_response.json()
-        logger.info(f"✅ Shelves data received successfully: {len(shelves_data) if isinstance(shelves_data, list) else 'N/A'} items")
-        return shelves_data
+    # Verify we're using vendor ID, not user ID
+    user_id = user_data.get("id")
+    if vendor_id == user_id:
+        logger.warning("⚠️ Vendor ID equals User ID - this might be the issue!")
 
-@app.get("/api/shelves/{shelf_id}/products")
-async def get_shelf_products(shelf_id: int):
-    """Get products for a specific shelf"""
-    token = user_tokens.get("current_user")
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    logger.info(f"🔄 Using vendor ID: {vendor_id} for shelves API (NOT user ID: {user_id})")
 
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/json"
-        }
+    # Get shelves using vendor ID
+    shelves_url = f"{BASALAM_API_BASE}/api_v2/shelve/list/{vendor_id}"
+    logger.info(f"📡 Requesting shelves from: {shelves_url}")
 
-        response = await client.get(f"{BASALAM_API_BASE}/api_v2/shelve/{shelf_id}/products", headers=headers)
+    shelves_response = await basalam_request("GET", shelves_url, "shelves", headers=headers)
+    logger.info(f"📥 Shelves API response status: {shelves_response.status_code}")
 
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail="Failed to get shelf products")
+    if shelves_response.status_code != 200:
+        logger.error(f"❌ Failed to get shelves: {shelves_response.status_code} - {shelves_response.text}")
+        raise HTTPException(status_code=shelves_response.status_code, detail=f"Failed to get shelves: {shelves_response.text}")
 
-        products_data = response.json()
+    shelves_data = shelves_response.json()
+    logger.info(f"✅ Shelves data received successfully: {len(shelves_data) if isinstance(shelves_data, list) else 'N/A'} items")
+    return shelves_data
 
-        # Debug: Log the raw API response structure
-        # Ensure consistent response structure
-        if isinstance(products_data, dict) and 'data' in products_data:
-            return products_data['data']
-        elif isinstance(products_data, list):
-            return products_data
-        else:
-            # If it's some other structure, return as is
-            logger.warning(f"Unexpected products data structure: {type(products_data)}")
-            return products_data
+@app.get("/api/shelves")
+async def get_user_shelves(request: Request):
+    """Get user shelves using vendor ID"""
+    token = require_token(request)
 
-@app.get("/api/debug/shelf/{shelf_id}/products")
-async def debug_shelf_products(shelf_id: int):
-    """Debug endpoint to see raw API response structure"""
-    token = user_tokens.get("current_user")
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await fetch_vendor_shelves(token)
 
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/json"
-        }
+@app.get("/api/dashboard")
+async def get_dashboard(request: Request):
+    """Everything the dashboard renders in one call: user, shelves and a product preview per shelf"""
+    token = require_token(request)
 
-        response = await client.get(f"{BASALAM_API_BASE}/api_v2/shelve/{shelf_id}/products", headers=headers)
+    user_data = await get_user_profile(token)
+    shelves = extract_items(await fetch_vendor_shelves(token))
 
-        if response.status_code != 200:
-            return {
-                "error": "Failed to get shelf products",
-                "status_code": response.status_code,
-                "response_text": response.text
-            }
+    # Fetch every shelf's products concurrently, but never more than the fan-out limit at once
+    semaphore = asyncio.Semaphore(DASHBOARD_MAX_CONCURRENCY)
 
-        products_data = response.json()
+    async def load_shelf(shelf: Dict[str, Any]) -> Dict[str, Any]:
+        summary = {
+            "id": shelf.get("id"),
+            "title": shelf.get("title"),
+            "name": shelf.get("name"),
+            "product_count": 0,
+            "products": []
+        }
+        try:
+            async with semaphore:
+                count, preview = await fetch_shelf_preview(token, shelf.get("id"), DASHBOARD_PREVIEW_PRODUCTS)
+            products = [product_card(product) for product in preview]
+        except Exception as error:
+            # Includes malformed pages (ValueError, KeyError...): only this shelf shows an error
+            detail = error.detail if isinstance(error, HTTPException) else str(error) or type(error).__name__
+            logger.warning(f"Failed to load products for shelf {shelf.get('id')}: {detail}")
+            summary["error"] = detail
+            return summary
+
+        summary["product_count"] = count
+        summary["products"] = products
+        return summary
+
+    shelf_summaries = await asyncio.gather(*(load_shelf(shelf) for shelf in shelves if isinstance(shelf, dict)))
+    return {
+        "user": {key: user_data.get(key) for key in ("id", "user_id", "name", "first_name")},
+        "shelves": shelf_summaries
+    }
 
-        # Process the response the same way as the main endpoint
-        processed_data = products_data
-        if isinstance(products_data, dict) and 'data' in products_data:
-            processed_data = products_data['data']
-        elif isinstance(products_data, list):
-            processed_data = products_data
+@app.get("/api/shelves/{shelf_id}/products")
+async def get_shelf_products(request: Request, shelf_id: int, limit: Optional[int] = Query(None, ge=1), offset: int = Query(0, ge=0),
+                             fields: Optional[str] = Query(None)):
+    """Get products for a specific shelf, optionally one window of it.
+
+    fields= picks what each product contains (dotted paths such as photo.medium,
+    or * for the full upstream object); the compact PRODUCT_DEFAULT_FIELDS view is the default.
+    """
+    token = require_token(request)
+    projection = compile_fields(fields or PRODUCT_DEFAULT_FIELDS)
+
+    # Pages before and past the requested window are never downloaded
+    pager = ShelfProductPager(token, shelf_id, start_page=offset // SHELF_PAGE_SIZE + 1)
+    products = []
+    position = None
+    async for product in pager:
+        if position is None:
+            position = pager.skipped
+        if position >= offset:
+            if limit is not None and len(products) >= limit:
+                break
+            products.append(project(product, projection))
+        position += 1
+    await pager.aclose()
+    return products
 
+@app.get("/api/debug/shelf/{shelf_id}/products")
+async def debug_shelf_products(request: Request, shelf_id: int):
+    """Debug endpoint to see raw API response structure"""
+    token = require_token(request)
+
+    # Only the first page is needed to show the raw structure
+    pager = ShelfProductPager(token, shelf_id)
+    try:
+        async for _ in pager:
+            break
+    except HTTPException as error:
         return {
-            "raw_response": products_data,
-            "processed_response": processed_data,
-            "response_type": type(products_data).__name__,
-            "length": len(products_data) if hasattr(products_data, '__len__') else None,
-            "first_product": processed_data[0] if isinstance(processed_data, list) and len(processed_data) > 0 else None,
-            "photo_structure": processed_data[0]['photo'] if isinstance(processed_data, list) and len(processed_data) > 0 and isinstance(processed_data[0], dict) and 'photo' in processed_data[0] else None
+            "error": "Failed to get shelf products",
+            "status_code": error.status_code,
+            "response_text": error.detail
         }
+    finally:
+        await pager.aclose()
+    products_data = pager.first_payload
+
+    # Process the response the same way as the main endpoint
+    processed_data = products_data
+    if isinstance(products_data, dict) and 'data' in products_data:
+        processed_data = products_data['data']
+    elif isinstance(products_data, list):
+        processed_data = products_data
 
-@app.post("/api/shelves/{shelf_id}/update-descriptions")
-async def update_shelf_descriptions(shelf_id: int, description: str = Form(...)):
-    """Update descriptions for all products in a shelf"""
-    token = user_tokens.get("current_user")
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    return {
+        "raw_response": products_data,
+        "processed_response": processed_data,
+        "response_type": type(products_data).__name__,
+        "length": len(products_data) if hasattr(products_data, '__len__') else None,
+        "first_product": processed_data[0] if isinstance(processed_data, list) and len(processed_data) > 0 else None,
+        "photo_structure": processed_data[0]['photo'] if isinstance(processed_data, list) and len(processed_data) > 0 and isinstance(processed_data[0], dict) and 'photo' in processed_data[0] else None
+    }
 
-    # First get all products in the shelf
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/json"
-        }
+async def run_description_update(job: "BulkJob", token: str, shelf_ids: List[int], description: str) -> Dict[str, Any]:
+    """Update descriptions for all products in one or more shelves (runs as a background job)"""
+    # Stream the shelves' products (revalidating any cached copy); updates start
+    # while later pages are still downloading, and shared products are sent once
+    pager = open_shelf_products(token, shelf_ids, revalidate=True)
+
+    # A resumed job reports the products its earlier run updated as well
+    updated_ids = [product_id for product_id, status in job.confirmed.items() if status == "updated"]
+    failures = []
+
+    # Create specific headers for the update requests
+    update_headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
+    # Compiled once; each product is rendered as it comes off the pager and only
+    # the products waiting for a dispatcher slot keep their text here
+    template = DescriptionTemplate(description)
+    rendered: Dict[Any, Any] = {}
+
+    async def patch_description(product):
+        text = rendered[product["id"]]
+        if isinstance(text, Exception):
+            raise text
+        return await basalam_request(
+            "PATCH", f"{BASALAM_API_BASE}/v4/products/{product['id']}", "update",
+            headers=update_headers,
+            json={"description": text}
+        )
+
+    # Update products concurrently, backing off when Basalam throttles us
+    dispatcher = BulkDispatcher()
+    # Products that already have their description are skipped; a failing template fails the product
+    async def needs_update(product):
+        text = await render_description(template, product)
+        if isinstance(text, Exception) or description_changes(product, text):
+            rendered[product["id"]] = text
+            return True
+        return False
+
+    async for product, update_response, elapsed in dispatcher.stream(
+        iter_job_products(job, pager, needs_update), patch_description
+    ):
+        product_id = product["id"]
+        text = rendered.pop(product_id, None)
+        job.record(product_id, update_response, elapsed)
+        if isinstance(update_response, Exception):
+            logger.error(f"Error updating product {product_id}: {update_response}")
+            failures.append({"id": product_id, "error": failure_summary(update_response)})
+            continue
+
+        # Validate that the update actually worked by checking the response
+        if update_response.status_code == 200:
+            try:
+                response_data = update_response.json()
+                logger.info(f"Description updated successfully for product {product_id}")
+            except:
+                logger.warning(f"Product {product_id} updated but response not parseable")
+        else:
+            logger.error(f"Failed to update product {product_id}: {update_response.status_code}")
 
-        products_response = await client.get(f"{BASALAM_API_BASE}/api_v2/shelve/{shelf_id}/products", headers=headers)
-        
-        if products_response.status_code != 200:
-            raise HTTPException(status_code=products_response.status_code, detail="Failed to get shelf products")
-        
-        products_data = products_response.json()
-        products = products_data.get("data", []) if isinstance(products_data, dict) else products_data
-        
-        updated_products = []
-        failed_products = []
-        
-        # Update each product
-        for product in products:
-            product_id = product.get("id")
-            if not product_id:
-                continue
-                
-            update_data = {
-                "description": description
-            }
-            
-            # Create specific headers for the update request
-            update_headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json",
-                "Accept": "application/json"
-            }
+        if update_response.status_code == 200:
+            shelf_cache.update_product(product_id, {"description": text})
+            updated_ids.append(product_id)
+        else:
+            failures.append({"id": product_id, "error": failure_summary(update_response)})
 
-            update_response = await client.patch(
-                f"{BASALAM_API_BASE}/v4/products/{product_id}",
-                headers=update_headers,
-                json=update_data
-                )
+    if dispatcher.retries:
+        logger.info(f"Description update for shelves {shelf_ids} needed {dispatcher.retries} retries")
 
-                # Validate that the update actually worked by checking the response
-            if update_response.status_code == 200:
-                try:
-                    response_data = update_response.json()
-                    logger.info(f"Description updated successfully for product {product_id}")
-                except:
-                    logger.warning(f"Product {product_id} updated but response not parseable")
+    return {
+        "success": True,
+        "updated_count": len(updated_ids),
+        "failed_count": len(failures),
+        "skipped_count": job.skipped,
+        "updated_ids": updated_ids,
+        "failures": failures,
+        **multi_shelf_summary(pager)
+    }
+
+async def run_image_update(job: "BulkJob", token: str, shelf_ids: List[int], image: ImageSource, optimize: bool = True) -> Dict[str, Any]:
+    """Update images for all products in one or more shelves (runs as a background job)"""
+    # Products that still show a photo made from this exact upload are skipped
+    content_hash = image.sha256
+
+    # Shrink the upload once (cached by content hash) before it is sent to every product
+    optimization = {"enabled": False, "original_bytes": image.size, "optimized_bytes": image.size, "bytes_saved": 0}
+    if optimize:
+        optimized, optimization = await image_optimizer.optimize(image)
+        if optimized is not image:
+            job.add_cleanup(optimized.cleanup)
+            image = optimized
+            logger.info(f"🗜️ Image optimized: {optimization['original_bytes']} -> {optimization['optimized_bytes']} bytes")
+
+    # Stream the shelves' products (revalidating any cached copy); updates start
+    # while later pages are still downloading, and shared products are sent once
+    pager = open_shelf_products(token, shelf_ids, revalidate=True)
+
+    # A resumed job reports the products its earlier run updated as well
+    updated_ids = [product_id for product_id, status in job.confirmed.items() if status == "updated"]
+    failures = []
+
+    # The image is uploaded once and shared by every product
+    image_upload = BulkImageUpload(token, image)
+
+    dispatcher = BulkDispatcher()
+
+    async def needs_update(product):
+        return image_changes(product, content_hash)
+
+    async for product, update_response, elapsed in dispatcher.stream(
+        iter_job_products(job, pager, needs_update), image_upload.apply
+    ):
+        product_id = product["id"]
+        job.record(product_id, update_response, elapsed)
+        if isinstance(update_response, Exception):
+            logger.error(f"Error during image upload for product {product_id}: {update_response}")
+            failures.append({"id": product_id, "error": failure_summary(update_response)})
+            continue
+
+        # Log the result
+        if update_response.status_code == 200:
+            logger.info(f"Image uploaded successfully for product {product_id} using {image_upload.accepted_format}")
+
+            # Verify the image was actually updated by checking the response
+            try:
+                response_data = update_response.json()
+                if 'photo' in response_data or 'image' in response_data:
+                    logger.info(f"Image update verified for product {product_id}")
+                else:
+                    logger.warning(f"Image upload may not have been processed correctly for product {product_id}")
+            except:
+                logger.info(f"Image uploaded for product {product_id} (response format unclear)")
+                response_data = None
+
+            # Keep cached shelves in sync: use the new photo if Basalam returned it, otherwise evict
+            if isinstance(response_data, dict) and isinstance(response_data.get("photo"), dict) and response_data["photo"]:
+                shelf_cache.update_product(product_id, {"photo": response_data["photo"]})
+                image_upload_history.record(product_id, content_hash, photo_fingerprint(response_data["photo"]))
             else:
-                logger.error(f"Failed to update product {product_id}: {update_response.status_code}")
-            
-            if update_response.status_code == 200:
-                updated_products.append(product)
+                shelf_cache.invalidate_product(product_id)
+                image_upload_history.record(product_id, content_hash, None)
+
+            updated_ids.append(product_id)
+        else:
+            logger.error(f"Image upload failed for product {product_id}: {update_response.text}")
+            failures.append({"id": product_id, "error": failure_summary(update_response)})
+
+    return {
+        "success": True,
+        "updated_count": len(updated_ids),
+        "failed_count": len(failures),
+        "skipped_count": job.skipped,
+        "image_optimization": optimization,
+        "updated_ids": updated_ids,
+        "failures": failures,
+        **multi_shelf_summary(pager)
+    }
+
+def multi_shelf_summary(pager) -> Dict[str, Any]:
+    """Extra result fields for a job that covered several shelves"""
+    if not isinstance(pager, MultiShelfProducts):
+        return {}
+    return {"shelf_ids": pager.shelf_ids, "duplicates_skipped": pager.duplicates, "shelf_errors": pager.shelf_errors}
+
+async def resolve_shelf_ids(token: str, value: str) -> List[int]:
+    """Parse a comma-separated list of shelf IDs, or "all" for every shelf of the vendor"""
+    if value.strip().lower() == "all":
+        shelf_ids = [shelf.get("id") for shelf in extract_items(await fetch_vendor_shelves(token)) if isinstance(shelf, dict)]
+    else:
+        try:
+            shelf_ids = [int(part) for part in value.split(",") if part.strip()]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="shelf_ids must be comma-separated shelf IDs or 'all'")
+    # Keep the first occurrence of each shelf, in the order given
+    shelf_ids = list(dict.fromkeys(shelf_id for shelf_id in shelf_ids if shelf_id is not None))
+    if not shelf_ids:
+        raise HTTPException(status_code=400, detail="No shelves to update")
+    return shelf_ids
+
+async def run_bulk_job(job: BulkJob) -> Dict[str, Any]:
+    """Run a bulk job from its parameters; also how a journaled job is resumed"""
+    shelf_ids = job.params.get("shelf_ids") or [job.shelf_id]
+    if job.kind == "descriptions":
+        return await run_description_update(job, job.owner, shelf_ids, job.params["description"])
+    if job.kind == "images":
+        image = ImageSource(**job.params["image"])
+        if not os.path.exists(image.path):
+            raise RuntimeError("The uploaded image is no longer available - please upload it again")
+        return await run_image_update(job, job.owner, shelf_ids, image, job.params.get("optimize", True))
+    raise ValueError(f"Unknown bulk job kind: {job.kind}")
+
+async def plan_bulk_update(kind: str, token: str, shelf_ids: List[int], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Dry run of a bulk job: read the shelves and work out what it would send, without writing anything.
+
+    Request bodies are measured the way they would be sent. The duration is projected from
+    the median latency of recent Basalam updates at full dispatcher concurrency, so
+    throttling during the real run makes it take longer.
+    """
+    plan: Dict[str, Any] = {"dry_run": True, "kind": kind, "shelf_ids": shelf_ids}
+    original = image = ImageSource(**params["image"]) if "image" in params else None
+    try:
+        if kind == "descriptions":
+            template = DescriptionTemplate(params["description"])
+            description_bytes = render_errors = 0
+
+            async def changes(product):
+                nonlocal description_bytes, render_errors
+                text = await render_description(template, product)
+                if isinstance(text, Exception):
+                    render_errors += 1
+                    return True
+                if not description_changes(product, text):
+                    return False
+                description_bytes += len(json.dumps({"description": text}).encode())
+                return True
+        else:
+            content_hash = image.sha256
+            if params.get("optimize", True):
+                # Also warms the optimizer cache for the real run
+                image, plan["image_optimization"] = await image_optimizer.optimize(image)
+
+            async def changes(product):
+                return image_changes(product, content_hash)
+
+        started = time.perf_counter()
+        pager = open_shelf_products(token, shelf_ids, revalidate=True)
+        products = changed = 0
+        try:
+            async for product in pager:
+                if isinstance(product, dict) and product.get("id"):
+                    products += 1
+                    if await changes(product):
+                        changed += 1
+        finally:
+            await pager.aclose()
+        read_seconds = time.perf_counter() - started
+
+        uploads = 0
+        if kind == "descriptions":
+            # Products whose template fails are counted as changes but send nothing
+            plan.update(estimated_bytes=description_bytes, template=not template.is_literal,
+                        template_variables=template.variables, render_errors=render_errors)
+        else:
+            image_upload = BulkImageUpload(token, image)
+            payload_format = image_format_memory["accepted"] or IMAGE_PAYLOAD_FORMATS[0]
+            by_format = {}
+            for candidate in IMAGE_PAYLOAD_FORMATS:
+                total = image_upload.request_bytes(candidate) * changed
+                if candidate == "file_id" and changed:
+                    total += image_upload.upload_bytes()
+                by_format[candidate] = total
+            uploads = 1 if payload_format == "file_id" and changed else 0
+            plan.update(payload_format=payload_format, estimated_bytes=by_format[payload_format],
+                        estimated_bytes_by_format=by_format)
+    finally:
+        # The optimizer hands out its own copy of a shrunk image
+        if image is not original:
+            image.cleanup()
+
+    # Without any recent writes, recent reads are the best guess at Basalam's latency
+    latency_route = "update" if recent_upstream_latency("update") is not None else "products"
+    latency = recent_upstream_latency(latency_route)
+    projected = None
+    if latency is not None:
+        projected = -(-changed // max(1, BULK_MAX_CONCURRENCY)) * latency
+        if uploads:
+            projected += recent_upstream_latency("upload") or latency
+        # Pages are read while the first updates are already being sent
+        projected = max(projected, read_seconds)
+
+    plan.update(
+        products=products,
+        to_change=changed,
+        to_skip=products - changed,
+        duplicates_skipped=getattr(pager, "duplicates", 0),
+        shelf_errors=getattr(pager, "shelf_errors", {}),
+        upstream_requests={
+            "product_pages": pager.page_requests,
+            "uploads": uploads,
+            "updates": changed,
+            "total": pager.page_requests + uploads + changed
+        },
+        read_seconds=round(read_seconds, 3),
+        latency_ms=round(latency * 1000, 1) if latency is not None else None,
+        latency_source=latency_route if latency is not None else None,
+        projected_seconds=round(projected, 3) if projected is not None else None
+    )
+    return plan
+
+async def submit_or_plan(kind: str, shelf_id: Optional[int], token: str, params: Dict[str, Any], dry_run: bool):
+    """Queue the bulk job, or with dry_run return its plan (200) and discard any spooled image"""
+    if not dry_run:
+        return submit_bulk_job(kind, shelf_id, token, params).submission()
+    try:
+        return JSONResponse(await plan_bulk_update(kind, token, params.get("shelf_ids") or [shelf_id], params))
+    finally:
+        if "image" in params:
+            ImageSource(**params["image"]).cleanup()
+
+def parse_flag(value, default: bool = False) -> bool:
+    """A true/false form field from a hand-parsed form"""
+    if value is None or value == "":
+        return default
+    return str(value).lower() not in ("0", "false", "no", "off")
+
+@app.post("/api/shelves/{shelf_id}/update-descriptions", status_code=202)
+async def update_shelf_descriptions(request: Request, shelf_id: int, description: str = Form(...),
+                                    dry_run: bool = Form(False)):
+    """Queue a background job that updates descriptions for all products in a shelf"""
+    token = require_token(request)
+
+    compile_description(description)
+    return await submit_or_plan("descriptions", shelf_id, token, {"description": description}, dry_run)
+
+@app.post("/api/shelves/{shelf_id}/preview-descriptions")
+async def preview_shelf_descriptions(request: Request, shelf_id: int, description: str = Form(...),
+                                     limit: int = Form(DESCRIPTION_PREVIEW_PRODUCTS)):
+    """Render a description template for the first products of a shelf, without updating anything"""
+    token = require_token(request)
+
+    template = compile_description(description)
+    limit = max(1, min(limit, DESCRIPTION_PREVIEW_MAX_PRODUCTS))
+    previews = []
+    pager = open_shelf_products(token, [shelf_id], revalidate=False)
+    try:
+        async for product in pager:
+            if not isinstance(product, dict) or not product.get("id"):
+                continue
+            text = await render_description(template, product)
+            preview = {"id": product["id"], "title": product.get("title") or product.get("name")}
+            if isinstance(text, Exception):
+                preview["error"] = str(text)
             else:
-                failed_products.append({
-                    "product": product,
-                    "error": update_response.text
-                })
-        
-        return {
-            "success": True,
-            "updated_count": len(updated_products),
-            "failed_count": len(failed_products),
-            "updated_products": updated_products,
-            "failed_products": failed_products
-        }
+                preview.update(description=text, changes=description_changes(product, text))
+            previews.append(preview)
+            if len(previews) >= limit:
+                break
+    finally:
+        await pager.aclose()
 
-@app.post("/api/shelves/{shelf_id}/update-images")
-async def update_shelf_images(request: Request, shelf_id: int):
-    """Update images for all products in a shelf"""
-    token = user_tokens.get("current_user")
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    return {"template": not template.is_literal, "variables": template.variables, "products": previews}
 
-    form = await request.form()
+def reject_oversized_upload(request: Request):
+    """Refuse oversized uploads before parsing the form when the client declares a length"""
+    declared_length = request.headers.get("content-length")
+    if declared_length and declared_length.isdigit() and int(declared_length) > IMAGE_MAX_UPLOAD_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"Image is larger than {IMAGE_MAX_UPLOAD_BYTES} bytes")
+
+async def spool_bulk_image(form) -> Dict[str, Any]:
+    """Copy the form's image to a job-owned file; returns the image job parameters"""
     image_file = form.get("image")
+    # Sellers can opt out of resizing/re-encoding with optimize=false
+    optimize = parse_flag(form.get("optimize"), default=True)
 
     if not image_file:
         raise HTTPException(status_code=400, detail="No image file provided")
 
-    # First get all products in the shelf
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/json"
-        }
-        
-        products_response = await client.get(f"{BASALAM_API_BASE}/api_v2/shelve/{shelf_id}/products", headers=headers)
-        
-        if products_response.status_code != 200:
-            raise HTTPException(status_code=products_response.status_code, detail="Failed to get shelf products")
-        
-        products_data = products_response.json()
-        products = products_data.get("data", []) if isinstance(products_data, dict) else products_data
-        
-        updated_products = []
-        failed_products = []
-        
-        # Read image content
-        image_content = await image_file.read()
-        
-        # Update each product
-        for product in products:
-            product_id = product.get("id")
-            if not product_id:
-                continue
-            
-            # Try different approaches for image upload
+    # Copy the upload now - the form's spooled file is closed once this request ends. With the
+    # journal on it goes next to the journal, so a resumed job still finds it after a restart.
+    directory = None
+    if job_journal is not None:
+        os.makedirs(JOB_JOURNAL_IMAGE_DIR, mode=0o700, exist_ok=True)
+        directory = JOB_JOURNAL_IMAGE_DIR
+    image = await ImageSource.from_upload(image_file, IMAGE_MAX_UPLOAD_BYTES, directory)
+    return {"image": image.to_dict(), "optimize": optimize}
 
-            # Method 1: JSON with base64 encoded image
-            try:
-                # Encode image to base64
-                image_base64 = base64.b64encode(image_content).decode('utf-8')
-
-                # Prepare JSON payload
-                image_data = {
-                    "image": f"data:{image_file.content_type};base64,{image_base64}",
-                    "filename": image_file.filename
-                }
-
-                upload_headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                    "Accept": "application/json"
-                }
-
-                # Try different upload methods silently, only log success/failure
-                methods_tried = []
-
-                # Method 1: Simple image field
-                update_response = await client.patch(
-                    f"{BASALAM_API_BASE}/v4/products/{product_id}",
-                    headers=upload_headers,
-                    json=image_data
-                )
-                methods_tried.append(("Method 1", update_response.status_code))
-
-                # Method 2: Photo object structure (if Method 1 fails)
-                if update_response.status_code != 200:
-                    image_data_alt = {
-                        "photo": {
-                            "data": f"data:{image_file.content_type};base64,{image_base64}",
-                            "filename": image_file.filename
-                        }
-                    }
-
-                    update_response = await client.patch(
-                        f"{BASALAM_API_BASE}/v4/products/{product_id}",
-                        headers=upload_headers,
-                        json=image_data_alt
-                    )
-                    methods_tried.append(("Method 2", update_response.status_code))
-
-                # Method 3: Multipart form data (if Method 2 fails)
-                if update_response.status_code != 200:
-                    files = {
-                        "image": (image_file.filename, image_content, image_file.content_type)
-                    }
-
-                    multipart_headers = {
-                        "Authorization": f"Bearer {token}",
-                        "Accept": "application/json"
-                    }
-
-                    update_response = await client.patch(
-                        f"{BASALAM_API_BASE}/v4/products/{product_id}",
-                        headers=multipart_headers,
-                        files=files
-                    )
-                    methods_tried.append(("Method 3", update_response.status_code))
+@app.post("/api/shelves/{shelf_id}/update-images", status_code=202)
+async def update_shelf_images(request: Request, shelf_id: int):
+    """Queue a background job that updates images for all products in a shelf"""
+    token = require_token(request)
 
-                # Log the result
-                if update_response.status_code == 200:
-                    successful_method = methods_tried[-1][0] if methods_tried else "Unknown"
-                    logger.info(f"Image uploaded successfully for product {product_id} using {successful_method}")
+    reject_oversized_upload(request)
+    form = await request.form()
+    try:
+        params = await spool_bulk_image(form)
+    finally:
+        await form.close()
 
-                    # Verify the image was actually updated by checking the response
-                    try:
-                        response_data = update_response.json()
-                        if 'photo' in response_data or 'image' in response_data:
-                            logger.info(f"Image update verified for product {product_id}")
-                        else:
-                            logger.warning(f"Image upload may not have been processed correctly for product {product_id}")
-                    except:
-                        logger.info(f"Image uploaded for product {product_id} (response format unclear)")
-                else:
-                    logger.error(f"Image upload failed for product {product_id}: {update_response.text}")
+    return await submit_or_plan("images", shelf_id, token, params, parse_flag(form.get("dry_run")))
 
-            except Exception as upload_error:
-                logger.error(f"Error during image upload for product {product_id}: {upload_error}")
-                update_response = type('Response', (), {'status_code': 500, 'text': str(upload_error)})()
+@app.post("/api/shelves/update-descriptions", status_code=202)
+async def update_multi_shelf_descriptions(request: Request, shelf_ids: str = Form(...), description: str = Form(...),
+                                          dry_run: bool = Form(False)):
+    """Queue one job that updates descriptions across several shelves ("all" for every shelf).
 
-            # Clean up the logging - only show essential info
-            
-            if update_response.status_code == 200:
-                updated_products.append(product)
-            else:
-                failed_products.append({
-                    "product": product,
-                    "error": update_response.text
-                })
-        
-        return {
-            "success": True,
-            "updated_count": len(updated_products),
-            "failed_count": len(failed_products),
-            "updated_products": updated_products,
-            "failed_products": failed_products
-        }
+    The shelves' products are merged, so a product on several shelves is updated once.
+    """
+    token = require_token(request)
+
+    compile_description(description)
+    resolved = await resolve_shelf_ids(token, shelf_ids)
+    return await submit_or_plan("descriptions", None, token, {"shelf_ids": resolved, "description": description}, dry_run)
+
+@app.post("/api/shelves/update-images", status_code=202)
+async def update_multi_shelf_images(request: Request):
+    """Queue one job that updates images across several shelves ("all" for every shelf)"""
+    token = require_token(request)
+
+    reject_oversized_upload(request)
+    form = await request.form()
+    try:
+        # Shelves are resolved first, so a bad list never leaves a spooled image behind
+        resolved = await resolve_shelf_ids(token, str(form.get("shelf_ids") or ""))
+        params = await spool_bulk_image(form)
+    finally:
+        await form.close()
+
+    return await submit_or_plan("images", None, token, {"shelf_ids": resolved, **params}, parse_flag(form.get("dry_run")))
+
+@app.get("/api/jobs")
+async def list_bulk_jobs(request: Request):
+    """List the current user's bulk jobs, newest first"""
+    token = require_token(request)
+
+    snapshots = [job.snapshot(include_result=False) for job in bulk_jobs.values() if job.owner == token]
+
+    # Jobs queued through the other worker processes
+    owner = owner_fingerprint(token)
+    for job_id, record in job_store.items():
+        if record["owner"] == owner and job_id not in bulk_jobs:
+            snapshot = dict(record["snapshot"])
+            snapshot.pop("result", None)
+            snapshots.append(snapshot)
+
+    snapshots.sort(key=lambda snapshot: snapshot["created_at"], reverse=True)
+    return snapshots
+
+@app.get("/api/jobs/{job_id}")
+async def get_bulk_job(request: Request, job_id: str):
+    """Get progress, and the result once finished, for one bulk job"""
+    token = require_token(request)
+
+    job = get_owned_job(job_id, token)
+    return job.snapshot() if job is not None else get_shared_job_snapshot(job_id, token)
+
+@app.get("/api/jobs/{job_id}/events")
+async def bulk_job_events(request: Request, job_id: str):
+    """Stream live progress of a bulk job as Server-Sent Events"""
+    token = require_token(request)
+
+    job = get_owned_job(job_id, token)
+    return StreamingResponse(
+        stream_job_events(job) if job is not None else stream_shared_job_events(job_id, token),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_bulk_job(request: Request, job_id: str):
+    """Cancel a queued or running bulk job"""
+    token = require_token(request)
+
+    job = get_owned_job(job_id, token)
+    if job is None:
+        # The worker process running it applies the cancellation on its next progress write
+        snapshot = get_shared_job_snapshot(job_id, token)
+        if snapshot["status"] in BulkJob.FINISHED_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Job already {snapshot['status']}")
+        job_cancel_store.set(job_id, {"requested_at": datetime.utcnow().isoformat()}, BULK_JOB_RETENTION)
+        snapshot.pop("result", None)
+        return {**snapshot, "cancel_requested": True}
+    if job.finished:
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    job.cancel()
+    job.persist(force=True)
+    return job.snapshot(include_result=False)
 
 @app.get("/api/auth/status")
-async def auth_status():
+async def auth_status(request: Request):
     """Check authentication status"""
-    token = user_tokens.get("current_user")
+    token = get_session_token(request)
     return {"authenticated": bool(token)}
 
 @app.get("/api/debug/token")
-async def debug_token():
+async def debug_token(request: Request):
     """Debug endpoint to check token status"""
-    token = user_tokens.get("current_user")
+    token = get_session_token(request)
     return {
         "has_token": bool(token),
         "token_length": len(token) if token else 0,
         "token_prefix": token[:50] + "..." if token and len(token) > 50 else token,
-        "all_tokens_count": len(user_tokens)
+        "all_tokens_count": session_store.count()
     }
 
 @app.get("/api/health")
@@ -665,9 +3748,39 @@ async def health_check():
     return {
         "status": "healthy",
         "server_time": datetime.utcnow().isoformat(),
-        "authenticated_users": len([t for t in user_tokens.values() if t]),
-        "static_files_cached": True
+        "authenticated_users": session_store.count(),
+        "oauth_states": oauth_state_store.stats(),
+        "static_files_cached": True,
+        "http_pool": get_http_pool_stats(),
+        "upstream": get_upstream_stats(),
+        "profile_cache": profile_cache.stats(),
+        "shelf_cache": shelf_cache.stats(),
+        "image_optimizer": image_optimizer.stats(),
+        "job_journal": job_journal.stats() if job_journal is not None else None,
+        "bulk_jobs": {
+            "workers": len(bulk_job_workers),
+            "queued": sum(1 for job in bulk_jobs.values() if job.status == "queued"),
+            "running": sum(1 for job in bulk_jobs.values() if job.status == "running")
+        }
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text-format metrics for this worker process"""
+    body = render_metrics([
+        http_request_latency,
+        http_requests_in_flight,
+        upstream_request_latency,
+        upstream_requests_in_flight,
+        upstream_retries,
+        upstream_coalesced,
+        circuit_breaker_state,
+        bulk_products_processed,
+        bulk_throughput,
+        image_upload_bytes,
+        image_optimization_bytes_saved,
+    ])
+    return Response(body, media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Basalam OAuth, users, shelve, product and file APIs.
+
+Point the app at it for offline benchmarks and load tests:
+
+    python mock_basalam.py --port 9000 --latency-ms 40 --error-rate 0.01 --throttle-rate 0.02
+
+    BASALAM_AUTH_URL=http://127.0.0.1:9000/accounts/sso
+    BASALAM_TOKEN_URL=http://127.0.0.1:9000/oauth/token
+    BASALAM_API_BASE=http://127.0.0.1:9000
+    BASALAM_UPLOAD_URL=http://127.0.0.1:9000/v3/files
+
+Shelf N (1-based) holds the N-th entry of --shelf-sizes products. Latency,
+error and 429 injection can be changed at runtime with POST /_mock/config, and
+request counts are available from GET /_mock/stats.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import urllib.parse
+import uuid
+from typing import Any, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, RedirectResponse, Response
+
+VENDOR_ID = 4242
+USER_ID = 1717
+
+# Fault injection and catalogue settings; the CLI flags override these
+config = {
+    "latency_ms": float(os.getenv("MOCK_LATENCY_MS", "20")),
+    "latency_jitter_ms": float(os.getenv("MOCK_LATENCY_JITTER_MS", "10")),
+    "error_rate": float(os.getenv("MOCK_ERROR_RATE", "0")),
+    "throttle_rate": float(os.getenv("MOCK_THROTTLE_RATE", "0")),
+    "retry_after": float(os.getenv("MOCK_RETRY_AFTER", "1")),
+    "shelf_sizes": [int(size) for size in os.getenv("MOCK_SHELF_SIZES", "100,1000,10000").split(",")],
+}
+
+shelves: Dict[int, Dict[str, Any]] = {}
+products: Dict[int, Dict[str, Any]] = {}
+stats: Dict[str, int] = {}
+uploaded_files: Dict[int, int] = {}
+
+app = FastAPI(title="Mock Basalam API")
+
+def reset_catalogue():
+    """Rebuild shelves and products from config["shelf_sizes"]"""
+    shelves.clear()
+    products.clear()
+    uploaded_files.clear()
+    stats.clear()
+    for index, size in enumerate(config["shelf_sizes"], start=1):
+        product_ids = []
+        for position in range(size):
+            product_id = index * 1_000_000 + position
+            products[product_id] = {
+                "id": product_id,
+                "title": f"Product {position + 1} of shelf {index}",
+                "description": "Original description",
+                "price": 100000 + position,
+                "photo": {
+                    "id": product_id,
+                    "small": f"https://mock.basalam.local/photos/{product_id}/small.jpg",
+                    "medium": f"https://mock.basalam.local/photos/{product_id}/medium.jpg",
+                    "large": f"https://mock.basalam.local/photos/{product_id}/large.jpg",
+                },
+            }
+            product_ids.append(product_id)
+        shelves[index] = {"id": index, "title": f"Shelf {index} ({size} products)", "product_ids": product_ids, "version": 0}
+
+def count(name: str):
+    stats[name] = stats.get(name, 0) + 1
+
+async def inject_faults(name: str) -> Optional[Response]:
+    """Sleep for the configured latency, then maybe answer 429 or 5xx instead of the real handler"""
+    count(name)
+    delay = config["latency_ms"] + random.uniform(-config["latency_jitter_ms"], config["latency_jitter_ms"])
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+    roll = random.random()
+    if roll < config["throttle_rate"]:
+        count("throttled")
+        return JSONResponse({"message": "Too Many Requests"}, status_code=429,
+                            headers={"Retry-After": f"{config['retry_after']:g}"})
+    if roll < config["throttle_rate"] + config["error_rate"]:
+        count("errors")
+        return JSONResponse({"message": "Bad Gateway"}, status_code=random.choice([500, 502, 503]))
+    return None
+
+def require_bearer(request: Request):
+    if not request.headers.get("Authorization", "").startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Unauthenticated")
+
+@app.get("/accounts/sso")
+async def sso(redirect_uri: str, state: str = ""):
+    """Approve every login immediately and send the browser back with a code"""
+    count("sso")
+    query = urllib.parse.urlencode({"code": f"mock-code-{uuid.uuid4().hex[:12]}", "state": state})
+    return RedirectResponse(f"{redirect_uri}?{query}")
+
+@app.post("/oauth/token")
+async def token():
+    count("token")
+    return {"access_token": f"mock-token-{uuid.uuid4().hex}", "token_type": "Bearer", "expires_in": 86400}
+
+@app.get("/v3/users/me")
+async def users_me(request: Request):
+    require_bearer(request)
+    if (fault := await inject_faults("users_me")) is not None:
+        return fault
+    return {"id": USER_ID, "name": "Mock Seller", "vendor": {"id": VENDOR_ID, "title": "Mock Vendor"}}
+
+@app.get("/api_v2/shelve/list/{vendor_id}")
+async def shelve_list(request: Request, vendor_id: int):
+    require_bearer(request)
+    if (fault := await inject_faults("shelve_list")) is not None:
+        return fault
+    if vendor_id != VENDOR_ID:
+        return JSONResponse({"message": "Vendor not found"}, status_code=404)
+    return [{"id": shelf["id"], "title": shelf["title"]} for shelf in shelves.values()]
+
+@app.get("/api_v2/shelve/{shelf_id}/products")
+async def shelve_products(request: Request, shelf_id: int, page: int = 1, per_page: int = 100):
+    require_bearer(request)
+    if (fault := await inject_faults("shelve_products")) is not None:
+        return fault
+    shelf = shelves.get(shelf_id)
+    if shelf is None:
+        return JSONResponse({"message": "Shelf not found"}, status_code=404)
+
+    etag = f'"{shelf_id}-{shelf["version"]}"'
+    if page == 1 and request.headers.get("If-None-Match") == etag:
+        count("not_modified")
+        return Response(status_code=304, headers={"ETag": etag})
+
+    per_page = max(1, min(per_page, 500))
+    start = (max(page, 1) - 1) * per_page
+    page_ids = shelf["product_ids"][start:start + per_page]
+    return JSONResponse(
+        {
+            "data": [products[product_id] for product_id in page_ids],
+            "meta": {"total": len(shelf["product_ids"]), "page": page, "per_page": per_page},
+        },
+        headers={"ETag": etag},
+    )
+
+@app.post("/v3/files")
+async def upload_file(request: Request):
+    require_bearer(request)
+    if (fault := await inject_faults("files")) is not None:
+        return fault
+    form = await request.form()
+    upload = form.get("file")
+    if upload is None:
+        return JSONResponse({"message": "file is required"}, status_code=422)
+    content = await upload.read()
+    file_id = len(uploaded_files) + 1
+    uploaded_files[file_id] = len(content)
+    return JSONResponse({"id": file_id, "size": len(content)}, status_code=201)
+
+def _photo_for(product_id: int, key: str) -> Dict[str, Any]:
+    base = f"https://mock.basalam.local/photos/{product_id}/{key}"
+    return {"id": key, "small": f"{base}/small.jpg", "medium": f"{base}/medium.jpg", "large": f"{base}/large.jpg"}
+
+@app.patch("/v4/products/{product_id}")
+async def update_product(request: Request, product_id: int):
+    require_bearer(request)
+    if (fault := await inject_faults("update_product")) is not None:
+        return fault
+    product = products.get(product_id)
+    if product is None:
+        return JSONResponse({"message": "Product not found"}, status_code=404)
+
+    changes: Dict[str, Any] = {}
+    if request.headers.get("content-type", "").startswith("multipart/"):
+        form = await request.form()
+        image = form.get("image")
+        if image is not None:
+            digest = hashlib.sha256(await image.read()).hexdigest()[:16]
+            changes["photo"] = _photo_for(product_id, digest)
+    else:
+        try:
+            body = json.loads(await request.body() or b"{}")
+        except ValueError:
+            return JSONResponse({"message": "Invalid JSON"}, status_code=400)
+        if "description" in body:
+            changes["description"] = body["description"]
+        if isinstance(body.get("photo"), int):
+            if body["photo"] not in uploaded_files:
+                return JSONResponse({"message": "Unknown file id"}, status_code=422)
+            changes["photo"] = _photo_for(product_id, f"file-{body['photo']}")
+        elif isinstance(body.get("photo"), dict) or "image" in body:
+            inline = body.get("image") or body["photo"].get("data", "")
+            changes["photo"] = _photo_for(product_id, hashlib.sha256(inline.encode()).hexdigest()[:16])
+
+    if not changes:
+        return JSONResponse({"message": "Nothing to update"}, status_code=422)
+    product.update(changes)
+    shelf = shelves.get(product_id // 1_000_000)
+    if shelf is not None:
+        shelf["version"] += 1
+    return product
+
+@app.get("/_mock/stats")
+async def mock_stats():
+    return {"requests": dict(stats), "config": config, "products": len(products), "files": len(uploaded_files)}
+
+@app.post("/_mock/config")
+async def mock_config(request: Request):
+    """Change latency/fault settings at runtime; changing shelf_sizes rebuilds the catalogue"""
+    updates = await request.json()
+    unknown = set(updates) - set(config)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown settings: {sorted(unknown)}")
+    config.update(updates)
+    if "shelf_sizes" in updates:
+        reset_catalogue()
+    return config
+
+@app.post("/_mock/reset")
+async def mock_reset():
+    reset_catalogue()
+    return {"shelves": len(shelves), "products": len(products)}
+
+reset_catalogue()
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Basalam API for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=config["latency_ms"], help="Mean added latency per API call")
+    parser.add_argument("--jitter-ms", type=float, default=config["latency_jitter_ms"], help="Uniform +/- jitter around the mean")
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"], help="Fraction of calls answered with 5xx")
+    parser.add_argument("--throttle-rate", type=float, default=config["throttle_rate"], help="Fraction of calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=config["retry_after"], help="Retry-After seconds sent with 429")
+    parser.add_argument("--shelf-sizes", default=",".join(str(size) for size in config["shelf_sizes"]),
+                        help="Comma-separated product counts, one shelf per entry")
+    args = parser.parse_args()
+
+    config.update(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        shelf_sizes=[int(size) for size in args.shelf_sizes.split(",") if size.strip()],
+    )
+    reset_catalogue()
+    print(f"🧪 Mock Basalam on http://{args.host}:{args.port} - shelves: {config['shelf_sizes']}, "
+          f"latency {args.latency_ms:g}±{args.jitter_ms:g}ms, errors {args.error_rate:.1%}, 429s {args.throttle_rate:.1%}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -45,6 +45,10 @@ class BasalamApp {
                             <i class="fas fa-user-check ms-1"></i>
                             احراز هویت شده
                         </span>
+                        <a href="/auth/logout" class="btn btn-outline-light btn-sm me-2">
+                            <i class="fas fa-sign-out-alt ms-1"></i>
+                            خروج
+                        </a>
                     `;
                 }
             } else {
@@ -89,27 +93,34 @@ class BasalamApp {
     }
 
     async loadDashboardData() {
-        await this.loadUserInfo();
-        await this.loadShelves();
-    }
-
-    async loadUserInfo() {
         try {
-            const response = await fetch('/api/user/me');
+            // One call returns the user, the shelves and a product preview for every shelf
+            const response = await fetch('/api/dashboard', {
+                headers: { 'Accept': 'application/json' }
+            });
             if (!response.ok) {
-                throw new Error('Failed to load user info');
+                throw new Error('Failed to load dashboard');
             }
-            
-            this.userInfo = await response.json();
+
+            const dashboard = await response.json();
+            this.userInfo = dashboard.user;
             this.displayUserInfo();
+            this.shelves = dashboard.shelves || [];
+            this.displayShelves();
         } catch (error) {
-            console.error('Error loading user info:', error);
+            console.error('Error loading dashboard:', error);
             document.getElementById('user-info').innerHTML = `
                 <div class="alert alert-danger">
                     <i class="fas fa-exclamation-triangle ms-2"></i>
                     بارگذاری اطلاعات کاربر ناموفق بود. لطفاً صفحه را بروزرسانی کنید.
                 </div>
             `;
+            document.getElementById('shelves-container').innerHTML = `
+                <div class="alert alert-danger">
+                    <i class="fas fa-exclamation-triangle me-2"></i>
+                    Failed to load shelves. Please try refreshing the page.
+                </div>
+            `;
         }
     }
 
@@ -129,28 +140,7 @@ class BasalamApp {
         }
     }
 
-    async loadShelves() {
-        try {
-            const response = await fetch('/api/shelves');
-            if (!response.ok) {
-                throw new Error('Failed to load shelves');
-            }
-            
-            const shelvesData = await response.json();
-            this.shelves = shelvesData.data || shelvesData || [];
-            this.displayShelves();
-        } catch (error) {
-            console.error('Error loading shelves:', error);
-            document.getElementById('shelves-container').innerHTML = `
-                <div class="alert alert-danger">
-                    <i class="fas fa-exclamation-triangle me-2"></i>
-                    Failed to load shelves. Please try refreshing the page.
-                </div>
-            `;
-        }
-    }
-
-    async displayShelves() {
+    displayShelves() {
         const container = document.getElementById('shelves-container');
         
         if (!this.shelves || this.shelves.length === 0) {
@@ -167,8 +157,10 @@ class BasalamApp {
         let shelvesHtml = '';
         
         for (const shelf of this.shelves) {
-            const products = await this.loadShelfProducts(shelf.id);
-            shelvesHtml += this.createShelfCard(shelf, products);
+            if (shelf.error) {
+                console.warn(`Failed to load products for shelf ${shelf.id}:`, shelf.error);
+            }
+            shelvesHtml += this.createShelfCard(shelf, shelf.products || [], shelf.product_count);
         }
         
         container.innerHTML = shelvesHtml;
@@ -205,88 +197,10 @@ class BasalamApp {
         }, 100);
     }
 
-    async loadShelfProducts(shelfId) {
-        try {
-            console.log(`Loading products for shelf ${shelfId}...`);
-
-            // Add timeout to prevent hanging requests
-            const controller = new AbortController();
-            const timeoutId = setTimeout(() => controller.abort(), 15000); // 15 second timeout
-
-            const response = await fetch(`/api/shelves/${shelfId}/products`, {
-                signal: controller.signal,
-                headers: {
-                    'Accept': 'application/json',
-                    'Cache-Control': 'no-cache'
-                }
-            });
-
-            clearTimeout(timeoutId);
-            console.log(`Products API response status: ${response.status}`);
-
-            if (!response.ok) {
-                console.warn(`Failed to load products for shelf ${shelfId}: ${response.status} - ${response.statusText}`);
-                // Try to get error details from response
-                try {
-                    const errorData = await response.json();
-                    console.warn('Error details:', errorData);
-                } catch (e) {
-                    console.warn('Could not parse error response');
-                }
-                return [];
-            }
-
-            let productsData;
-            try {
-                productsData = await response.json();
-            } catch (parseError) {
-                console.error(`Failed to parse JSON response for shelf ${shelfId}:`, parseError);
-                return [];
-            }
-
-            console.log(`Raw products data for shelf ${shelfId}:`, {
-                type: typeof productsData,
-                isArray: Array.isArray(productsData),
-                isObject: typeof productsData === 'object',
-                keys: typeof productsData === 'object' ? Object.keys(productsData) : null,
-                length: Array.isArray(productsData) ? productsData.length : null
-            });
-
-            const processedProducts = productsData.data || productsData || [];
-
-            // Validate and clean the products data
-            const validatedProducts = processedProducts.filter(product => {
-                if (!product || typeof product !== 'object') {
-                    console.warn('Filtering out invalid product:', product);
-                    return false;
-                }
-                return true;
-            });
-
-            console.log(`Validated products for shelf ${shelfId}:`, {
-                originalCount: processedProducts.length,
-                validatedCount: validatedProducts.length,
-                sample: validatedProducts.length > 0 ? validatedProducts[0] : null
-            });
-
-            return validatedProducts;
-
-        } catch (error) {
-            if (error.name === 'AbortError') {
-                console.error(`Request timeout loading products for shelf ${shelfId}`);
-            } else if (error.name === 'TypeError' && error.message.includes('fetch')) {
-                console.error(`Network error loading products for shelf ${shelfId}:`, error);
-            } else {
-                console.error(`Unexpected error loading products for shelf ${shelfId}:`, error);
-            }
-            return [];
-        }
-    }
-
-    createShelfCard(shelf, products) {
+    createShelfCard(shelf, products, productCount = products.length) {
         // Debug: Log products data for troubleshooting
         console.log(`Shelf: ${shelf.title || shelf.name} (${shelf.id})`, {
-            productCount: products.length,
+            productCount: productCount,
             sampleProduct: products.length > 0 ? products[0] : null,
             productsType: typeof products,
             productsIsArray: Array.isArray(products)
@@ -304,7 +218,6 @@ class BasalamApp {
             });
         }
 
-        const productCount = products.length;
         const productsHtml = products.length > 0
             ? products.slice(0, 6).map(product => this.createProductCard(product)).join('')
             : '<div class="col-12 text-center text-muted p-3">محصولی در این قفسه وجود ندارد</div>';
@@ -328,8 +241,8 @@ class BasalamApp {
             });
         }
         
-        const moreProductsText = products.length > 6 
-            ? `<div class="col-12 text-center mt-2"><small class="text-muted">... و ${products.length - 6} محصول دیگر</small></div>`
+        const moreProductsText = productCount > 6
+            ? `<div class="col-12 text-center mt-2"><small class="text-muted">... و ${productCount - 6} محصول دیگر</small></div>`
             : '';
 
         const shelfHtml = `
@@ -504,10 +417,17 @@ class BasalamApp {
                 headers: Object.fromEntries(response.headers.entries())
             });
 
-            const result = await response.json();
+            const submission = await response.json();
+            console.log('Description update job queued:', submission);
+
+            if (!response.ok || !submission.success) {
+                throw new Error(submission.detail || 'Failed to update descriptions');
+            }
+
+            const result = await this.followJob(submission.job_id);
             console.log('Description update result:', result);
 
-            if (response.ok && result.success) {
+            if (result && result.success) {
                 this.showUpdateResults(result, 'description');
                 this.hideModal('updateModal');
                 await this.refreshData();
@@ -546,9 +466,15 @@ class BasalamApp {
                 body: formData
             });
             
-            const result = await response.json();
-            
-            if (response.ok && result.success) {
+            const submission = await response.json();
+
+            if (!response.ok || !submission.success) {
+                throw new Error(submission.detail || 'Failed to update images');
+            }
+
+            const result = await this.followJob(submission.job_id);
+
+            if (result && result.success) {
                 this.showUpdateResults(result, 'image');
                 this.hideModal('updateModal');
                 await this.refreshData();
@@ -563,13 +489,122 @@ class BasalamApp {
         }
     }
 
+    // Follow a bulk job over Server-Sent Events, rendering progress per product
+    followJob(jobId) {
+        if (!window.EventSource) {
+            return this.waitForJob(jobId);
+        }
+
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`/api/jobs/${jobId}/events`);
+            let progress = null;
+            let settled = false;
+
+            const finish = (callback, value) => {
+                settled = true;
+                source.close();
+                callback(value);
+            };
+
+            source.addEventListener('summary', (event) => {
+                progress = JSON.parse(event.data);
+                this.showJobProgress(progress);
+            });
+
+            source.addEventListener('product', (event) => {
+                const update = JSON.parse(event.data);
+                if (progress) {
+                    const counter = { updated: 'succeeded', failed: 'failed', skipped: 'skipped' }[update.status];
+                    progress.processed += 1;
+                    progress[counter] = (progress[counter] || 0) + 1;
+                    this.showJobProgress(progress);
+                }
+                if (update.status === 'failed') {
+                    console.warn(`Product ${update.id} failed after ${update.latency_ms}ms:`, update.error);
+                }
+            });
+
+            source.addEventListener('done', (event) => {
+                const job = JSON.parse(event.data);
+                this.showJobProgress(job);
+                if (job.status === 'completed') {
+                    finish(resolve, job.result);
+                } else {
+                    finish(reject, new Error(job.error || `Job ${job.status}`));
+                }
+            });
+
+            source.onerror = () => {
+                if (settled) {
+                    return;
+                }
+                // Fall back to polling if the stream is interrupted (e.g. by a proxy)
+                console.warn(`Event stream for job ${jobId} interrupted, falling back to polling`);
+                source.close();
+                settled = true;
+                this.waitForJob(jobId).then(resolve, reject);
+            };
+        });
+    }
+
+    // Poll a background bulk job until it finishes and return its result
+    async waitForJob(jobId, intervalMs = 1000) {
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            const job = await response.json();
+
+            if (!response.ok) {
+                throw new Error(job.detail || 'Failed to get job status');
+            }
+
+            this.showJobProgress(job);
+
+            if (job.status === 'completed') {
+                return job.result;
+            }
+            if (job.status === 'failed' || job.status === 'cancelled') {
+                throw new Error(job.error || `Job ${job.status}`);
+            }
+
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+    }
+
+    showJobProgress(job) {
+        const message = document.querySelector('#loading-overlay .loading-content p');
+        const progressBar = document.querySelector('#job-progress .progress-bar');
+        if (progressBar && job.total) {
+            const percent = Math.min(100, Math.round((job.processed / job.total) * 100));
+            document.getElementById('job-progress').classList.remove('d-none');
+            progressBar.style.width = `${percent}%`;
+            progressBar.textContent = `${percent}%`;
+        }
+        if (!message) {
+            return;
+        }
+
+        if (job.total === null || job.total === undefined) {
+            // Large shelves are streamed page by page, so the total may not be known yet
+            message.textContent = job.processed
+                ? `${job.processed} محصول پردازش شد...`
+                : 'در حال دریافت محصولات قفسه...';
+            return;
+        }
+
+        const eta = job.eta_seconds !== null && job.eta_seconds !== undefined
+            ? ` - حدود ${Math.ceil(job.eta_seconds)} ثانیه باقی‌مانده`
+            : '';
+        message.textContent = `${job.processed} از ${job.total} محصول پردازش شد${eta}`;
+    }
+
     showUpdateResults(result, updateType) {
         const modal = new bootstrap.Modal(document.getElementById('reviewModal'));
         const content = document.getElementById('reviewContent');
         
         const successCount = result.updated_count || 0;
         const failedCount = result.failed_count || 0;
-        const totalCount = successCount + failedCount;
+        const skippedCount = result.skipped_count || 0;
+        const totalCount = successCount + failedCount + skippedCount;
         
         content.innerHTML = `
             <div class="text-center mb-4">
@@ -611,7 +646,8 @@ class BasalamApp {
                 <i class="fas fa-info-circle me-2"></i>
                 <strong>Update Type:</strong> ${updateType === 'description' ? 'Product Descriptions' : 'Product Images'}
                 <br>
-                <strong>Success Rate:</strong> ${totalCount > 0 ? Math.round((successCount / totalCount) * 100) : 0}%
+                <strong>Success Rate:</strong> ${totalCount > 0 ? Math.round(((successCount + skippedCount) / totalCount) * 100) : 0}%
+                ${skippedCount > 0 ? `<br><strong>Already Up to Date (skipped):</strong> ${skippedCount}` : ''}
             </div>
             
             ${failedCount > 0 ? `
@@ -653,6 +689,15 @@ class BasalamApp {
             overlay.classList.remove('d-none');
         } else {
             overlay.classList.add('d-none');
+            const message = overlay.querySelector('.loading-content p');
+            if (message) {
+                message.textContent = 'در حال پردازش درخواست شما...';
+            }
+            const progress = document.getElementById('job-progress');
+            if (progress) {
+                progress.classList.add('d-none');
+                progress.querySelector('.progress-bar').style.width = '0%';
+            }
         }
     }
 
@@ -0,0 +1,11 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# main reads its configuration at import time and serves static/ and templates/ relative to the cwd
+os.environ.setdefault("BASALAM_CLIENT_ID", "test")
+os.environ.setdefault("BASALAM_CLIENT_SECRET", "test")
+os.environ["JOB_JOURNAL_PATH"] = ""
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
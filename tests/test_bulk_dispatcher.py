@@ -0,0 +1,51 @@
+import asyncio
+
+import httpx
+
+import main
+
+def run_description_job(monkeypatch, handler, products=20):
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "circuit_breakers", {})
+    main.shelf_cache.invalidate(("token", 77))
+
+    async def scenario():
+        job = main.BulkJob("descriptions", 77, "token", {"description": "new"})
+        await job.run()
+        return job
+
+    return asyncio.run(asyncio.wait_for(scenario(), timeout=20))
+
+def test_job_waits_out_an_open_breaker_and_completes(monkeypatch):
+    monkeypatch.setattr(main, "BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(main, "BREAKER_COOLDOWN", 0.5)
+    monkeypatch.setattr(main, "UPSTREAM_BACKOFF_BASE", 0.01)
+    patches = []
+
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(200, json={"data": [{"id": i, "description": "old"} for i in range(1, 21)]})
+        patches.append(request)
+        # Basalam is down until the breaker has opened, then recovers
+        breaker = next(iter(main.circuit_breakers.values()))
+        return httpx.Response(503 if breaker.opened_count == 0 else 200, json={})
+
+    job = run_description_job(monkeypatch, handler)
+
+    assert job.status == "completed"
+    assert job.failed == 0
+    assert job.result["updated_count"] == 20
+    assert next(iter(main.circuit_breakers.values())).opened_count == 1
+
+def test_breaker_wait_is_bounded(monkeypatch):
+    monkeypatch.setattr(main, "BULK_BREAKER_MAX_WAIT", 1.5)
+
+    async def unavailable(item):
+        raise main.UpstreamUnavailable("basalam", 1)
+
+    async def scenario():
+        dispatcher = main.BulkDispatcher(max_concurrency=2)
+        return [outcome async for _, outcome, _ in dispatcher.stream([1, 2], unavailable)]
+
+    outcomes = asyncio.run(asyncio.wait_for(scenario(), timeout=10))
+    assert all(isinstance(outcome, main.UpstreamUnavailable) for outcome in outcomes)
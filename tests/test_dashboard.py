@@ -0,0 +1,63 @@
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+
+def test_one_malformed_shelf_does_not_fail_the_dashboard(monkeypatch):
+    async def profile(token):
+        return {"id": 1, "name": "Seller"}
+
+    async def shelves(token):
+        return [{"id": 1, "title": "Good"}, {"id": 2, "title": "Broken"}]
+
+    async def preview(token, shelf_id, size):
+        if shelf_id == 2:
+            raise ValueError("Expecting value: line 1 column 1 (char 0)")
+        return 1, [{"id": 10, "title": "Rug"}]
+
+    monkeypatch.setattr(main, "get_user_profile", profile)
+    monkeypatch.setattr(main, "fetch_vendor_shelves", shelves)
+    monkeypatch.setattr(main, "fetch_shelf_preview", preview)
+    main.session_store.set("dashboard-session", {"access_token": "token"}, 60)
+
+    client = TestClient(main.app, cookies={main.SESSION_COOKIE_NAME: "dashboard-session"})
+    response = client.get("/api/dashboard")
+
+    assert response.status_code == 200
+    good, broken = response.json()["shelves"]
+    assert good["product_count"] == 1 and good["products"][0]["id"] == 10
+    assert broken["products"] == [] and "Expecting value" in broken["error"]
+
+def test_second_dashboard_load_is_served_from_the_cache(monkeypatch):
+    sizes = {1: 50, 2: 250, 3: 1200}
+    product_calls = []
+
+    def handler(request):
+        shelf_id = int(request.url.path.split("/")[3])
+        product_calls.append(request.url)
+        page = int(request.url.params.get(main.SHELF_PAGE_PARAM, "1"))
+        per_page = int(request.url.params.get(main.SHELF_PAGE_SIZE_PARAM, "100"))
+        ids = range((page - 1) * per_page + 1, min(page * per_page, sizes[shelf_id]) + 1)
+        return httpx.Response(200, json={"data": [{"id": shelf_id * 10000 + i} for i in ids], "total_count": sizes[shelf_id]})
+
+    async def profile(token):
+        return {"id": 1}
+
+    async def shelves(token):
+        return [{"id": shelf_id} for shelf_id in sizes]
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "shelf_cache", main.ShelfProductCache(60, 256))
+    monkeypatch.setattr(main, "get_user_profile", profile)
+    monkeypatch.setattr(main, "fetch_vendor_shelves", shelves)
+    main.session_store.set("cache-session", {"access_token": "cache-token"}, 60)
+    client = TestClient(main.app, cookies={main.SESSION_COOKIE_NAME: "cache-session"})
+
+    first = client.get("/api/dashboard").json()
+    assert product_calls
+    product_calls.clear()
+    second = client.get("/api/dashboard").json()
+
+    assert product_calls == []
+    assert second == first
+    assert [shelf["product_count"] for shelf in second["shelves"]] == [50, 250, 1200]
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import main
+
+PRODUCT = {"id": 7, "title": "Rug", "price": 120000, "category": {"title": "Home"}, "description": "old"}
+
+def render(source, product=PRODUCT):
+    return asyncio.run(main.render_description(main.DescriptionTemplate(source), product))
+
+def test_product_fields_render():
+    assert render("{{ title }} - {{ price }} ({{ category.title }}){{ missing }}") == "Rug - 120000 (Home)"
+    assert render("#{{ product.id }}") == "#7"
+
+def test_literal_description_skips_the_engine():
+    template = main.DescriptionTemplate("Plain text")
+    assert template.is_literal
+    assert render("Plain text") == "Plain text"
+
+def test_hash_after_brace_is_literal_text():
+    # Color codes such as {#FF0000} used to be parsed as an unclosed Jinja comment and rejected
+    template = main.compile_description("Color {#FF0000}")
+    assert template.is_literal
+    assert render("Color {#FF0000}") == "Color {#FF0000}"
+
+def test_sandbox_blocks_python_internals():
+    assert isinstance(render("{{ title.__class__.__mro__ }}"), RuntimeError)
+
+@pytest.mark.parametrize("source", [
+    "{{ 'x' * 200000000 }}",
+    "{{ [1] * 200000000 }}",
+    "{{ 'x' * 9000 + 'x' * 9000 }}",
+    "{{ ('x' * 9000) ~ ('x' * 9000) }}",
+    "{% set ns = namespace(x='ab') %}{% for i in range(40) %}{% set ns.x = ns.x ~ ns.x %}{% endfor %}",
+    "{{ 'x' * 5000 | replace('x', 'yy') }}",
+    "{{ title.ljust(200000000) }}",
+    "{{ title | center(200000000) }}",
+    "{{ '%0200000000d' | format(1) }}",
+    "{{ '{:>200000000}'.format(1) }}",
+    "{{ 9 ** 99999999 }}",
+    "{{ range(200000000) | length }}",
+    "{% for i in range(10000) %}{{ title }}{% endfor %}",
+])
+def test_memory_hungry_templates_fail_fast(source):
+    started = time.perf_counter()
+    error = render(source)
+    assert isinstance(error, RuntimeError)
+    assert time.perf_counter() - started < 1
+
+def test_nested_loops_stop_at_the_render_timeout(monkeypatch):
+    monkeypatch.setattr(main, "DESCRIPTION_RENDER_TIMEOUT", 0.2)
+    started = time.perf_counter()
+    error = render("{% for a in range(10000) %}{% for b in range(10000) %}{% endfor %}{% endfor %}")
+    assert "longer than 0.2s" in str(error)
+    assert time.perf_counter() - started < 1
+
+def test_slow_render_does_not_block_the_event_loop(monkeypatch):
+    monkeypatch.setattr(main, "DESCRIPTION_RENDER_TIMEOUT", 0.3)
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        template = main.DescriptionTemplate("{% for a in range(10000) %}{% for b in range(10000) %}{% endfor %}{% endfor %}")
+        await main.render_description(template, PRODUCT)
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) >= 10
+
+def test_oversized_or_broken_template_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        main.compile_description("{{ title }}" + " " * main.DESCRIPTION_TEMPLATE_MAX_LENGTH)
+    assert error.value.status_code == 400
+    with pytest.raises(HTTPException):
+        main.compile_description("{{ title ")
+    # Long literal descriptions are not templates and are not limited here
+    assert main.compile_description("x" * (main.DESCRIPTION_TEMPLATE_MAX_LENGTH + 1)).is_literal
+
+@pytest.mark.parametrize("source", [
+    "{{ '%0200000000d' % 1 }}",
+    "{{ '%.200000000f' | format(1) }}",
+])
+def test_format_widths_are_capped(source):
+    assert isinstance(render(source), RuntimeError)
+
+def test_ordinary_numbers_and_formats_still_render():
+    assert render("{{ title | default('Call 09121234567') }} {{ '%05d' | format(42) }} {{ '{:>6}'.format(price) }}") \
+        == "Rug 00042 120000"
+    assert render("{{ 'Price: %d' % price }} {{ (price * 1.09) | round | int }}") == "Price: 120000 130800"
+
+def test_width_arguments_are_capped():
+    assert isinstance(render("{{ '%*d' % (200000000, 1) }}"), RuntimeError)
+    assert isinstance(render("{{ title | indent(200000000, true) }}"), RuntimeError)
+    assert isinstance(render("{{ '{:{}}'.format(1, 200000000) }}"), RuntimeError)
@@ -0,0 +1,32 @@
+import asyncio
+from collections import deque
+
+import httpx
+
+import main
+
+def test_plan_counts_revalidated_pages_and_keeps_small_projections(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json={"data": [{"id": 1, "description": "old"}]}, headers={"ETag": '"v1"'})
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "upstream_recent_latency", {"update": deque([0.02])})
+    main.shelf_cache.invalidate(("token", 41))
+
+    async def plan():
+        return await main.plan_bulk_update("descriptions", "token", [41], {"description": "new"})
+
+    first = asyncio.run(plan())
+    second = asyncio.run(plan())
+
+    assert len(requests) == 2
+    assert first["upstream_requests"]["product_pages"] == 1
+    # The second plan revalidated the cached shelf with a conditional GET answered 304
+    assert second["upstream_requests"]["product_pages"] == 1
+    assert second["upstream_requests"]["total"] == 2
+    assert second["projected_seconds"] >= 0.02
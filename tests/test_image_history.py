@@ -0,0 +1,23 @@
+import main
+
+PHOTO = {"id": 900, "medium": "https://cdn/900.jpg"}
+
+def history(path):
+    return main.ImageUploadHistory(main.SQLiteSessionStore(str(path), "image_upload_history"), 3600, 100)
+
+def test_history_is_shared_between_processes_and_restarts(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    history(path).record(1, "hash", main.photo_fingerprint(PHOTO))
+    # A second store on the same file stands in for another worker, or this one after a restart
+    assert history(path).has_image({"id": 1, "photo": PHOTO}, "hash")
+    assert not history(path).has_image({"id": 1, "photo": PHOTO}, "other-hash")
+
+def test_changed_or_unknown_photo_is_not_skipped(tmp_path):
+    images = history(tmp_path / "jobs.sqlite3")
+    images.record(1, "hash", main.photo_fingerprint(PHOTO))
+    assert not images.has_image({"id": 1, "photo": {"id": 901}}, "hash")
+    assert not images.has_image({"id": 1}, "hash")
+
+    # Basalam did not say which photo it made: nothing to match, and an older record is dropped
+    images.record(1, "hash", None)
+    assert not images.has_image({"id": 1, "photo": PHOTO}, "hash")
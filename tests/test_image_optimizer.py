@@ -0,0 +1,39 @@
+import asyncio
+
+import main
+
+def test_cancelled_job_does_not_fail_others_waiting_for_the_same_image(tmp_path, monkeypatch):
+    source_path = tmp_path / "upload.jpg"
+    source_path.write_bytes(b"x" * 1000)
+    optimized_path = tmp_path / "optimized.jpg"
+    optimized_path.write_bytes(b"y" * 100)
+    monkeypatch.setattr(main, "IMAGE_SPOOL_DIR", str(tmp_path))
+
+    optimizer = main.ImageOptimizer()
+    optimizer.enabled = True
+    calls = []
+
+    async def process(source, key):
+        calls.append(key)
+        await asyncio.sleep(0.1)
+        return {"path": str(optimized_path), "size": 100, "sha256": "optimized", "dimensions": [10, 10]}
+
+    monkeypatch.setattr(optimizer, "_process", process)
+
+    async def scenario():
+        first = asyncio.create_task(optimizer.optimize(main.ImageSource(str(source_path), 1000, "same", "a.jpg", "image/jpeg")))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(optimizer.optimize(main.ImageSource(str(source_path), 1000, "same", "b.jpg", "image/jpeg")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        image, report = await second
+        return first, image, report
+
+    first, image, report = asyncio.run(scenario())
+    assert first.cancelled()
+    assert calls == [optimizer._cache_key("same")]
+    assert report["optimized_bytes"] == 100 and report["cached"]
+    assert image.size == 100
+    # The finished work was cached for later jobs too
+    assert optimizer._cache[optimizer._cache_key("same")]["sha256"] == "optimized"
+    image.cleanup()
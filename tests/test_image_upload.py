@@ -0,0 +1,50 @@
+import asyncio
+
+import httpx
+
+import main
+
+def apply_all(tmp_path, monkeypatch, answer, product_ids):
+    image = tmp_path / "image.jpg"
+    image.write_bytes(b"\xff\xd8" + b"x" * 5000)
+    source = main.ImageSource(str(image), image.stat().st_size, "hash", "image.jpg", "image/jpeg")
+    patches = []
+
+    def handler(request):
+        if request.url.path == "/v3/files":
+            return httpx.Response(201, json={"id": 55})
+        product_id = int(request.url.path.rsplit("/", 1)[1])
+        patches.append((product_id, len(request.read())))
+        return httpx.Response(answer(product_id, len(patches)), json={})
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "circuit_breakers", {})
+    monkeypatch.setitem(main.image_format_memory, "accepted", None)
+    upload = main.BulkImageUpload("token", source)
+
+    async def scenario():
+        return [(await upload.apply({"id": product_id})).status_code for product_id in product_ids]
+
+    return asyncio.run(scenario()), patches, upload
+
+def test_missing_product_is_not_resent_in_other_formats(tmp_path, monkeypatch):
+    statuses, patches, upload = apply_all(
+        tmp_path, monkeypatch, lambda product_id, _: 404 if product_id == 2 else 200, [1, 2, 3]
+    )
+    assert statuses == [200, 404, 200]
+    assert [product_id for product_id, _ in patches] == [1, 2, 3]
+    assert upload.accepted_format == "file_id"
+
+def test_product_error_before_any_format_is_accepted_is_returned_as_is(tmp_path, monkeypatch):
+    statuses, patches, _ = apply_all(tmp_path, monkeypatch, lambda product_id, _: 403, [1])
+    assert statuses == [403]
+    assert len(patches) == 1
+
+def test_rejected_format_falls_back_until_one_is_accepted(tmp_path, monkeypatch):
+    # The file_id reference is refused; the inline base64 payload is accepted and kept
+    statuses, patches, upload = apply_all(
+        tmp_path, monkeypatch, lambda product_id, count: 422 if count == 1 else 200, [1, 2]
+    )
+    assert statuses == [200, 200]
+    assert [product_id for product_id, _ in patches] == [1, 1, 2]
+    assert upload.accepted_format == "image_json"
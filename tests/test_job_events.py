@@ -0,0 +1,40 @@
+import asyncio
+
+import main
+
+async def read_events(job, timeout=5):
+    events = []
+
+    async def consume():
+        async for chunk in main.stream_job_events(job):
+            events.append(chunk.split("\n", 1)[0][len("event: "):])
+
+    await asyncio.wait_for(consume(), timeout)
+    return events
+
+def test_cancelling_a_queued_job_ends_its_event_stream():
+    async def scenario():
+        job = main.BulkJob("descriptions", 1, "token", {"description": "x"})
+        reader = asyncio.create_task(read_events(job))
+        await asyncio.sleep(0.05)
+        job.cancel()
+        return job, await reader
+
+    job, events = asyncio.run(scenario())
+    assert job.status == "cancelled"
+    assert events[0] == "summary"
+    assert events[-1] == "done"
+
+def test_finished_job_without_done_event_ends_on_next_summary(monkeypatch):
+    monkeypatch.setattr(main, "JOB_EVENT_SUMMARY_INTERVAL", 0.05)
+
+    async def scenario():
+        job = main.BulkJob("descriptions", 1, "token", {"description": "x"})
+        reader = asyncio.create_task(read_events(job))
+        await asyncio.sleep(0.02)
+        # Finished without publishing, like a job finished by another code path
+        job.status = "failed"
+        job.finished_at = main.time.time()
+        return await reader
+
+    assert asyncio.run(scenario())[-1] == "done"
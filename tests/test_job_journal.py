@@ -0,0 +1,33 @@
+import os
+import stat
+import subprocess
+import sys
+
+import main
+
+def test_journal_files_are_private(tmp_path):
+    path = tmp_path / "data" / "jobs.sqlite3"
+    journal = main.JobJournal(str(path))
+    journal.record("job", 1, "updated")
+    for name in os.listdir(path.parent):
+        assert stat.S_IMODE(os.stat(path.parent / name).st_mode) == 0o600, name
+
+def test_existing_journal_is_made_private(tmp_path):
+    path = tmp_path / "jobs.sqlite3"
+    path.touch(mode=0o644)
+    os.chmod(path, 0o644)
+    main.JobJournal(str(path))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+def test_journal_is_off_unless_configured():
+    # Read-only deploys import main without JOB_JOURNAL_PATH; nothing may be created on disk
+    env = {name: value for name, value in os.environ.items() if name != "JOB_JOURNAL_PATH"}
+    env["SESSION_BACKEND"] = "memory"
+    root = os.path.dirname(main.__file__)
+    before = set(os.listdir(root))
+    result = subprocess.run(
+        [sys.executable, "-c", "import main; print(main.job_journal, type(main.image_upload_history.store).__name__)"],
+        cwd=root, env=env, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.split() == ["None", "MemorySessionStore"]
+    assert set(os.listdir(root)) - before <= {"__pycache__"}
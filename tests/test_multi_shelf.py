@@ -0,0 +1,55 @@
+import asyncio
+
+import main
+
+class FakePager:
+    """Stands in for ShelfProductPager: yields the given products, or raises the given error"""
+
+    shelves = {}
+
+    def __init__(self, token, shelf_id, revalidate=False):
+        self.items = self.shelves[shelf_id]
+        self.pages_fetched = 0
+        self.page_requests = 0
+        self.total = None
+
+    async def _iterate(self):
+        self.pages_fetched += 1
+        self.page_requests += 1
+        for item in self.items:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def aclose(self):
+        pass
+
+def collect(monkeypatch, shelves):
+    monkeypatch.setattr(main, "ShelfProductPager", FakePager)
+    monkeypatch.setattr(FakePager, "shelves", shelves)
+    pager = main.MultiShelfProducts("token", list(shelves))
+
+    async def run():
+        return [product async for product in pager]
+
+    return asyncio.run(asyncio.wait_for(run(), timeout=5)), pager
+
+def test_products_shared_by_shelves_are_yielded_once(monkeypatch):
+    products, pager = collect(monkeypatch, {1: [{"id": 1}, {"id": 2}], 2: [{"id": 2}, {"id": 3}]})
+    assert sorted(product["id"] for product in products) == [1, 2, 3]
+    assert pager.duplicates == 1
+    assert pager.total == 3
+
+def test_malformed_shelf_is_reported_without_hanging(monkeypatch):
+    products, pager = collect(monkeypatch, {1: [{"id": 1}], 2: [{"id": 5}, ValueError("bad page")]})
+    assert sorted(product["id"] for product in products) == [1, 5]
+    assert pager.shelf_errors == {2: "bad page"}
+
+def test_every_shelf_failing_still_ends_the_stream(monkeypatch):
+    products, pager = collect(monkeypatch, {1: [KeyError("id")], 2: [RuntimeError()]})
+    assert products == []
+    assert set(pager.shelf_errors) == {1, 2}
+    assert pager.shelf_errors[2] == "RuntimeError"
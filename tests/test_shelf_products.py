@@ -0,0 +1,49 @@
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+
+def shelf_client(monkeypatch, size, paged=True):
+    pages = []
+
+    def handler(request):
+        page = int(request.url.params.get(main.SHELF_PAGE_PARAM, "1")) if paged else 1
+        per_page = int(request.url.params.get(main.SHELF_PAGE_SIZE_PARAM, "100")) if paged else size
+        pages.append(page)
+        ids = range((page - 1) * per_page + 1, min(page * per_page, size) + 1)
+        return httpx.Response(200, json={"data": [{"id": i} for i in ids], "total_count": size})
+
+    monkeypatch.setattr(main, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(main, "shelf_cache", main.ShelfProductCache(60, 256))
+    main.session_store.set("shelf-session", {"access_token": "shelf-token"}, 60)
+    return TestClient(main.app, cookies={main.SESSION_COOKIE_NAME: "shelf-session"}), pages
+
+def test_offset_starts_at_the_page_that_holds_it(monkeypatch):
+    client, pages = shelf_client(monkeypatch, 1000)
+    response = client.get("/api/shelves/7/products", params={"offset": 450, "limit": 100, "fields": "id"})
+
+    assert [product["id"] for product in response.json()] == list(range(451, 551))
+    # Pages 1-4 are skipped; later ones may be prefetched
+    assert pages[:2] == [5, 6] and min(pages) == 5
+
+def test_offset_past_the_end_is_empty(monkeypatch):
+    client, pages = shelf_client(monkeypatch, 120)
+    response = client.get("/api/shelves/7/products", params={"offset": 300, "fields": "id"})
+
+    assert response.json() == []
+    assert pages == [4]
+
+def test_offset_on_an_upstream_that_ignores_paging(monkeypatch):
+    client, pages = shelf_client(monkeypatch, 250, paged=False)
+    response = client.get("/api/shelves/7/products", params={"offset": 120, "limit": 5, "fields": "id"})
+
+    assert [product["id"] for product in response.json()] == [121, 122, 123, 124, 125]
+
+def test_offset_is_served_from_a_cached_shelf(monkeypatch):
+    client, pages = shelf_client(monkeypatch, 250)
+    client.get("/api/shelves/7/products")
+    pages.clear()
+    response = client.get("/api/shelves/7/products", params={"offset": 230, "fields": "id"})
+
+    assert [product["id"] for product in response.json()] == list(range(231, 251))
+    assert pages == []